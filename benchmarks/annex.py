@@ -0,0 +1,88 @@
+"""A stand-in for git-annex in the special remote protocol
+
+`RemakeRemote` communicates with git-annex through an `annexremote.Master`,
+which relays every request over the special remote protocol. `LocalAnnex`
+provides the methods of `Master` that `RemakeRemote` uses and answers them
+from a snapshot of the repository, which is taken when the `LocalAnnex` is
+created. The remote can then be driven directly, e.g. to benchmark
+retrievals without git-annex in the loop.
+"""
+
+from __future__ import annotations
+
+import gc
+import json
+import tracemalloc
+from typing import (
+    TYPE_CHECKING,
+    cast,
+)
+
+from datalad_next.runners import call_git_lines
+
+from datalad_remake.annexremotes.remake_remote import RemakeRemote
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+    from pathlib import Path
+
+    from annexremote import Master
+
+
+class LocalAnnex:
+    """Answer the requests of a special remote for the repository `repo_path`
+
+    `config` contains the configuration of the special remote, e.g.
+    `allow_untrusted_execution`. The URLs of all keys are read once, URLs
+    that are added later are unknown.
+    """
+
+    def __init__(self, repo_path: Path, config: dict[str, str] | None = None):
+        self.repo_path = repo_path
+        self.config = config or {}
+        self.debug_messages = 0
+        self.urls: dict[str, list[str]] = {}
+        for line in call_git_lines(
+            ['annex', 'whereis', '--json', '--all'], cwd=repo_path
+        ):
+            record = json.loads(line)
+            self.urls[record['key']] = [
+                url for remote in record['whereis'] for url in remote['urls']
+            ]
+
+    def create_remote(self) -> RemakeRemote:
+        """Create a prepared datalad-remake special remote for this annex"""
+        remote = RemakeRemote(cast('Master', self))
+        remote.prepare()
+        return remote
+
+    def debug(self, *_: str) -> None:
+        # Messages are only counted, formatting them is part of the cost of
+        # the remote.
+        self.debug_messages += 1
+
+    def getconfig(self, name: str) -> str:
+        return self.config.get(name, '')
+
+    def getgitdir(self) -> str:
+        return str(self.repo_path / '.git')
+
+    def getgitremotename(self) -> str:
+        return 'remake'
+
+    def geturls(self, key: str, prefix: str) -> list[str]:
+        return [url for url in self.urls.get(key, []) if url.startswith(prefix)]
+
+
+def measure_memory_growth(function: Callable[[], object]) -> int:
+    """Get the size of the Python objects that `function` leaves behind"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        function()
+        gc.collect()
+        after, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return after - before
@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import pytest
+
+from datalad_remake.annexremotes.tests.test_remake_remote import create_keypair
+
+from .datasets import create_synthetic_dataset
+
+if TYPE_CHECKING:
+    from collections.abc import (
+        Callable,
+        Generator,
+    )
+
+    from datalad_next.datasets import Dataset
+
+
+@pytest.fixture(scope='module')
+def dataset_factory(tmp_path_factory) -> Callable[..., Dataset]:
+    """Create synthetic datasets, datasets of the same shape are reused
+
+    The keyword arguments are passed to `create_synthetic_dataset`. Datasets
+    are shared by all benchmarks of a module.
+    """
+    datasets: dict[tuple, Dataset] = {}
+
+    def get_dataset(**shape) -> Dataset:
+        key = tuple(sorted(shape.items()))
+        if key not in datasets:
+            datasets[key] = create_synthetic_dataset(
+                tmp_path_factory.mktemp('ds') / 'ds', **shape
+            )
+        return datasets[key]
+
+    return get_dataset
+
+
+@pytest.fixture(scope='module')
+def signing_key(tmp_path_factory) -> Generator[str]:
+    """Create a signing key in a temporary keystore and activate it"""
+    tmp_path = tmp_path_factory.mktemp('gpg')
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        # make sure that the users keystore is not overwritten
+        monkeypatch.setenv('HOME', str(tmp_path / 'home'))
+        key = create_keypair(gpg_dir=tmp_path / 'gpg')
+        monkeypatch.setenv('GNUPGHOME', str(tmp_path / 'gpg'))
+        yield key
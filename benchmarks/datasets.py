@@ -0,0 +1,111 @@
+"""Generators for synthetic datasets of configurable size
+
+The datasets of the tests in `commands/tests` are tiny. The generators in
+this module create dataset hierarchies with a configurable number of files,
+subdataset depth, and subdataset breadth, and a method template that writes
+a configurable number of outputs.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from datalad_next.datasets import Dataset
+
+from datalad_remake import template_dir
+from datalad_remake.commands.tests.create_datasets import (
+    add_remake_remote,
+    update_config_for_remake,
+)
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+# Writes `count` outputs `out-<n>.txt`, `prefix` makes the output content,
+# and therefore the computation, unique.
+fanout_method = """
+parameters = ['count', 'prefix']
+use_shell = 'true'
+command = ["for n in $(seq 1 {count}); do echo {prefix} $n > out-$n.txt; done"]
+"""
+
+# Writes a single output `file`
+single_method = """
+parameters = ['file', 'content']
+use_shell = 'true'
+command = ["echo {content} > {file}"]
+"""
+
+files_per_directory = 100
+
+
+def create_synthetic_dataset(
+    path: Path,
+    *,
+    files: int,
+    depth: int = 0,
+    breadth: int = 1,
+    signing_key: str | None = None,
+) -> Dataset:
+    """Create a dataset hierarchy with `files` annexed files in every dataset
+
+    Every dataset above `depth` has `breadth` subdatasets `sub<i>`. Files
+    are named `dir<j>/file<k>.txt`, with at most `files_per_directory` files
+    per directory. The root dataset contains the method templates `fanout`
+    and `single`, see `fanout_method` and `single_method`, and the
+    datalad-remake special remote is initialized in all datasets.
+
+    If `signing_key` is given, all commits are signed with it.
+    """
+    root_dataset = Dataset(path)
+    root_dataset.create(result_renderer='disabled')
+    datasets = [root_dataset]
+    _populate(root_dataset, files, signing_key)
+
+    parents = [root_dataset]
+    for _ in range(depth):
+        children = []
+        for parent in parents:
+            for index in range(breadth):
+                subdataset = parent.create(f'sub{index}', result_renderer='disabled')
+                _populate(subdataset, files, signing_key)
+                children.append(subdataset)
+        datasets.extend(children)
+        parents = children
+
+    template_path = root_dataset.pathobj / template_dir
+    template_path.mkdir(parents=True, exist_ok=True)
+    (template_path / 'fanout').write_text(fanout_method)
+    (template_path / 'single').write_text(single_method)
+    root_dataset.save(recursive=True, result_renderer='disabled')
+
+    update_config_for_remake(root_dataset)
+    for dataset in datasets:
+        add_remake_remote(dataset, signing_key)
+    return root_dataset
+
+
+def create_signed_history(dataset: Dataset, commits: int) -> list[str]:
+    """Add `commits` signed commits that each change one new file
+
+    Signing has to be enabled in `dataset`. Returns the names of the added
+    files, oldest first, i.e. verifying the first file requires to walk the
+    complete added history.
+    """
+    names = []
+    for index in range(commits):
+        name = f'history{index}.txt'
+        (dataset.pathobj / name).write_text(f'{index}\n')
+        dataset.save(name, result_renderer='disabled')
+        names.append(name)
+    return names
+
+
+def _populate(dataset: Dataset, files: int, signing_key: str | None) -> None:
+    if signing_key is not None:
+        dataset.config.set('commit.gpgsign', 'true', scope='local')
+        dataset.config.set('user.signingkey', signing_key, scope='local')
+    for index in range(files):
+        directory = dataset.pathobj / f'dir{index // files_per_directory}'
+        directory.mkdir(exist_ok=True)
+        (directory / f'file{index}.txt').write_text(f'{dataset.path} {index}\n')
@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import threading
+import time
+from itertools import count
+
+import pytest
+
+from datalad_remake.utils.jobsocket import (
+    stop,
+    submit,
+)
+
+output_counts = [1, 100]
+
+
+def _make(dataset, outputs: int, prefix: str, **kwargs) -> None:
+    dataset.make(
+        template='fanout',
+        parameter=[f'count={outputs}', f'prefix={prefix}'],
+        output=[f'out-{n}.txt' for n in range(1, outputs + 1)],
+        result_renderer='disabled',
+        **kwargs,
+    )
+
+
+def _unique_prefixes():
+    # A new prefix for every round prevents memoized results
+    rounds = count()
+    return lambda: ((), {'prefix': f'round{next(rounds)}'})
+
+
+@pytest.mark.parametrize('outputs', output_counts)
+def test_make(benchmark, dataset_factory, outputs):
+    dataset = dataset_factory(files=10)
+    benchmark.pedantic(
+        lambda prefix: _make(dataset, outputs, prefix, allow_untrusted_code=True),
+        setup=_unique_prefixes(),
+        rounds=3,
+    )
+
+
+@pytest.mark.parametrize('outputs', output_counts)
+def test_make_memoized(benchmark, dataset_factory, outputs):
+    dataset = dataset_factory(files=10)
+
+    def remove_outputs():
+        # Present outputs with a matching provenance are not computed at all,
+        # removing them makes every round look up the memo index.
+        for n in range(1, outputs + 1):
+            (dataset.pathobj / f'out-{n}.txt').unlink(missing_ok=True)
+
+    # The warmup round performs the computation, all other rounds reuse it
+    benchmark.pedantic(
+        lambda: _make(dataset, outputs, 'memoized', allow_untrusted_code=True),
+        setup=remove_outputs,
+        rounds=3,
+        warmup_rounds=1,
+    )
+
+
+@pytest.mark.parametrize('outputs', output_counts)
+def test_make_url_only(benchmark, dataset_factory, outputs):
+    dataset = dataset_factory(files=10)
+    benchmark.pedantic(
+        lambda prefix: _make(dataset, outputs, prefix, url_only=True),
+        setup=_unique_prefixes(),
+        rounds=3,
+    )
+
+
+@pytest.fixture(scope='module')
+def make_server(dataset_factory, tmp_path_factory):
+    """Run `datalad make --serve` for the benchmarks of this module"""
+    dataset = dataset_factory(files=10)
+    socket_path = tmp_path_factory.mktemp('server') / 'make.sock'
+    server = threading.Thread(
+        target=lambda: dataset.make(
+            template='fanout',
+            serve=True,
+            socket=socket_path,
+            allow_untrusted_code=True,
+            result_renderer='disabled',
+        )
+    )
+    server.start()
+    while not socket_path.exists():
+        time.sleep(0.1)
+    yield socket_path
+    stop(socket_path)
+    server.join()
+
+
+@pytest.mark.parametrize('outputs', output_counts)
+def test_submit(benchmark, make_server, outputs):
+    def submit_job(prefix: str) -> None:
+        job = {
+            'parameter': {'count': str(outputs), 'prefix': prefix},
+            'output': [f'out-{n}.txt' for n in range(1, outputs + 1)],
+        }
+        results = list(submit(make_server, [job]))
+        assert all(result['status'] == 'ok' for result in results)
+
+    benchmark.pedantic(submit_job, setup=_unique_prefixes(), rounds=3)
@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+import pytest
+
+from datalad_remake.commands.make_cmd import (
+    provide,
+    un_provide,
+)
+
+shapes = [
+    pytest.param({'files': 10}, id='flat-10'),
+    pytest.param({'files': 1000}, id='flat-1000'),
+    pytest.param({'files': 10, 'depth': 2, 'breadth': 2}, id='nested-2x2'),
+    pytest.param({'files': 10, 'depth': 1, 'breadth': 8}, id='wide-8'),
+]
+
+input_sets = [
+    pytest.param(['dir0/file0.txt'], id='one-input'),
+    pytest.param(['**/dir*/*.txt'], id='all-inputs'),
+]
+
+
+@pytest.mark.parametrize('shape', shapes)
+@pytest.mark.parametrize('inputs', input_sets)
+@pytest.mark.parametrize('sparse', [False, True], ids=['full', 'sparse'])
+def test_provision(benchmark, dataset_factory, shape, inputs, sparse):
+    dataset = dataset_factory(**shape)
+    worktrees = []
+
+    def remove_worktrees():
+        while worktrees:
+            un_provide(dataset, worktrees.pop())
+
+    def provision():
+        worktrees.append(provide(dataset, None, inputs, sparse=sparse))
+
+    benchmark.pedantic(provision, setup=remove_worktrees, rounds=3)
+    remove_worktrees()
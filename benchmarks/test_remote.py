@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+from itertools import count
+
+import pytest
+
+from datalad_remake import url_scheme
+from datalad_remake.commands.make_cmd import run_jobs
+from datalad_remake.utils.annexbatch import lookup_keys
+
+from .annex import (
+    LocalAnnex,
+    measure_memory_growth,
+)
+
+
+def _register_outputs(dataset, outputs: list[str], jobs: list[dict]) -> list[str]:
+    list(run_jobs(dataset, jobs, url_only=True, trusted_key_ids=None))
+    keys = lookup_keys(dataset.pathobj, [dataset.pathobj / o for o in outputs])
+    return [key for key in keys.values() if key is not None]
+
+
+@pytest.fixture(scope='module')
+def key_factory(dataset_factory):
+    """Register outputs of new computations and return their keys
+
+    `computations` computations with one output each are registered if
+    `fanout` is `False`, otherwise one computation with `computations`
+    outputs.
+    """
+    dataset = dataset_factory(files=10)
+    batches = count()
+
+    def get_keys(computations: int, *, fanout: bool = False) -> list[str]:
+        batch = next(batches)
+        outputs = [f'batch{batch}-{n}.txt' for n in range(1, computations + 1)]
+        if fanout:
+            jobs = [
+                {
+                    'template': 'fanout',
+                    'branch': None,
+                    'input': [],
+                    'output': [f'out-{n}.txt' for n in range(1, computations + 1)],
+                    'parameter': {'count': str(computations), 'prefix': str(batch)},
+                }
+            ]
+            outputs = jobs[0]['output']
+        else:
+            jobs = [
+                {
+                    'template': 'single',
+                    'branch': None,
+                    'input': [],
+                    'output': [output],
+                    'parameter': {'file': output, 'content': output},
+                }
+                for output in outputs
+            ]
+        return _register_outputs(dataset, outputs, jobs)
+
+    return dataset, get_keys
+
+
+def _record_throughput(benchmark, operations: int, memory_growth: int) -> None:
+    mean = benchmark.stats.stats.mean
+    benchmark.extra_info['operations_per_second'] = operations / mean
+    benchmark.extra_info['seconds_per_operation'] = mean / operations
+    benchmark.extra_info['memory_growth_bytes'] = memory_growth
+    benchmark.extra_info['memory_growth_bytes_per_operation'] = (
+        memory_growth / operations
+    )
+
+
+@pytest.mark.parametrize('keys', [10, 100])
+def test_retrieve(benchmark, tmp_path, key_factory, keys):
+    dataset, get_keys = key_factory
+    key_list = get_keys(keys)
+    assert len(key_list) == keys
+
+    annex = LocalAnnex(dataset.pathobj, {'allow_untrusted_execution': 'true'})
+    remote = annex.create_remote()
+    destination = tmp_path / 'retrieved'
+
+    def retrieve_all():
+        for key in key_list:
+            remote.transfer_retrieve(key, str(destination))
+
+    try:
+        # The retrieved content is not added to the annex, i.e. every round
+        # computes all keys again.
+        benchmark.pedantic(retrieve_all, rounds=3)
+        memory_growth = measure_memory_growth(retrieve_all)
+    finally:
+        remote.close()
+    _record_throughput(benchmark, keys, memory_growth)
+
+
+@pytest.mark.parametrize('keys', [1000, 5000])
+@pytest.mark.parametrize('operation', ['checkurl', 'checkpresent'])
+def test_check(benchmark, key_factory, keys, operation):
+    dataset, get_keys = key_factory
+    key_list = get_keys(keys, fanout=True)
+    assert len(key_list) == keys
+
+    annex = LocalAnnex(dataset.pathobj)
+    remote = annex.create_remote()
+    if operation == 'checkurl':
+        arguments = [annex.geturls(key, f'{url_scheme}:')[0] for key in key_list]
+        check = remote.checkurl
+    else:
+        arguments = key_list
+        check = remote.checkpresent
+
+    def check_all():
+        assert all(check(argument) for argument in arguments)
+
+    try:
+        benchmark.pedantic(check_all, rounds=5)
+        memory_growth = measure_memory_growth(check_all)
+    finally:
+        remote.close()
+    _record_throughput(benchmark, keys, memory_growth)
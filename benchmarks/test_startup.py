@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+import subprocess
+import sys
+
+# git-annex starts a remote process for every session. A session that does
+# not retrieve content, e.g. of `git annex whereis`, looks like this.
+session = """EXTENSIONS INFO ASYNC
+PREPARE
+GETCOST
+CLAIMURL datalad-remake:///?root_version=1
+"""
+
+remote_main = 'from datalad_remake.annexremotes.remake_remote import main; main()'
+
+
+def _run(code: str, stdin: str = '') -> str:
+    return subprocess.run(
+        [sys.executable, '-c', code],
+        input=stdin,
+        stdout=subprocess.PIPE,
+        check=True,
+        text=True,
+    ).stdout
+
+
+def test_interpreter(benchmark):
+    # The baseline of the remote startup
+    benchmark(_run, 'pass')
+
+
+def test_import(benchmark):
+    benchmark(_run, 'import datalad_remake.annexremotes.remake_remote')
+
+
+def test_session(benchmark):
+    output = benchmark(_run, remote_main, session)
+    replies = [line for line in output.splitlines() if not line.startswith('DEBUG ')]
+    assert replies == [
+        'VERSION 1',
+        'EXTENSIONS',
+        'PREPARE-SUCCESS',
+        'COST 100',
+        'CLAIMURL-SUCCESS',
+    ]
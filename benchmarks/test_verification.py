@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import shutil
+from itertools import count
+from pathlib import Path
+
+import pytest
+
+from datalad_remake.commands.make_cmd import run_jobs
+from datalad_remake.utils import verify
+from datalad_remake.utils.state import get_state_dir
+from datalad_remake.utils.verify import verify_file
+
+from .datasets import (
+    create_signed_history,
+    create_synthetic_dataset,
+)
+
+history_length = 50
+
+
+@pytest.fixture(scope='module')
+def signed_dataset(tmp_path_factory, signing_key):
+    dataset = create_synthetic_dataset(
+        tmp_path_factory.mktemp('signed') / 'ds', files=10, signing_key=signing_key
+    )
+    return dataset, create_signed_history(dataset, history_length)
+
+
+def _forget_verifications(dataset) -> None:
+    verify.history_verifiers.clear()
+    shutil.rmtree(get_state_dir(dataset.pathobj) / 'verified', ignore_errors=True)
+
+
+@pytest.mark.parametrize('position', ['newest', 'oldest'])
+@pytest.mark.parametrize('cached', [False, True], ids=['cold', 'cached'])
+def test_verify_file(benchmark, signed_dataset, signing_key, position, cached):
+    dataset, names = signed_dataset
+    name = names[-1] if position == 'newest' else names[0]
+
+    def setup():
+        if not cached:
+            _forget_verifications(dataset)
+
+    benchmark.pedantic(
+        verify_file,
+        args=(dataset.pathobj, Path(name), [signing_key]),
+        setup=setup,
+        rounds=5,
+        warmup_rounds=1,
+    )
+
+
+def test_make_verified(benchmark, signed_dataset, signing_key):
+    dataset, _ = signed_dataset
+    rounds = count()
+
+    def setup():
+        _forget_verifications(dataset)
+        return (), {'prefix': f'round{next(rounds)}'}
+
+    def make(prefix: str) -> None:
+        job = {
+            'template': 'fanout',
+            'branch': None,
+            'input': [],
+            'output': ['out-1.txt'],
+            'parameter': {'count': '1', 'prefix': prefix},
+        }
+        list(run_jobs(dataset, [job], url_only=False, trusted_key_ids=[signing_key]))
+
+    benchmark.pedantic(make, setup=setup, rounds=3)
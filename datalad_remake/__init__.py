@@ -7,9 +7,15 @@ from datalad_remake._version import __version__
 __all__ = [
     '__version__',
     'command_suite',
+    'dirty_check_config_key',
+    'plan_jobs_config_key',
+    'remote_jobs_config_key',
+    'sparse_provision_config_key',
     'specification_dir',
     'template_dir',
+    'trace_file_config_key',
     'trusted_keys_config_key',
+    'worktree_pool_size_config_key',
 ]
 
 
@@ -41,6 +47,16 @@ command_suite = (
             # optional name of the command in the Python API
             'provision',
         ),
+        (
+            # importable module that contains the command implementation
+            'datalad_remake.commands.update_cmd',
+            # name of the command class implementation in above module
+            'UpdateOutputs',
+            # optional name of the command in the cmdline API
+            'update-outputs',
+            # optional name of the command in the Python API
+            'update_outputs',
+        ),
     ],
 )
 
@@ -49,3 +65,9 @@ url_scheme = 'datalad-remake'
 template_dir = '.datalad/make/methods'
 specification_dir = '.datalad/make/specifications'
 trusted_keys_config_key = 'datalad.trusted-keys'
+worktree_pool_size_config_key = 'datalad.remake.worktree-pool-size'
+sparse_provision_config_key = 'datalad.remake.sparse-provision'
+dirty_check_config_key = 'datalad.remake.dirty-check'
+trace_file_config_key = 'datalad.remake.trace-file'
+remote_jobs_config_key = 'datalad.remake.remote-jobs'
+plan_jobs_config_key = 'datalad.remake.plan-jobs'
@@ -0,0 +1,170 @@
+"""Concurrent handling of special remote requests
+
+Without protocol extensions, git-annex starts one special remote process per
+job, e.g. `git annex get -J8` starts eight processes, which each import the
+remote, find the dataset, and verify specifications on their own. With the
+`ASYNC` extension, git-annex sends the requests of all jobs to one process.
+Every message that belongs to a job is prefixed with `J <job number>`, and
+the messages of different jobs can be interleaved.
+
+`AsyncMaster` is an `annexremote.Master` that supports the extension. The
+requests of jobs are handled by a pool of at most `max_jobs` threads, the
+replies of git-annex to questions of a job, e.g. to `GETCONFIG`, are passed
+to the thread of the job. The extension is only enabled if `max_jobs` is
+greater than zero.
+"""
+
+from __future__ import annotations
+
+import logging
+import sys
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue
+from typing import (
+    TYPE_CHECKING,
+    Any,
+)
+
+from annexremote import (
+    Master,
+    Protocol,
+    UnsupportedRequest,
+)
+
+if TYPE_CHECKING:
+    from annexremote import SpecialRemote
+
+lgr = logging.getLogger('datalad.remake.annexremotes.asyncmaster')
+
+
+class JobInput:
+    """The replies of git-annex to the questions of a single job"""
+
+    def __init__(self) -> None:
+        # `None` signals that git-annex closed the connection
+        self.replies: Queue[str | None] = Queue()
+
+    def readline(self) -> str:
+        reply = self.replies.get()
+        return '' if reply is None else reply + '\n'
+
+
+class AsyncProtocol(Protocol):
+    def __init__(self, remote: SpecialRemote, master: AsyncMaster):
+        super().__init__(remote)
+        self.master = master
+
+    def do_EXTENSIONS(self, param: str) -> str:
+        self.extensions = param.split(' ')
+        if 'ASYNC' in self.extensions and self.master.max_jobs > 0:
+            self.master.enable_async()
+            return 'EXTENSIONS ASYNC'
+        return 'EXTENSIONS'
+
+    def do_J(self, param: str) -> None:
+        if not self.master.is_async:
+            raise UnsupportedRequest
+        job, message = param.split(' ', 1)
+        self.master.dispatch(job, message)
+
+
+class AsyncMaster(Master):
+    def __init__(self, output: Any = sys.stdout, max_jobs: int = 0):
+        super().__init__(output)
+        self.max_jobs = max_jobs
+        # The inputs of running jobs, indexed by job number
+        self._jobs: dict[str, JobInput] = {}
+        self._jobs_lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._local = threading.local()
+        self._executor: ThreadPoolExecutor | None = None
+        self._input: Any = None
+
+    @property
+    def is_async(self) -> bool:
+        return self._executor is not None
+
+    @property
+    def input(self) -> Any:
+        # Questions that are asked in a job read the replies of that job
+        job = getattr(self._local, 'job', None)
+        if job is None:
+            return self._input
+        return self._jobs[job]
+
+    @input.setter
+    def input(self, value: Any) -> None:
+        self._input = value
+
+    def LinkRemote(self, remote: SpecialRemote) -> None:
+        super().LinkRemote(remote)
+        self.protocol = AsyncProtocol(remote, self)
+
+    def Listen(self, input: Any = sys.stdin) -> None:
+        try:
+            super().Listen(input)
+        finally:
+            # git-annex closed the connection, questions of running jobs will
+            # not be answered anymore.
+            with self._jobs_lock:
+                for job_input in self._jobs.values():
+                    job_input.replies.put(None)
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+
+    def enable_async(self) -> None:
+        lgr.debug('enabling ASYNC with %d jobs', self.max_jobs)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_jobs)
+
+    def dispatch(self, job: str, message: str) -> None:
+        """Start job `job` with `message`, or pass `message` to running `job`"""
+        with self._jobs_lock:
+            job_input = self._jobs.get(job)
+            if job_input is None:
+                self._jobs[job] = JobInput()
+        if job_input is not None:
+            job_input.replies.put(message)
+            return
+        if self._executor is None:
+            msg = 'ASYNC is not enabled'
+            raise RuntimeError(msg)
+        self._executor.submit(self._run_job, job, message)
+
+    def _run_job(self, job: str, request: str) -> None:
+        self._local.job = job
+        try:
+            try:
+                reply = self.protocol.command(request)
+            except UnsupportedRequest:
+                reply = 'UNSUPPORTED-REQUEST'
+            except Exception as e:  # noqa: BLE001
+                # Like `Master.Listen`, report unexpected errors to git-annex,
+                # which stops the communication with this process.
+                for line in traceback.format_exc().splitlines():
+                    self.debug(line)
+                self._finish(job)
+                self.error(e)
+                return
+            # The job number can be reused by git-annex as soon as the final
+            # reply was sent, i.e. the job has to be finished before.
+            self._finish(job)
+            if reply:
+                self._send(reply)
+        finally:
+            self._local.job = None
+
+    def _finish(self, job: str) -> None:
+        with self._jobs_lock:
+            del self._jobs[job]
+
+    def _send(self, *args: Any, **kwargs: Any) -> None:
+        job = getattr(self._local, 'job', None)
+        with self._send_lock:
+            if job is None:
+                super()._send(*args, **kwargs)
+                return
+            # Replies might consist of multiple lines, e.g. `LISTCONFIGS`
+            for line in ' '.join(str(arg) for arg in args).split('\n'):
+                super()._send('J', job, line)
@@ -0,0 +1,239 @@
+"""Planning of chained computations
+
+The inputs of a computation can be outputs of other computations, whose
+content is not present. Provisioning a worktree for the computation then
+retrieves them with `datalad get`, i.e. git-annex starts another special
+remote process, which provisions another worktree, and so on. The chain is
+resolved one level at a time, and independent computations are executed one
+after the other.
+
+`plan_computations` determines all computations that a computation depends
+on, before anything is provisioned. Missing inputs are found in the tree of
+the root version of a computation, and their remake URLs name the
+computations that create them. `ComputationPlan.execute` executes the
+computations in topological order, independent computations concurrently.
+The content of required outputs is injected into the annex of the dataset,
+where the worktrees of dependent computations find it.
+
+Only inputs that are annexed in the dataset of a computation are planned.
+Inputs in subdatasets, and inputs whose computation could not be planned,
+are still retrieved through the special remote when a worktree is
+provisioned.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ThreadPoolExecutor,
+    wait,
+)
+from graphlib import TopologicalSorter
+from pathlib import Path
+from typing import (
+    TYPE_CHECKING,
+    Any,
+)
+from urllib.parse import (
+    parse_qs,
+    urlparse,
+)
+
+from datalad_next.runners import call_git_success
+
+from datalad_remake import url_scheme
+from datalad_remake.utils.annexbatch import iter_annex_batch
+from datalad_remake.utils.glob import resolve_tree_patterns
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+    from datalad_next.datasets import Dataset
+
+lgr = logging.getLogger('datalad.remake.annexremotes.planner')
+
+
+class Computation:
+    """A computation in a plan, i.e. a specification at a root version"""
+
+    def __init__(self, compute_info: dict[str, Any], dataset: Dataset):
+        self.compute_info = compute_info
+        self.dataset = dataset
+        # The outputs that dependent computations require, i.e. output path
+        # and key.
+        self.required: dict[str, str] = {}
+
+    @property
+    def name(self) -> tuple[str, str]:
+        return self.compute_info['root_version'], self.compute_info['specification']
+
+
+class ComputationPlan:
+    """The computations that a computation depends on, and their dependencies
+
+    The requested computation itself is not part of the plan.
+    """
+
+    def __init__(self) -> None:
+        self.computations: dict[tuple[str, str], Computation] = {}
+        self.dependencies: dict[tuple[str, str], set[tuple[str, str]]] = {}
+
+    def execute(
+        self,
+        run: Callable[[Computation], None],
+        max_workers: int,
+    ) -> None:
+        """Call `run` for every computation after its dependencies
+
+        Independent computations are run concurrently by `max_workers`
+        threads. If a computation fails, the computations that depend on it
+        are not run. Failures are logged, because the missing content is
+        still retrieved through the special remote when it is required.
+        """
+        sorter = TopologicalSorter(self.dependencies)
+        sorter.prepare()
+        failed: set[tuple[str, str]] = set()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            running = {}
+            while sorter.is_active():
+                for name in sorter.get_ready():
+                    if failed.intersection(self.dependencies.get(name, ())):
+                        failed.add(name)
+                        sorter.done(name)
+                        continue
+                    running[executor.submit(run, self.computations[name])] = name
+                if not running:
+                    continue
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    error = future.exception()
+                    if error is not None:
+                        lgr.debug('planned computation %s failed: %s', name, error)
+                        failed.add(name)
+                    sorter.done(name)
+
+
+def plan_computations(
+    compute_info: dict[str, Any],
+    dataset: Dataset,
+    get_url_compute_info: Callable[[str], tuple[dict[str, Any], Dataset]],
+) -> ComputationPlan:
+    """Plan the computations of the missing inputs of a computation
+
+    `get_url_compute_info` returns the computation information and the
+    dataset of a remake URL. A cycle in the dependencies raises a
+    `graphlib.CycleError`.
+    """
+    plan = ComputationPlan()
+    requested = (compute_info['root_version'], compute_info['specification'])
+    pending = [(requested, compute_info, dataset)]
+    while pending:
+        name, info, info_dataset = pending.pop()
+        dependencies = plan.dependencies.setdefault(name, set())
+        for path, key, url in find_missing_inputs(info_dataset, info):
+            dependency_info, dependency_dataset = get_url_compute_info(url)
+            dependency = Computation(dependency_info, dependency_dataset)
+            if dependency.name not in plan.computations:
+                plan.computations[dependency.name] = dependency
+                pending.append((dependency.name, dependency_info, dependency_dataset))
+            plan.computations[dependency.name].required[path] = key
+            dependencies.add(dependency.name)
+
+    # The requested computation is executed by the caller
+    del plan.dependencies[requested]
+    plan.computations.pop(requested, None)
+    for dependencies in plan.dependencies.values():
+        dependencies.discard(requested)
+    TopologicalSorter(plan.dependencies).prepare()
+    return plan
+
+
+def find_missing_inputs(
+    dataset: Dataset,
+    compute_info: dict[str, Any],
+) -> list[tuple[str, str, str]]:
+    """Find the annexed inputs of a computation that are not present
+
+    Returns path, key, and remake URL of every input in the tree of the root
+    version of the computation, whose content is not present in `dataset`
+    and that carries a remake URL.
+    """
+    root_version = compute_info['root_version']
+    resolution = resolve_tree_patterns(
+        dataset.pathobj, root_version, compute_info['input']
+    )
+    if resolution is None:
+        return []
+    files, _ = resolution
+
+    # Files in subdatasets have no key in the tree of `dataset`
+    paths = sorted(Path(file).as_posix() for file in files)
+    keys = {
+        path: key
+        for path, key in zip(
+            paths,
+            iter_annex_batch(
+                dataset.pathobj,
+                ['lookupkey', '--ref'],
+                (f'{root_version}:{path}' for path in paths),
+            ),
+            strict=True,
+        )
+        if key
+    }
+    missing = {
+        path: key
+        for (path, key), location in zip(
+            keys.items(),
+            iter_annex_batch(dataset.pathobj, ['contentlocation'], keys.values()),
+            strict=True,
+        )
+        if not location
+    }
+    if not missing:
+        return []
+
+    missing_inputs = []
+    for (path, key), response in zip(
+        missing.items(),
+        iter_annex_batch(
+            dataset.pathobj, ['whereis', '--json', '--batch-keys'], missing.values()
+        ),
+        strict=True,
+    ):
+        locations = json.loads(response)['whereis'] if response else []
+        urls = [
+            url
+            for location in locations
+            for url in location['urls']
+            if url.startswith(f'{url_scheme}:')
+        ]
+        # Identical content of other computations has the same key, prefer
+        # the computation that names this input.
+        urls.sort(key=lambda url: parse_qs(urlparse(url).query).get('this') != [path])
+        if urls:
+            missing_inputs.append((path, key, urls[0]))
+    return missing_inputs
+
+
+def inject_outputs(dataset: Dataset, worktree: Path, outputs: dict[str, str]) -> None:
+    """Move the content of `outputs` from `worktree` into the annex of `dataset`
+
+    `outputs` maps output paths to their expected keys. Content is only
+    injected if it has the expected key, i.e. non-reproducible outputs are
+    ignored.
+    """
+    # `reinject --known` computes the keys of the files with a backend, the
+    # keys of all outputs might not use the same backend.
+    backends: dict[str, list[str]] = {}
+    for path, key in outputs.items():
+        backends.setdefault(key.split('-', 1)[0], []).append(str(worktree / path))
+    for backend, files in backends.items():
+        call_git_success(
+            ['annex', 'reinject', '--known', f'--backend={backend}', *files],
+            cwd=dataset.pathobj,
+            capture_output=True,
+        )
@@ -1,65 +1,69 @@
+"""The `datalad-remake` special remote
+
+This module is imported by every remote process that git-annex starts. It
+only depends on `annexremote`, requests that do not compute content are
+answered without importing datalad. Retrievals are performed by a
+`Retriever`, see `datalad_remake.annexremotes.retrieve`.
+"""
+
 from __future__ import annotations
 
-import json
 import logging
-import shutil
+import os
 import subprocess
-from pathlib import Path
-from typing import (
-    TYPE_CHECKING,
-    Any,
-)
-from urllib.parse import (
-    unquote,
-    urlparse,
-)
+import sys
+import threading
+from typing import TYPE_CHECKING
+from urllib.parse import urlparse
 
-from datalad.customremotes import RemoteError
-from datalad_next.annexremotes import SpecialRemote, super_main
-from datalad_next.datasets import Dataset
-from datalad_next.runners import call_git_success
+from annexremote import SpecialRemote
 
 from datalad_remake import (
-    specification_dir,
+    remote_jobs_config_key,
     url_scheme,
 )
-from datalad_remake.commands.make_cmd import (
-    execute,
-    get_file_dataset,
-    provide_context,
-)
-from datalad_remake.utils.getkeys import get_trusted_keys
-from datalad_remake.utils.glob import resolve_patterns
-from datalad_remake.utils.verify import verify_file
+from datalad_remake.annexremotes.asyncmaster import AsyncMaster
 
 if TYPE_CHECKING:
-    from collections.abc import Iterable
-
     from annexremote import Master
 
+    from datalad_remake.annexremotes.retrieve import Retriever
+
 lgr = logging.getLogger('datalad.remake.annexremotes.remake')
 
 
 class RemakeRemote(SpecialRemote):
-    def __init__(self, annex: Master):
+    def __init__(self, annex: Master, *, setup_datalad: bool = False):
         super().__init__(annex)
         self.configs = {
             'allow_untrusted_execution': 'Allow execution of untrusted code with untrusted parameters. '
             'set to "true" to enable. THIS IS DANGEROUS and might lead to '
             'remote code execution.',
         }
+        # Configure datalad for a remote process, when it is first imported,
+        # see `_get_retriever`.
+        self.setup_datalad = setup_datalad
+        self._retriever: Retriever | None = None
+        self._lock = threading.Lock()
 
     def __del__(self):
         self.close()
 
     def close(self) -> None:
-        pass
+        if self._retriever is not None:
+            self._retriever.close()
 
     def _check_url(self, url: str) -> bool:
         return url.startswith((f'URL--{url_scheme}:', f'{url_scheme}:'))
 
     def prepare(self):
         self.annex.debug('PREPARE')
+        # git-annex sets `GIT_DIR` and `GIT_WORK_TREE` to paths relative to the
+        # repository. They would redirect git commands that are executed in
+        # provisioned worktrees. All git commands of this remote use explicit
+        # working directories, so we remove them from the environment.
+        for variable in ('GIT_DIR', 'GIT_WORK_TREE'):
+            os.environ.pop(variable, None)
 
     def initremote(self):
         self.annex.debug('INITREMOTE')
@@ -92,138 +96,83 @@ class RemakeRemote(SpecialRemote):
         self.annex.debug(f'get_url_for_key: key: {key!r}, urls: {urls!r}')
         return urls[0]
 
-    def get_compute_info(
-        self,
-        key: str,
-        trusted_key_ids: list[str] | None,
-    ) -> tuple[dict[str, Any], Dataset]:
-        def get_assigned_value(assignment: str) -> str:
-            return assignment.split('=', 1)[1]
-
-        root_version, spec_name, this = (
-            unquote(get_assigned_value(expr))
-            for expr in self.get_url_encoded_info(self.get_url_for_key(key))
-        )
-
-        dataset = self._find_dataset(root_version)
-        spec_path = dataset.pathobj / specification_dir / spec_name
-        if trusted_key_ids is not None:
-            verify_file(dataset.pathobj, spec_path, trusted_key_ids)
-        with open(spec_path, 'rb') as f:
-            spec = json.load(f)
-
-        return {
-            'root_version': root_version,
-            'this': this,
-            **{name: spec[name] for name in ['method', 'input', 'output', 'parameter']},
-        }, dataset
-
     def transfer_retrieve(self, key: str, file_name: str) -> None:
         self.annex.debug(f'TRANSFER RETRIEVE key: {key!r}, file_name: {file_name!r}')
-
-        if self.annex.getconfig('allow_untrusted_execution') == 'true':
-            trusted_key_ids = None
-        else:
-            trusted_key_ids = get_trusted_keys()
-
-        compute_info, dataset = self.get_compute_info(key, trusted_key_ids)
-        self.annex.debug(f'TRANSFER RETRIEVE compute_info: {compute_info!r}')
-
-        # Perform the computation, and collect the results
-        lgr.debug('Starting provision')
-        self.annex.debug('Starting provision')
-        with provide_context(
-            dataset, compute_info['root_version'], compute_info['input']
-        ) as worktree:
-            lgr.debug('Starting execution')
-            self.annex.debug('Starting execution')
-            execute(
-                worktree,
-                compute_info['method'],
-                compute_info['parameter'],
-                compute_info['output'],
-                trusted_key_ids,
-            )
-            lgr.debug('Starting collection')
-            self.annex.debug('Starting collection')
-            self._collect(
-                worktree,
-                dataset,
-                compute_info['output'],
-                compute_info['this'],
-                file_name,
-            )
-            lgr.debug('Leaving provision context')
-            self.annex.debug('Leaving provision context')
+        self._get_retriever().retrieve(key, file_name)
 
     def checkpresent(self, key: str) -> bool:
         # See if at least one URL with the remake url-scheme is present
         return self.annex.geturls(key, f'{url_scheme}:') != []
 
-    def _find_dataset(self, commit: str) -> Dataset:
-        """Find the first enclosing dataset with the given commit"""
-        # TODO: get version override from configuration
-        start_dir = Path(self.annex.getgitdir()).parent.absolute()
-        current_dir = start_dir
-        while current_dir != Path('/'):
-            result = subprocess.run(
-                ['git', 'cat-file', '-t', commit],  # noqa: S607
-                stdout=subprocess.PIPE,
-                cwd=current_dir,
-                check=False,
-            )
-            if result.returncode == 0 and result.stdout.strip() == b'commit':
-                return Dataset(current_dir)
-            current_dir = current_dir.parent
-        msg = (
-            f'Could not find dataset with commit {commit!r}, starting from '
-            f'{start_dir}'
-        )
-        raise RemoteError(msg)
-
-    def _collect(
-        self,
-        worktree: Path,
-        dataset: Dataset,
-        output_patterns: Iterable[str],
-        this: str,
-        this_destination: str,
-    ) -> None:
-        """Collect computation results for `this` (and all other outputs)"""
-
-        # Get all outputs that were created during computation
-        outputs = resolve_patterns(root_dir=worktree, patterns=output_patterns)
-
-        # Collect all output files that have been created while creating
-        # `this` file.
-        for output in outputs:
-            if output == this:
-                continue
-            dataset_path, file_path = get_file_dataset(dataset.pathobj / output)
-            is_annexed = call_git_success(
-                ['annex', 'whereis', str(file_path)],
-                cwd=dataset_path,
-                capture_output=True,
-            )
-            if is_annexed:
-                self.annex.debug(
-                    f'_collect: reinject: {worktree / output} -> {dataset_path}:{file_path}'
-                )
-                call_git_success(
-                    ['annex', 'reinject', str(worktree / output), str(file_path)],
-                    cwd=dataset_path,
-                    capture_output=True,
-                )
-
-        # Collect `this` file. It has to be copied to the destination given
-        # by git-annex. Git-annex will check its integrity.
-        shutil.copyfile(worktree / this, this_destination)
+    def _get_retriever(self) -> Retriever:
+        with self._lock:
+            if self._retriever is None:
+                if self.setup_datalad:
+                    _setup_datalad(self)
+                from datalad_remake.annexremotes.retrieve import Retriever
+
+                self._retriever = Retriever(self)
+            return self._retriever
+
+
+def _setup_datalad(remote: RemakeRemote) -> None:
+    # This is done by `datalad_next.annexremotes.super_main` and by datalad's
+    # `SpecialRemote` on startup.
+    from datalad.support.entrypoints import load_extensions
+    from datalad.ui import ui
+
+    load_extensions()
+    # stdin/stdout will be used for interactions with annex
+    ui.set_backend('annex')
+    ui.set_specialremote(remote)
+
+
+def get_remote_jobs() -> int:
+    """Get the maximum number of concurrent jobs of a remote process
+
+    The configuration is read from the repository that git-annex operates on,
+    i.e. from the working directory of the remote. If it is not set, or `0`,
+    the ASYNC extension is not used, and git-annex starts one remote process
+    per job.
+    """
+    # `datalad_next.runners` is not used, because importing it imports
+    # datalad.
+    result = subprocess.run(
+        ['git', 'config', '--get', remote_jobs_config_key],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+        check=False,
+    )
+    if result.returncode != 0:
+        return 0
+    return int(result.stdout.strip())
 
 
 def main():
     """cmdline entry point"""
-    super_main(
-        cls=RemakeRemote,
-        remote_name='datalad-remake',
-        description='Remake data based on datalad-remake specifications',
-    )
+    # This mirrors `datalad_next.annexremotes.super_main`, which does not
+    # support a custom `Master`. git-annex starts the remote without
+    # arguments, datalad is only imported to handle options like `--help`.
+    if len(sys.argv) > 1:
+        from datalad.customremotes.main import setup_parser
+
+        setup_parser(
+            'datalad-remake',
+            'Remake data based on datalad-remake specifications',
+        ).parse_args()
+
+    try:
+        master = AsyncMaster(max_jobs=get_remote_jobs())
+        remote = RemakeRemote(master, setup_datalad=True)
+        master.LinkRemote(remote)
+        master.Listen()
+        remote.close()
+    except Exception as e:  # noqa: BLE001
+        lgr.debug(
+            '%s (%s) - passing ERROR to git-annex and exiting',
+            e,
+            e.__class__.__name__,
+        )
+        print(f'ERROR {e} ({e.__class__.__name__})')
+        sys.exit(1)
@@ -0,0 +1,508 @@
+"""Computation of the content of keys for the special remote
+
+This module contains everything that the special remote needs to compute
+content, i.e. it depends on datalad, datalad-next, and the commands of this
+extension. Importing these takes much longer than answering requests like
+`CHECKPRESENT` or `CLAIMURL`, git-annex starts a remote process for every
+session, and often multiple processes in parallel. `RemakeRemote` therefore
+imports this module only when content is retrieved for the first time.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import json
+import logging
+import os
+import threading
+from graphlib import CycleError
+from pathlib import Path
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    cast,
+)
+from urllib.parse import unquote
+
+from datalad.customremotes import RemoteError
+from datalad_next.datasets import Dataset
+from datalad_next.runners import (
+    CommandError,
+    call_git_success,
+)
+from fasteners import InterProcessLock
+
+from datalad_remake import (
+    plan_jobs_config_key,
+    specification_dir,
+    worktree_pool_size_config_key,
+)
+from datalad_remake.annexremotes.planner import (
+    Computation,
+    inject_outputs,
+    plan_computations,
+)
+from datalad_remake.commands.make_cmd import (
+    build_json,
+    execute,
+    provide_context,
+)
+from datalad_remake.commands.worktree_pool import WorktreePool
+from datalad_remake.utils.catfile import ObjectTypeChecker
+from datalad_remake.utils.getkeys import get_trusted_keys
+from datalad_remake.utils.glob import resolve_patterns
+from datalad_remake.utils.memo import (
+    get_annex_key,
+    get_key_location,
+    get_worktree_fingerprint,
+    read_memo,
+    write_memo,
+)
+from datalad_remake.utils.state import get_state_dir
+from datalad_remake.utils.topology import get_topology
+from datalad_remake.utils.trace import (
+    get_trace_file,
+    span,
+    tracing,
+)
+from datalad_remake.utils.transfer import transfer_file
+from datalad_remake.utils.verify import verify_file
+
+if TYPE_CHECKING:
+    from collections.abc import (
+        Generator,
+        Iterable,
+    )
+    from contextlib import AbstractContextManager
+
+    from datalad_remake.annexremotes.remake_remote import RemakeRemote
+
+lgr = logging.getLogger('datalad.remake.annexremotes.retrieve')
+
+lock_dir_name = 'locks'
+
+# Inter-process locks do not exclude other threads of the same process, e.g.
+# concurrent jobs of an ASYNC remote. Computations that are running in this
+# process are therefore also locked here.
+computation_locks: dict[Path, threading.Lock] = {}
+computation_locks_lock = threading.Lock()
+
+
+class Retriever:
+    """Compute the content of keys for `remote`
+
+    The retriever keeps the datasets, specifications, and `git cat-file`
+    processes that it found for the lifetime of the remote process.
+    """
+
+    def __init__(self, remote: RemakeRemote):
+        self.remote = remote
+        self.annex = remote.annex
+        # Persistent `git cat-file` processes of candidate repositories and
+        # resolved commit to dataset mappings, see `_find_dataset`.
+        self._object_type_checkers: dict[Path, ObjectTypeChecker] = {}
+        self._commit_datasets: dict[str, Dataset] = {}
+        self._repository: Path | None = None
+        # Parsed specifications, indexed by dataset, version, specification,
+        # and the trusted keys that were used to verify them.
+        self._specifications: dict[tuple, dict[str, Any]] = {}
+        # Requests of concurrent jobs are handled in threads, see
+        # `AsyncMaster`. The lock guards the caches of the retriever.
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        with self._lock:
+            for checker in self._object_type_checkers.values():
+                checker.close()
+            self._object_type_checkers.clear()
+
+    def get_compute_info(
+        self,
+        key: str,
+        trusted_key_ids: list[str] | None,
+    ) -> tuple[dict[str, Any], Dataset]:
+        return self.get_url_compute_info(
+            self.remote.get_url_for_key(key), trusted_key_ids
+        )
+
+    def get_url_compute_info(
+        self,
+        url: str,
+        trusted_key_ids: list[str] | None,
+    ) -> tuple[dict[str, Any], Dataset]:
+        def get_assigned_value(assignment: str) -> str:
+            return assignment.split('=', 1)[1]
+
+        root_version, spec_name, this = (
+            unquote(get_assigned_value(expr))
+            for expr in self.remote.get_url_encoded_info(url)
+        )
+
+        dataset = self._find_dataset(root_version)
+        spec = self._get_specification(
+            dataset, root_version, spec_name, trusted_key_ids
+        )
+
+        return {
+            'root_version': root_version,
+            'specification': spec_name,
+            'this': this,
+            **{name: spec[name] for name in ['method', 'input', 'output', 'parameter']},
+        }, dataset
+
+    def _get_specification(
+        self,
+        dataset: Dataset,
+        root_version: str,
+        spec_name: str,
+        trusted_key_ids: list[str] | None,
+    ) -> dict[str, Any]:
+        """Read and verify a specification once per remote process"""
+        cache_key = (
+            dataset.pathobj,
+            root_version,
+            spec_name,
+            None if trusted_key_ids is None else tuple(trusted_key_ids),
+        )
+        with self._lock:
+            if cache_key in self._specifications:
+                return self._specifications[cache_key]
+
+        spec_path = dataset.pathobj / specification_dir / spec_name
+        if trusted_key_ids is not None:
+            with span('verify', file=str(spec_path)):
+                verify_file(dataset.pathobj, spec_path, trusted_key_ids, root_version)
+        with open(spec_path, 'rb') as f:
+            spec = json.load(f)
+
+        with self._lock:
+            self._specifications[cache_key] = spec
+        return spec
+
+    def _provide_context(
+        self,
+        dataset: Dataset,
+        branch: str,
+        input_patterns: list[str],
+    ) -> AbstractContextManager[Path]:
+        # Use the worktree pool, if it is enabled in the dataset configuration
+        pool_size = int(dataset.config.get(worktree_pool_size_config_key, 0))
+        if pool_size > 0:
+            return WorktreePool(dataset, pool_size).provide(branch, input_patterns)
+        return provide_context(dataset, branch, input_patterns)
+
+    def retrieve(self, key: str, file_name: str) -> None:
+        """Compute the content of `key` and write it to `file_name`"""
+        # Tracing is configured in the repository that git-annex operates on
+        repository = Dataset(self._get_repository())
+        with tracing(get_trace_file(repository)), span('retrieve', key=key):
+            self._retrieve(key, file_name)
+
+    def _retrieve(self, key: str, file_name: str) -> None:
+        if self.annex.getconfig('allow_untrusted_execution') == 'true':
+            trusted_key_ids = None
+        else:
+            trusted_key_ids = get_trusted_keys()
+
+        compute_info, dataset = self.get_compute_info(key, trusted_key_ids)
+        self.annex.debug(f'TRANSFER RETRIEVE compute_info: {compute_info!r}')
+
+        # Missing inputs that are outputs of other computations are computed
+        # before the worktree is provisioned, see `planner`.
+        with span('plan'):
+            self._compute_dependencies(compute_info, dataset, trusted_key_ids)
+
+        # Computations of the same specification are serialized, also across
+        # remote processes, e.g. if git-annex runs with `-J`. Completed
+        # computations are marked. If a computation of the specification was
+        # completed, e.g. while we were waiting, and it created the content
+        # of `key`, the content is reused.
+        with self._specification_lock(dataset, compute_info) as done_marker:
+            if done_marker.exists() and self._retrieve_present(
+                dataset, compute_info['this'], key, file_name
+            ):
+                return
+            self._compute(key, file_name, compute_info, dataset, trusted_key_ids)
+            done_marker.touch()
+
+    @contextlib.contextmanager
+    def _specification_lock(
+        self,
+        dataset: Dataset,
+        compute_info: dict[str, Any],
+    ) -> Generator[Path]:
+        """Lock the computation of a specification and yield its done marker"""
+        lock_dir = get_state_dir(dataset.pathobj) / lock_dir_name
+        lock_dir.mkdir(parents=True, exist_ok=True)
+        lock_name = f'{compute_info["root_version"]}-{compute_info["specification"]}'
+        with computation_lock(lock_dir / f'{lock_name}.lock'):
+            yield lock_dir / f'{lock_name}.done'
+
+    def _compute_dependencies(
+        self,
+        compute_info: dict[str, Any],
+        dataset: Dataset,
+        trusted_key_ids: list[str] | None,
+    ) -> None:
+        try:
+            plan = plan_computations(
+                compute_info,
+                dataset,
+                lambda url: self.get_url_compute_info(url, trusted_key_ids),
+            )
+        except (CycleError, CommandError, RemoteError) as e:
+            # Without a plan, missing inputs are retrieved when the worktree
+            # is provisioned.
+            self.annex.debug(f'_compute_dependencies: no plan: {e}')
+            return
+        if not plan.computations:
+            return
+
+        self.annex.debug(
+            f'_compute_dependencies: {len(plan.computations)} computations'
+        )
+        max_workers = int(
+            dataset.config.get(plan_jobs_config_key, 0) or os.cpu_count() or 1
+        )
+        plan.execute(
+            lambda computation: self._compute_planned(computation, trusted_key_ids),
+            max_workers,
+        )
+
+    def _compute_planned(
+        self,
+        computation: Computation,
+        trusted_key_ids: list[str] | None,
+    ) -> None:
+        """Execute a planned computation and inject its required outputs"""
+        compute_info, dataset = computation.compute_info, computation.dataset
+        with (
+            span('planned computation', specification=compute_info['specification']),
+            self._specification_lock(dataset, compute_info) as done_marker,
+        ):
+            # The computation might have been executed while we were waiting
+            required = {
+                path: key
+                for path, key in computation.required.items()
+                if get_key_location(dataset.pathobj, key) is None
+            }
+            if not required:
+                return
+            with provide_context(
+                dataset, compute_info['root_version'], compute_info['input']
+            ) as worktree:
+                execute(
+                    worktree,
+                    compute_info['method'],
+                    compute_info['parameter'],
+                    compute_info['output'],
+                    trusted_key_ids,
+                )
+                inject_outputs(dataset, worktree, required)
+            done_marker.touch()
+
+    def _compute(
+        self,
+        key: str,
+        file_name: str,
+        compute_info: dict[str, Any],
+        dataset: Dataset,
+        trusted_key_ids: list[str] | None,
+    ) -> None:
+        # Perform the computation, and collect the results
+        lgr.debug('Starting provision')
+        self.annex.debug('Starting provision')
+        with self._provide_context(
+            dataset, compute_info['root_version'], compute_info['input']
+        ) as worktree:
+            with span('fingerprint'):
+                fingerprint = get_worktree_fingerprint(
+                    worktree,
+                    compute_info['method'],
+                    build_json(
+                        compute_info['method'],
+                        compute_info['input'],
+                        compute_info['output'],
+                        compute_info['parameter'],
+                    ),
+                    compute_info['input'],
+                )
+            if self._retrieve_memoized(
+                dataset, fingerprint, compute_info['this'], key, file_name
+            ):
+                return
+
+            lgr.debug('Starting execution')
+            self.annex.debug('Starting execution')
+            execute(
+                worktree,
+                compute_info['method'],
+                compute_info['parameter'],
+                compute_info['output'],
+                trusted_key_ids,
+            )
+            lgr.debug('Starting collection')
+            self.annex.debug('Starting collection')
+            with span('collect', this=compute_info['this']):
+                output_keys = self._collect(
+                    worktree,
+                    dataset,
+                    compute_info['output'],
+                    compute_info['this'],
+                    file_name,
+                )
+            self._memoize(dataset, fingerprint, output_keys, compute_info['this'], key)
+            lgr.debug('Leaving provision context')
+            self.annex.debug('Leaving provision context')
+
+    def _find_dataset(self, commit: str) -> Dataset:
+        """Find the first enclosing dataset with the given commit"""
+        # TODO: get version override from configuration
+        start_dir = self._get_repository()
+        # The `git cat-file` processes are not shared between threads
+        with self._lock:
+            if commit in self._commit_datasets:
+                return self._commit_datasets[commit]
+
+            current_dir = start_dir
+            while current_dir != Path('/'):
+                if (current_dir / '.git').exists():
+                    if current_dir not in self._object_type_checkers:
+                        self._object_type_checkers[current_dir] = ObjectTypeChecker(
+                            current_dir
+                        )
+                    checker = self._object_type_checkers[current_dir]
+                    if checker.get_type(commit) == 'commit':
+                        dataset = Dataset(current_dir)
+                        self._commit_datasets[commit] = dataset
+                        return dataset
+                current_dir = current_dir.parent
+        msg = (
+            f'Could not find dataset with commit {commit!r}, starting from {start_dir}'
+        )
+        raise RemoteError(msg)
+
+    def _get_repository(self) -> Path:
+        """Get the path of the repository that git-annex operates on"""
+        if self._repository is None:
+            self._repository = Path(self.annex.getgitdir()).parent.absolute()
+        return self._repository
+
+    def _retrieve_present(
+        self,
+        dataset: Dataset,
+        this: str,
+        key: str,
+        this_destination: str,
+    ) -> bool:
+        """Copy the content of `key` to `this_destination`, if it is present"""
+        dataset_path, _ = get_topology(dataset.pathobj).get_file_dataset(Path(this))
+        location = get_key_location(dataset_path, key)
+        if location is None:
+            return False
+
+        strategy = transfer_file(location, Path(this_destination), disposable=False)
+        self.annex.debug(
+            f'_retrieve_present: {location} -> {this_destination} ({strategy})'
+        )
+        return True
+
+    def _retrieve_memoized(
+        self,
+        dataset: Dataset,
+        fingerprint: str,
+        this: str,
+        key: str,
+        this_destination: str,
+    ) -> bool:
+        """Copy memoized content of `key` to `this_destination`, if available
+
+        Memoized content of `this` with another key is not used, git-annex
+        does not check the content of all keys, e.g. of URL keys.
+        """
+        output_keys = read_memo(dataset.pathobj, fingerprint)
+        if output_keys is None or output_keys.get(this) != key:
+            return False
+        return self._retrieve_present(dataset, this, key, this_destination)
+
+    def _memoize(
+        self,
+        dataset: Dataset,
+        fingerprint: str,
+        output_keys: dict[str, str | None],
+        this: str,
+        this_key: str,
+    ) -> None:
+        """Record the keys of all collected outputs in the memo index
+
+        `output_keys` contains the keys of the other outputs that were
+        reinjected, see `_collect`. Nothing is recorded if any other output
+        was not reinjected.
+        """
+        output_keys = {**output_keys, this: this_key}
+        if None in output_keys.values():
+            return
+        write_memo(dataset.pathobj, fingerprint, cast(dict[str, str], output_keys))
+
+    def _collect(
+        self,
+        worktree: Path,
+        dataset: Dataset,
+        output_patterns: Iterable[str],
+        this: str,
+        this_destination: str,
+    ) -> dict[str, str | None]:
+        """Collect computation results for `this` (and all other outputs)
+
+        Returns all outputs with the key of their reinjected content, or
+        `None` if the content was not reinjected. The key of `this` is
+        `None`, it is determined by git-annex.
+        """
+
+        # Get all outputs that were created during computation
+        outputs = resolve_patterns(root_dir=worktree, patterns=output_patterns)
+
+        # Collect all output files that have been created while creating
+        # `this` file.
+        topology = get_topology(dataset.pathobj)
+        output_keys: dict[str, str | None] = dict.fromkeys(outputs)
+        for output in outputs:
+            if output == this:
+                continue
+            dataset_path, file_path = topology.get_file_dataset(Path(output))
+            is_annexed = call_git_success(
+                ['annex', 'whereis', str(file_path)],
+                cwd=dataset_path,
+                capture_output=True,
+            )
+            if is_annexed:
+                self.annex.debug(
+                    f'_collect: reinject: {worktree / output} -> {dataset_path}:{file_path}'
+                )
+                # `reinject` only accepts content that matches the key of
+                # `file_path`, i.e. the key is the key of the computed content.
+                with span('reinject', output=output):
+                    if call_git_success(
+                        ['annex', 'reinject', str(worktree / output), str(file_path)],
+                        cwd=dataset_path,
+                        capture_output=True,
+                    ):
+                        output_keys[output] = get_annex_key(dataset_path / file_path)
+
+        # Collect `this` file. It has to be transferred to the destination
+        # given by git-annex. Git-annex will check its integrity. The worktree
+        # is not used after the collection, i.e. it is disposable.
+        strategy = transfer_file(
+            worktree / this, Path(this_destination), disposable=True
+        )
+        self.annex.debug(f'_collect: {this} -> {this_destination} ({strategy})')
+        return output_keys
+
+
+@contextlib.contextmanager
+def computation_lock(lock_file: Path) -> Generator[None]:
+    """Lock `lock_file` against other processes and other threads"""
+    with computation_locks_lock:
+        thread_lock = computation_locks.setdefault(lock_file, threading.Lock())
+    with thread_lock, InterProcessLock(str(lock_file)):
+        yield
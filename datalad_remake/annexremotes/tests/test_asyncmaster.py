@@ -0,0 +1,68 @@
+from io import (
+    StringIO,
+    TextIOBase,
+)
+from typing import cast
+
+from ..asyncmaster import AsyncMaster
+from ..remake_remote import RemakeRemote
+from .test_remake_remote import MockedInput
+
+key = 'MD5E-s2--60b725f10c9c85c70d97880dfe8191b3.txt'
+
+
+def run_master(max_jobs: int, messages: list[str]) -> list[str]:
+    input_ = MockedInput()
+    for message in messages:
+        input_.send(message + '\n')
+    input_.send('')
+
+    output = StringIO()
+    master = AsyncMaster(output=output, max_jobs=max_jobs)
+    master.LinkRemote(RemakeRemote(master))
+    master.Listen(input=cast(TextIOBase, input_))
+    return [
+        line
+        for line in output.getvalue().splitlines()
+        if not line.startswith(('DEBUG ', 'J 1 DEBUG ', 'J 2 DEBUG '))
+    ]
+
+
+def test_async_jobs():
+    lines = run_master(
+        2,
+        [
+            'EXTENSIONS INFO ASYNC',
+            f'J 1 CHECKPRESENT {key}',
+            'J 2 GETCOST',
+            # The replies of git-annex to `GETURLS` of job 1
+            'J 1 VALUE datalad-remake:///?root_version=1',
+            'J 1 VALUE',
+        ],
+    )
+    assert lines[:2] == ['VERSION 1', 'EXTENSIONS ASYNC']
+    # The messages of different jobs can be interleaved
+    assert sorted(lines[2:]) == [
+        f'J 1 CHECKPRESENT-SUCCESS {key}',
+        f'J 1 GETURLS {key} datalad-remake:',
+        'J 2 COST 100',
+    ]
+    job_1 = [line for line in lines if line.startswith('J 1 ')]
+    assert job_1[0].startswith('J 1 GETURLS ')
+
+
+def test_async_disabled():
+    lines = run_master(
+        0,
+        [
+            'EXTENSIONS INFO ASYNC',
+            'J 1 GETCOST',
+            'GETCOST',
+        ],
+    )
+    assert lines == [
+        'VERSION 1',
+        'EXTENSIONS',
+        'UNSUPPORTED-REQUEST',
+        'COST 100',
+    ]
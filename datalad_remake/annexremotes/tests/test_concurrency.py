@@ -0,0 +1,88 @@
+import json
+
+from datalad_next.runners import call_git_lines
+from datalad_next.tests import skip_if_on_windows
+
+from datalad_remake import (
+    remote_jobs_config_key,
+    trace_file_config_key,
+)
+from datalad_remake.commands.tests.create_datasets import (
+    create_simple_computation_dataset,
+)
+
+test_method = """
+parameters = ['log']
+use_shell = 'true'
+command = [
+    "echo run >> {log};",
+    "echo content: x > x.txt;",
+    "echo content: y > y.txt;",
+]
+"""
+
+
+@skip_if_on_windows
+def test_sibling_outputs_computed_once(tmp_path):
+    root_dataset = create_simple_computation_dataset(tmp_path, 'ds1', 0, test_method)
+    log = tmp_path / 'runs.log'
+
+    root_dataset.make(
+        template='test_method',
+        parameter=[f'log={log}'],
+        output=['x.txt', 'y.txt'],
+        allow_untrusted_code=True,
+        result_renderer='disabled',
+    )
+    assert log.read_text().count('run') == 1
+
+    root_dataset.drop(
+        ['x.txt', 'y.txt'], reckless='availability', result_renderer='disabled'
+    )
+
+    # Retrieve both outputs concurrently. The second retrieval waits for the
+    # computation of the first retrieval and reuses its result.
+    call_git_lines(
+        ['annex', 'get', '-J', '2', 'x.txt', 'y.txt'],
+        cwd=root_dataset.pathobj,
+    )
+    assert (root_dataset.pathobj / 'x.txt').read_text() == 'content: x\n'
+    assert (root_dataset.pathobj / 'y.txt').read_text() == 'content: y\n'
+    assert log.read_text().count('run') == 2
+
+
+@skip_if_on_windows
+def test_async_remote(tmp_path):
+    root_dataset = create_simple_computation_dataset(tmp_path, 'ds1', 0, test_method)
+    log = tmp_path / 'runs.log'
+    trace = tmp_path / 'trace.json'
+
+    root_dataset.make(
+        template='test_method',
+        parameter=[f'log={log}'],
+        output=['x.txt', 'y.txt'],
+        allow_untrusted_code=True,
+        result_renderer='disabled',
+    )
+    root_dataset.drop(
+        ['x.txt', 'y.txt'], reckless='availability', result_renderer='disabled'
+    )
+
+    # Handle both jobs in a single remote process
+    root_dataset.config.set(remote_jobs_config_key, '2', scope='local')
+    root_dataset.config.set(trace_file_config_key, str(trace), scope='local')
+    call_git_lines(
+        ['annex', 'get', '-J', '2', 'x.txt', 'y.txt'],
+        cwd=root_dataset.pathobj,
+    )
+    assert (root_dataset.pathobj / 'x.txt').read_text() == 'content: x\n'
+    assert (root_dataset.pathobj / 'y.txt').read_text() == 'content: y\n'
+    assert log.read_text().count('run') == 2
+
+    retrievals = [
+        event
+        for event in json.loads(trace.read_text().rstrip(',\n') + ']')
+        if event['name'] == 'retrieve'
+    ]
+    assert len(retrievals) == 2
+    assert len({event['pid'] for event in retrievals}) == 1
@@ -6,6 +6,7 @@ from datalad.distribution.get import Get as datalad_Get
 from datalad_next.datasets import Dataset
 from datalad_next.tests import skip_if_on_windows
 
+from datalad_remake import worktree_pool_size_config_key
 from datalad_remake.commands.tests.create_datasets import (
     create_simple_computation_dataset,
 )
@@ -76,9 +77,18 @@ def _check_content(dataset, file_content: Iterable[tuple[str, str]]):
 
 
 @skip_if_on_windows
-@pytest.mark.parametrize('output_pattern', [output_pattern_static, output_pattern_glob])
-def test_end_to_end(tmp_path, monkeypatch, output_pattern):
+@pytest.mark.parametrize(
+    ('output_pattern', 'pool_size'),
+    [(output_pattern_static, 0), (output_pattern_glob, 0), (output_pattern_static, 1)],
+)
+def test_end_to_end(tmp_path, monkeypatch, output_pattern, pool_size):
     root_dataset = create_simple_computation_dataset(tmp_path, 'd2', 3, test_method)
+    root_dataset.configuration(
+        action='set',
+        scope='local',
+        spec=[(worktree_pool_size_config_key, str(pool_size))],
+        result_renderer='disabled',
+    )
 
     # run `make` command
     results = root_dataset.make(
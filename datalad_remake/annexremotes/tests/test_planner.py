@@ -0,0 +1,116 @@
+import json
+import threading
+
+from datalad_next.runners import call_git_lines
+from datalad_next.tests import skip_if_on_windows
+
+from datalad_remake import trace_file_config_key
+from datalad_remake.commands.tests.create_datasets import (
+    create_simple_computation_dataset,
+)
+
+from ..planner import ComputationPlan
+
+test_method = """
+parameters = ['source', 'destination', 'log']
+use_shell = 'true'
+command = [
+    "echo {destination} >> {log};",
+    "cat {source} > {destination};",
+    "echo + >> {destination}",
+]
+"""
+
+
+class MockedComputation:
+    def __init__(self, name):
+        self.name = name
+
+
+def create_plan(dependencies):
+    plan = ComputationPlan()
+    plan.dependencies = dependencies
+    plan.computations = {name: MockedComputation(name) for name in dependencies}
+    return plan
+
+
+def test_plan_execution():
+    plan = create_plan(
+        {
+            'a': set(),
+            'b': set(),
+            'c': {'a', 'b'},
+            'd': {'c'},
+            'e': {'b'},
+        }
+    )
+    # `a` and `b` are independent, they have to run concurrently
+    barrier = threading.Barrier(2, timeout=10)
+    order = []
+    lock = threading.Lock()
+
+    def run(computation):
+        if computation.name in ('a', 'b'):
+            barrier.wait()
+        with lock:
+            order.append(computation.name)
+
+    plan.execute(run, max_workers=2)
+    assert sorted(order) == ['a', 'b', 'c', 'd', 'e']
+    assert order.index('c') > max(order.index('a'), order.index('b'))
+    assert order.index('d') > order.index('c')
+
+
+def test_plan_failure():
+    plan = create_plan({'a': set(), 'b': {'a'}, 'c': {'b'}, 'd': set()})
+    executed = []
+
+    def run(computation):
+        executed.append(computation.name)
+        if computation.name == 'a':
+            msg = 'computation failed'
+            raise ValueError(msg)
+
+    # Dependents of failed computations are not executed
+    plan.execute(run, max_workers=1)
+    assert sorted(executed) == ['a', 'd']
+
+
+@skip_if_on_windows
+def test_chained_computation(tmp_path):
+    root_dataset = create_simple_computation_dataset(tmp_path, 'ds1', 0, test_method)
+    log = tmp_path / 'runs.log'
+    trace = tmp_path / 'trace.json'
+
+    (root_dataset.pathobj / 'a.txt').write_text('a\n')
+    root_dataset.save(result_renderer='disabled')
+    for source, destination in (('a', 'b'), ('b', 'c'), ('c', 'd')):
+        root_dataset.make(
+            template='test_method',
+            input=[f'{source}.txt'],
+            parameter=[
+                f'source={source}.txt',
+                f'destination={destination}.txt',
+                f'log={log}',
+            ],
+            output=[f'{destination}.txt'],
+            allow_untrusted_code=True,
+            result_renderer='disabled',
+        )
+    root_dataset.drop(
+        ['b.txt', 'c.txt', 'd.txt'],
+        reckless='availability',
+        result_renderer='disabled',
+    )
+    log.unlink()
+
+    # The computations of `b.txt` and `c.txt` are planned and executed by the
+    # remote process that computes `d.txt`, not by nested remote processes.
+    root_dataset.config.set(trace_file_config_key, str(trace), scope='local')
+    call_git_lines(['annex', 'get', 'd.txt'], cwd=root_dataset.pathobj)
+    assert (root_dataset.pathobj / 'd.txt').read_text() == 'a\n+\n+\n+\n'
+    assert log.read_text().splitlines() == ['b.txt', 'c.txt', 'd.txt']
+
+    events = json.loads(trace.read_text().rstrip(',\n') + ']')
+    assert [event['name'] for event in events].count('retrieve') == 1
+    assert [event['name'] for event in events].count('planned computation') == 2
@@ -1,8 +1,10 @@
 import re
 import subprocess
+import sys
 from io import TextIOBase
 from pathlib import Path
 from queue import Queue
+from types import SimpleNamespace
 from typing import cast
 
 import pytest
@@ -16,7 +18,9 @@ from ... import (
     template_dir,
 )
 from ...commands.make_cmd import build_json
+from ...utils.memo import write_memo
 from ..remake_remote import RemakeRemote
+from ..retrieve import Retriever
 
 template = """
 parameters = ['content']
@@ -124,6 +128,8 @@ def test_compute_remote_main(tmp_path, datalad_cfg, monkeypatch, trusted):
     # below.
     input_.send('PREPARE\n')
     input_.send(f'TRANSFER RETRIEVE {key.decode()} {tmp_path / "remade.txt"!s}\n')
+    # The next line is the answer to `GETGITDIR`
+    input_.send('VALUE .git\n')
     # The next line is the answer to `GETCONFIG allow_untrusted_execution`
     input_.send(f'VALUE {"false" if trusted else "true"}\n')
     url = (
@@ -136,7 +142,6 @@ def test_compute_remote_main(tmp_path, datalad_cfg, monkeypatch, trusted):
     # `GETURLS MD5E-s2--60b725f10c9c85c70d97880dfe8191b3.txt datalad-remake:`
     input_.send(f'VALUE {url}\n')
     input_.send('VALUE\n')
-    input_.send('VALUE .git\n')
     input_.send('')
 
     output = MockedOutput()
@@ -151,6 +156,50 @@ def test_compute_remote_main(tmp_path, datalad_cfg, monkeypatch, trusted):
     assert (tmp_path / 'remade.txt').read_text().strip() == 'content: some_string'
 
 
+def test_remote_startup_without_datalad():
+    # Requests that do not compute content are answered without datalad, see
+    # `datalad_remake.annexremotes.retrieve`.
+    result = subprocess.run(
+        [
+            sys.executable,
+            '-c',
+            (
+                'import sys;'
+                'import datalad_remake.annexremotes.remake_remote;'
+                'print(" ".join(sys.modules))'
+            ),
+        ],
+        stdout=subprocess.PIPE,
+        check=True,
+        text=True,
+    )
+    modules = result.stdout.split()
+    assert 'datalad_remake.annexremotes.remake_remote' in modules
+    assert not [m for m in modules if m.split('.')[0] in ('datalad', 'datalad_next')]
+
+
+def test_memoized_key_mismatch(tmp_path, monkeypatch):
+    subprocess.run(['git', 'init', '-q', str(tmp_path)], check=True)
+    write_memo(tmp_path, 'fingerprint', {'a.txt': 'MD5E-s1--1.txt'})
+
+    retrieved = []
+    retriever = Retriever(cast(RemakeRemote, SimpleNamespace(annex=None)))
+    monkeypatch.setattr(
+        retriever, '_retrieve_present', lambda *args: retrieved.append(args) or True
+    )
+    dataset = SimpleNamespace(pathobj=tmp_path)
+
+    # Memoized content with another key than the requested key is not used
+    assert not retriever._retrieve_memoized(
+        dataset, 'fingerprint', 'a.txt', 'MD5E-s1--2.txt', 'destination'
+    )
+    assert not retrieved
+    assert retriever._retrieve_memoized(
+        dataset, 'fingerprint', 'a.txt', 'MD5E-s1--1.txt', 'destination'
+    )
+    assert retrieved == [(dataset, 'a.txt', 'MD5E-s1--1.txt', 'destination')]
+
+
 def create_keypair(gpg_dir: Path, name: bytes = b'Test User'):
     gpg_dir.mkdir(parents=True, exist_ok=True)
     gpg_dir.chmod(0o700)
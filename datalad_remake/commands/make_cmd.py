@@ -7,11 +7,21 @@ import hashlib
 import json
 import logging
 import os
-import shutil
+from concurrent.futures import (
+    ThreadPoolExecutor,
+    as_completed,
+)
+from glob import has_magic
+from itertools import product
 from pathlib import Path
-from typing import TYPE_CHECKING
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    cast,
+)
 from urllib.parse import quote
 
+from datalad.config import anything2bool
 from datalad.support.exceptions import IncompleteResultsError
 from datalad_next.commands import (
     EnsureCommandParameterization,
@@ -25,24 +35,54 @@ from datalad_next.commands import (
 from datalad_next.constraints import (
     DatasetParameter,
     EnsureDataset,
+    EnsureInt,
     EnsureListOf,
     EnsurePath,
+    EnsureRange,
     EnsureStr,
 )
 from datalad_next.datasets import Dataset
-from datalad_next.runners import (
-    call_git_oneline,
-    call_git_success,
-)
+from datalad_next.runners import call_git_success
 
 from datalad_remake import (
+    dirty_check_config_key,
+    sparse_provision_config_key,
     specification_dir,
     template_dir,
     url_scheme,
 )
-from datalad_remake.utils.compute import compute
+from datalad_remake.utils.annexbatch import (
+    add_urls,
+    lookup_keys,
+)
+from datalad_remake.utils.compute import (
+    compute,
+    substitute_string,
+)
+from datalad_remake.utils.dirty import dirty_check_session
 from datalad_remake.utils.getkeys import get_trusted_keys
 from datalad_remake.utils.glob import resolve_patterns
+from datalad_remake.utils.jobsocket import socket_name
+from datalad_remake.utils.memo import (
+    get_annex_key,
+    get_key_location,
+    get_worktree_fingerprint,
+    read_memo,
+    write_memo,
+)
+from datalad_remake.utils.provenance import (
+    get_provenance,
+    read_provenance,
+    record_provenance,
+)
+from datalad_remake.utils.state import get_state_dir
+from datalad_remake.utils.topology import get_topology
+from datalad_remake.utils.trace import (
+    get_trace_file,
+    span,
+    tracing,
+)
+from datalad_remake.utils.transfer import transfer_file
 from datalad_remake.utils.verify import verify_file
 
 if TYPE_CHECKING:
@@ -73,6 +113,9 @@ class Make(ValidatedInterface):
             'output_list': EnsurePath(),
             'parameter': EnsureListOf(EnsureStr(min_len=3)),
             'parameter_list': EnsurePath(),
+            'batch': EnsurePath(),
+            'jobs': EnsureInt() & EnsureRange(min=1),
+            'socket': EnsurePath(),
         }
     )
 
@@ -92,8 +135,10 @@ class Make(ValidatedInterface):
         ),
         'template': Parameter(
             args=('template',),
+            nargs='?',
             doc='Name of the computing template (template should be present '
-            'in $DATASET/.datalad/remake/methods)',
+            'in $DATASET/.datalad/remake/methods). Can be omitted if every '
+            'job in `--batch` names its template.',
         ),
         'branch': Parameter(
             args=(
@@ -180,6 +225,56 @@ class Make(ValidatedInterface):
             'execute arbitrary code under your account on your '
             'infrastructure.',
         ),
+        'batch': Parameter(
+            args=('--batch',),
+            doc='Name of a file that contains one job description per line. '
+            'A job description is a JSON object with the optional keys '
+            '`template`, `branch`, `input`, `output`, and `parameter`. Keys '
+            'that are not given default to the values given on the command '
+            'line. `parameter` can be an object or a list of `<name>=<value>` '
+            'strings. All jobs are executed, failing jobs are reported as '
+            'errors. Empty lines and lines that start with `#` are ignored.',
+        ),
+        'sweep': Parameter(
+            args=('--sweep',),
+            action='store_true',
+            default=False,
+            doc='Interpret parameter values as comma-separated lists of '
+            'values, in which `<start>..<end>` denotes an inclusive integer '
+            'range, e.g. `-p subject=01..03,07 -p seed=1,2`. One job is '
+            'executed for every combination of parameter values. Every '
+            '`{<name>}` in parameter values, input patterns, and output '
+            'patterns is replaced with the value of parameter `<name>` of the '
+            'respective combination, e.g. `-o sub-{subject}_seed-{seed}.txt`. '
+            'The jobs are executed like jobs given in `--batch`.',
+        ),
+        'jobs': Parameter(
+            args=('-J', '--jobs'),
+            doc='Number of jobs that are provisioned and executed '
+            'concurrently, each job in its own worktree. Outputs are '
+            'collected and registered sequentially after all jobs finished. '
+            'Every job also installs up to this number of subdatasets and '
+            'retrieves up to this number of inputs concurrently.',
+        ),
+        'serve': Parameter(
+            args=('--serve',),
+            action='store_true',
+            default=False,
+            doc='Do not execute a computation, but keep running and execute '
+            'jobs that are submitted to a Unix domain socket, until a stop '
+            'request is received. Jobs are described like the lines of a '
+            '`--batch` file, keys that are not given default to the values '
+            'given on the command line. The dataset, trusted keys, and '
+            'other caches are kept in memory between jobs. Jobs can be '
+            'submitted with `datalad-remake-submit <socket>`, which reads '
+            'job descriptions from stdin.',
+        ),
+        'socket': Parameter(
+            args=('--socket',),
+            doc='Path of the socket of `--serve`. Defaults to `make.sock` in '
+            'the datalad-remake state directory of the git directory of '
+            'the dataset.',
+        ),
     }
 
     @staticmethod
@@ -198,6 +293,11 @@ class Make(ValidatedInterface):
         parameter: list[str] | None = None,
         parameter_list: Path | None = None,
         allow_untrusted_code: bool = False,
+        batch: Path | None = None,
+        sweep: bool = False,
+        jobs: int = 1,
+        serve: bool = False,
+        socket: Path | None = None,
     ) -> Generator:
         ds: Dataset = dataset.ds if dataset else Dataset('.')
 
@@ -207,36 +307,42 @@ class Make(ValidatedInterface):
 
         parameter_dict = dict([p.split('=', 1) for p in parameter])
 
-        # We have to get the URL first, because saving the specification to
-        # the dataset will change the version.
-        url_base, reset_commit = get_url(
-            ds, branch, template, parameter_dict, input_pattern, output_pattern
-        )
+        job = {
+            'template': template,
+            'branch': branch,
+            'input': input_pattern,
+            'output': output_pattern,
+            'parameter': parameter_dict,
+        }
+        trusted_key_ids = None if allow_untrusted_code else get_trusted_keys()
+        if serve:
+            # The server imports this module
+            from datalad_remake.commands.make_server import serve as serve_jobs
 
-        if not url_only:
-            with provide_context(
-                ds,
-                branch,
-                input_pattern,
-            ) as worktree:
-                execute(
-                    worktree,
-                    template,
-                    parameter_dict,
-                    output_pattern,
-                    None if allow_untrusted_code else get_trusted_keys(),
+            with tracing(get_trace_file(ds)):
+                yield from serve_jobs(
+                    ds,
+                    socket or get_state_dir(ds.pathobj) / socket_name,
+                    job,
+                    url_only=url_only,
+                    trusted_key_ids=trusted_key_ids,
+                    max_workers=jobs,
                 )
-                resolved_output = collect(worktree, ds, output_pattern)
-        else:
-            resolved_output = set(output_pattern)
-
-        for out in resolved_output:
-            url = add_url(ds, out, url_base, url_only=url_only)
-            yield get_status_dict(
-                action='make',
-                path=str(ds.pathobj / out),
-                status='ok',
-                message=f'added url: {url!r} to {out!r} in {ds.pathobj}',
+            return
+
+        # Every job is validated before any specification is written
+        job_list = [parse_job({}, job)] if batch is None else read_jobs(batch, job)
+        if sweep:
+            job_list = expand_sweeps(job_list)
+
+        with tracing(get_trace_file(ds)):
+            yield from run_jobs(
+                ds,
+                job_list,
+                url_only=url_only,
+                trusted_key_ids=trusted_key_ids,
+                max_workers=jobs,
+                raise_errors=batch is None and not sweep,
             )
 
 
@@ -254,28 +360,422 @@ def read_list(list_file: str | Path | None) -> list[str]:
     )
 
 
-def get_url(
+def read_jobs(batch_file: str | Path, defaults: dict[str, Any]) -> list[dict]:
+    """Read job descriptions from a JSON-lines file
+
+    Every line contains a JSON object with any of the keys `template`,
+    `branch`, `input`, `output`, and `parameter`. Keys that are not given are
+    taken from `defaults`. Parameters can be given as an object or as a list
+    of `<name>=<value>` strings, they are merged with the default parameters.
+    """
+    job_list = []
+    for number, line in enumerate(read_list(batch_file), start=1):
+        try:
+            job_list.append(parse_job(json.loads(line), defaults))
+        except (TypeError, ValueError) as e:
+            msg = f'{batch_file}:{number}: {e}'
+            raise ValueError(msg) from e
+    return job_list
+
+
+def parse_job(description: Any, defaults: dict[str, Any]) -> dict[str, Any]:
+    """Complete a job description with `defaults`, see `read_jobs`"""
+    if not isinstance(description, dict):
+        msg = 'job description is not an object'
+        raise TypeError(msg)
+
+    description = dict(description)
+    parameter = description.pop('parameter', {})
+    if isinstance(parameter, list):
+        parameter = dict([p.split('=', 1) for p in parameter])
+
+    job = {
+        **defaults,
+        **description,
+        'parameter': {**defaults['parameter'], **parameter},
+    }
+    if not job['template'] or not job['output']:
+        msg = 'job has no template or no output'
+        raise ValueError(msg)
+    return job
+
+
+def expand_sweeps(job_list: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Expand multi-valued parameters of jobs into the product of all values"""
+    expanded_jobs = []
+    for job in job_list:
+        names = list(job['parameter'])
+        value_lists = [expand_values(job['parameter'][name]) for name in names]
+        for values in product(*value_lists):
+            combination = dict(zip(names, values, strict=True))
+            expanded_jobs.append(
+                {
+                    **job,
+                    'input': [substitute_string(i, combination) for i in job['input']],
+                    'output': [
+                        substitute_string(o, combination) for o in job['output']
+                    ],
+                    'parameter': {
+                        name: substitute_string(value, combination)
+                        for name, value in combination.items()
+                    },
+                }
+            )
+
+    # Jobs with identical outputs would overwrite each other's results
+    seen_outputs: set[str] = set()
+    for job in expanded_jobs:
+        if seen_outputs.intersection(job['output']):
+            msg = (
+                'sweep jobs have identical outputs, use `{<name>}` to include '
+                f'parameter values in output patterns: {job["output"]}'
+            )
+            raise ValueError(msg)
+        seen_outputs.update(job['output'])
+    return expanded_jobs
+
+
+def expand_values(value_list: str) -> list[str]:
+    """Expand a comma-separated list of values and integer ranges
+
+    A range `<start>..<end>` includes `<end>`. If `<start>` has leading zeros,
+    all values of the range are zero-padded to the length of `<start>`.
+    """
+    values: list[str] = []
+    for value in value_list.split(','):
+        start, separator, end = value.partition('..')
+        if separator and start.isdigit() and end.isdigit():
+            width = len(start) if start.startswith('0') else 0
+            values.extend(
+                str(number).zfill(width) for number in range(int(start), int(end) + 1)
+            )
+        else:
+            values.append(value)
+    return values
+
+
+def run_jobs(
     dataset: Dataset,
-    branch: str | None,
-    template_name: str,
-    parameters: dict[str, str],
-    input_pattern: list[str],
-    output_pattern: list[str],
-) -> tuple[str, str]:
-    # If something goes wrong after the make specification was saved,
-    # the dataset state should be reset to `branch`
-    reset_branch = branch or dataset.repo.get_hexsha()
-
-    # Write the specification to a file in the dataset
-    digest = write_spec(
-        dataset, template_name, input_pattern, output_pattern, parameters
+    job_list: list[dict[str, Any]],
+    *,
+    url_only: bool,
+    trusted_key_ids: list[str] | None,
+    max_workers: int = 1,
+    raise_errors: bool = True,
+) -> Generator:
+    """Execute make jobs and register their outputs in `dataset`
+
+    The specifications of all jobs are saved in a single commit, which becomes
+    the root version of all jobs. Provisioning and execution of the jobs are
+    performed concurrently by `max_workers` threads, each job in its own
+    worktree. The outputs of a job are collected into `dataset` as soon as
+    the job is finished, and its worktree is removed. Saving the dataset and
+    adding URLs are performed once, after all jobs have finished.
+
+    If `raise_errors` is `True`, the first error of a job is raised, otherwise
+    an error result is yielded for the failed job.
+
+    Jobs whose outputs carry the provenance of the job, i.e. that were
+    created by the same specification from the same inputs, are not executed,
+    see `datalad_remake.utils.provenance`.
+    """
+    provenances: list[str | None] = [None] * len(job_list)
+    if not url_only:
+        with span('check provenance', jobs=len(job_list)):
+            provenances = [get_job_provenance(dataset, job) for job in job_list]
+        outdated = []
+        for job, provenance in zip(job_list, provenances, strict=True):
+            if provenance is not None and is_up_to_date(dataset, job, provenance):
+                for output in job['output']:
+                    yield get_status_dict(
+                        action='make',
+                        path=str(dataset.pathobj / output),
+                        status='notneeded',
+                        message=f'{output!r} is up to date',
+                    )
+            else:
+                outdated.append((job, provenance))
+        if not outdated:
+            return
+        job_list = [job for job, _ in outdated]
+        provenances = [provenance for _, provenance in outdated]
+
+    # We have to get the root version first, because saving the
+    # specifications to the dataset will change the version.
+    with span('save specifications', jobs=len(job_list)):
+        digests = [
+            write_spec(
+                dataset, job['template'], job['input'], job['output'], job['parameter']
+            )
+            for job in job_list
+        ]
+        save_specs(dataset, digests)
+    root_version = dataset.repo.get_hexsha()
+    url_bases = [get_url_base(root_version, digest) for digest in digests]
+
+    if url_only:
+        with span('addurl'):
+            yield from register_outputs(
+                dataset,
+                [
+                    (output, url_base)
+                    for job, url_base in zip(job_list, url_bases, strict=True)
+                    for output in job['output']
+                ],
+                url_only=True,
+            )
+        return
+
+    # All jobs are provisioned from the same dataset version, the dirty state
+    # of the dataset is therefore only determined once, i.e. outputs that are
+    # collected while other jobs are provisioned are not considered.
+    collected: list[tuple[str, dict[str, str] | None, set[str]] | None] = [None] * len(
+        job_list
+    )
+    output_provenances: dict[str, str] = {}
+    with (
+        dirty_check_session(),
+        ThreadPoolExecutor(max_workers=max_workers) as executor,
+    ):
+        futures = {
+            executor.submit(
+                prepare_job, dataset, job, trusted_key_ids, max_workers
+            ): index
+            for index, job in enumerate(job_list)
+        }
+        try:
+            # Outputs are collected as soon as a job is finished, and its
+            # worktree is removed, i.e. at most `max_workers` worktrees exist
+            # plus the worktrees that wait for collection.
+            for future in as_completed(futures):
+                index = futures.pop(future)
+                job = job_list[index]
+                error = future.exception()
+                if error is not None:
+                    if raise_errors:
+                        raise error
+                    yield get_status_dict(
+                        action='make',
+                        path=str(dataset.pathobj),
+                        status='error',
+                        message=f'computation of {job["template"]!r} failed: {error}',
+                    )
+                    continue
+
+                worktree, fingerprint, output_keys = future.result()
+                try:
+                    with span('collect', template=job['template']):
+                        if output_keys is not None:
+                            outputs = link_outputs(dataset, output_keys)
+                        else:
+                            outputs = collect_outputs(
+                                worktree, dataset, job['output'], disposable=True
+                            )
+                finally:
+                    un_provide(dataset, worktree)
+                collected[index] = (fingerprint, output_keys, outputs)
+                provenance = provenances[index]
+                if provenance is not None:
+                    output_provenances.update(dict.fromkeys(outputs, provenance))
+        finally:
+            # Remove the worktrees of jobs that were not collected
+            for future in futures:
+                if future.exception() is None:
+                    un_provide(dataset, future.result()[0])
+
+    with span('save'):
+        dataset.save(recursive=True, result_renderer='disabled')
+
+    # Provenance is stored in git-annex metadata of the keys of outputs,
+    # which are only known after the outputs are saved.
+    with span('record provenance', outputs=len(output_provenances)):
+        record_outputs_provenance(dataset, output_provenances)
+
+    registrations: list[tuple[str, str]] = []
+    for url_base, collection in zip(url_bases, collected, strict=True):
+        if collection is None:
+            continue
+        fingerprint, output_keys, outputs = collection
+        if output_keys is None:
+            memoize_outputs(dataset, fingerprint, outputs)
+        registrations.extend((output, url_base) for output in sorted(outputs))
+    with span('addurl', outputs=len(registrations)):
+        yield from register_outputs(dataset, registrations, url_only=False)
+
+
+def prepare_job(
+    dataset: Dataset,
+    job: dict[str, Any],
+    trusted_key_ids: list[str] | None,
+    jobs: int = 1,
+) -> tuple[Path, str, dict[str, str] | None]:
+    """Provision a worktree for `job` and execute it, unless it is memoized
+
+    Returns the worktree, the fingerprint of the computation, and the memoized
+    output keys, if the computation is memoized. The worktree has to be removed
+    by the caller.
+    """
+    worktree = provide(
+        dataset, branch=job['branch'], input_patterns=job['input'], jobs=jobs
     )
+    try:
+        spec = build_json(
+            job['template'], job['input'], job['output'], job['parameter']
+        )
+        with span('fingerprint'):
+            fingerprint = get_worktree_fingerprint(
+                worktree, job['template'], spec, job['input']
+            )
+        output_keys = find_memoized_outputs(dataset, fingerprint)
+        if output_keys is None:
+            execute(
+                worktree,
+                job['template'],
+                job['parameter'],
+                job['output'],
+                trusted_key_ids,
+            )
+    except Exception:
+        un_provide(dataset, worktree)
+        raise
+    return worktree, fingerprint, output_keys
+
+
+def get_job_provenance(dataset: Dataset, job: dict[str, Any]) -> str | None:
+    """Get the provenance of `job` from the committed tree of `dataset`"""
+    return get_provenance(
+        dataset.pathobj,
+        job['branch'] or 'HEAD',
+        job['template'],
+        build_json(job['template'], job['input'], job['output'], job['parameter']),
+        job['input'],
+    )
+
+
+def is_up_to_date(dataset: Dataset, job: dict[str, Any], provenance: str) -> bool:
+    """Check whether all outputs of `job` are present and carry `provenance`"""
+    # Output patterns are resolved in the worktree after the computation, the
+    # outputs are only known beforehand if no pattern contains wildcards.
+    if any(has_magic(output) for output in job['output']):
+        return False
+    if not all((dataset.pathobj / output).exists() for output in job['output']):
+        return False
+
+    topology = get_topology(dataset.pathobj)
+    paths: dict[Path, list[Path]] = {}
+    for output in job['output']:
+        dataset_path, path = topology.get_file_dataset(Path(output))
+        paths.setdefault(dataset_path, []).append(path)
+    return all(
+        provenance in recorded
+        for dataset_path, dataset_paths in paths.items()
+        for recorded in read_provenance(dataset_path, dataset_paths).values()
+    )
+
+
+def record_outputs_provenance(dataset: Dataset, provenances: dict[str, str]) -> None:
+    """Record the provenance of collected outputs in their datasets"""
+    topology = get_topology(dataset.pathobj)
+    groups: dict[Path, dict[Path, str]] = {}
+    for output, provenance in provenances.items():
+        dataset_path, path = topology.get_file_dataset(Path(output))
+        groups.setdefault(dataset_path, {})[path] = provenance
+    for dataset_path, group in groups.items():
+        record_provenance(dataset_path, group)
+
+
+def register_outputs(
+    dataset: Dataset,
+    outputs: Iterable[tuple[str, str]],
+    *,
+    url_only: bool,
+) -> Generator:
+    """Add computation URLs to outputs and yield a result for every output
+
+    `outputs` contains pairs of an output path, relative to `dataset`, and the
+    URL base of the computation that creates the output. A single batched
+    git-annex process per (sub)dataset is used to check whether outputs are
+    annexed and to add the URLs.
+    """
+    for dataset_path, files in group_by_dataset(dataset.pathobj, outputs).items():
+        # URLs can only be added to annexed files. If speculative computation
+        # is requested, URLs are also added for files that do not yet exist.
+        existing = [
+            path
+            for _, path, _ in files
+            if (dataset_path / path).exists() or (dataset_path / path).is_symlink()
+        ]
+        keys = lookup_keys(dataset_path, existing) if existing else {}
+
+        additions = {}
+        for output, path, url in files:
+            if path in keys and keys[path] is None:
+                yield get_status_dict(
+                    action='make',
+                    path=str(dataset.pathobj / output),
+                    status='ok',
+                    message=f'{output!r} is not annexed, no url added',
+                )
+            elif path in keys or url_only:
+                additions[str(path)] = (output, path, url)
+
+        if not additions:
+            continue
+
+        lgr.debug('register_outputs: %s %d urls', dataset_path, len(additions))
+        for result in add_urls(
+            dataset_path,
+            [(url, path) for _, path, url in additions.values()],
+            relaxed=url_only,
+        ):
+            output, _, url = additions[result['file']]
+            if result['success']:
+                yield get_status_dict(
+                    action='make',
+                    path=str(dataset.pathobj / output),
+                    status='ok',
+                    message=f'added url: {url!r} to {output!r} in {dataset.pathobj}',
+                )
+            else:
+                yield get_status_dict(
+                    action='make',
+                    path=str(dataset.pathobj / output),
+                    status='error',
+                    message=(
+                        f'addurl failed: {url!r} to {output!r} in '
+                        f'{dataset_path}: {"; ".join(result["error-messages"])}'
+                    ),
+                )
+
+
+def group_by_dataset(
+    root: Path,
+    outputs: Iterable[tuple[str, str]],
+) -> dict[Path, list[tuple[str, Path, str]]]:
+    """Group outputs by the (sub)dataset that contains them
 
+    Returns a mapping from dataset paths to lists of the output path, the
+    path of the output relative to the containing dataset, and the URL of the
+    output.
+    """
+    # Outputs of speculative computations might not exist yet, the topology
+    # determines the dataset from the path alone.
+    topology = get_topology(root)
+    groups: dict[Path, list[tuple[str, Path, str]]] = {}
+    for output, url_base in outputs:
+        dataset_path, path = topology.get_file_dataset(Path(output))
+        groups.setdefault(dataset_path, []).append(
+            (output, path, url_base + f'&this={quote(output)}')
+        )
+    return groups
+
+
+def get_url_base(root_version: str, digest: str) -> str:
     return (
         f'{url_scheme}:///'
-        f'?root_version={quote(dataset.repo.get_hexsha())}'
+        f'?root_version={quote(root_version)}'
         f'&specification={quote(digest)}'
-    ), reset_branch
+    )
 
 
 def write_spec(
@@ -295,15 +795,24 @@ def write_spec(
     spec_dir = dataset.pathobj / specification_dir
     spec_dir.mkdir(parents=True, exist_ok=True)
     spec_file = spec_dir / digest
-    with contextlib.chdir(dataset.pathobj):
-        call_git_success(['annex', 'unlock', str(spec_file)], capture_output=True)
+    call_git_success(
+        ['annex', 'unlock', str(spec_file)],
+        cwd=dataset.pathobj,
+        capture_output=True,
+    )
     spec_file.write_text(spec)
+    return digest
+
+
+def save_specs(dataset: Dataset, digests: list[str]) -> None:
     dataset.save(
-        message=f'[DATALAD] saving computation spec\n\nfile name: {digest}',
+        message=(
+            '[DATALAD] saving computation spec\n\n'
+            + '\n'.join(f'file name: {digest}' for digest in digests)
+        ),
         recursive=True,
         result_renderer='disabled',
     )
-    return digest
 
 
 def build_json(
@@ -314,65 +823,43 @@ def build_json(
     )
 
 
-def add_url(dataset: Dataset, file_path: str, url_base: str, *, url_only: bool) -> str:
-    lgr.debug('add_url: %s %s %s %s', str(dataset), file_path, url_base, repr(url_only))
-
-    # Build the file-specific URL and store it in the annex
-    url = url_base + f'&this={quote(file_path)}'
-    dataset_path, path = get_file_dataset(dataset.pathobj / file_path)
-
-    # If the file does not exist and speculative computation is requested, we
-    # can just add the URL.
-    if not (dataset.pathobj / path).exists() and url_only:
-        can_add = True
-    else:
-        # Check if the file is annexed, otherwise we cannot add a URL
-        can_add = call_git_success(
-            ['annex', 'whereis', str(path)],
-            cwd=dataset_path,
-            capture_output=True,
-        )
-
-    # Add the URL
-    if can_add:
-        success = call_git_success(
-            ['annex', 'addurl', url, '--file', str(path)]
-            + (['--relaxed'] if url_only else []),
-            cwd=dataset_path,
-            capture_output=True,
-        )
-        if not success:
-            msg = (
-                f'\naddurl failed:\ndataset_path: {dataset_path}\n'
-                f'url: {url!r}\nfile_path: {path!r}'
-            )
-            raise RuntimeError(msg)
-    return url
-
-
-def get_file_dataset(file: Path) -> tuple[Path, Path]:
-    """Get dataset of file and relative path of file from the dataset
-
-    Determine the path of the dataset that contains the file and the relative
-    path of the file in this dataset."""
-    top_level = Path(
-        call_git_oneline(['rev-parse', '--show-toplevel'], cwd=file.parent)
-    )
-    return (Path(top_level), file.absolute().relative_to(top_level))
-
-
 def provide(
     dataset: Dataset,
     branch: str | None,
     input_patterns: list[str],
+    worktree_dir: Path | None = None,
+    sparse: bool | None = None,
+    jobs: int = 1,
 ) -> Path:
     lgr.debug('provide: %s %s %s', dataset, branch, input_patterns)
-    result = dataset.provision(
-        input=input_patterns, branch=branch, result_renderer='disabled'
-    )
+    with span('provision', inputs=input_patterns):
+        result = dataset.provision(
+            input=input_patterns,
+            branch=branch,
+            worktree_dir=worktree_dir,
+            sparse=is_sparse_provision(dataset) if sparse is None else sparse,
+            jobs=jobs,
+            dirty_check=get_dirty_check(dataset),
+            result_renderer='disabled',
+        )
     return Path(result[0]['path'])
 
 
+def is_sparse_provision(dataset: Dataset) -> bool:
+    """Check whether worktrees of `dataset` should be provisioned sparsely"""
+    return anything2bool(dataset.config.get(sparse_provision_config_key, False))
+
+
+def get_dirty_check(dataset: Dataset) -> str:
+    """Get the scope of the dirty check for provisioning worktrees of `dataset`
+
+    Returns `inputs` if only files that might be inputs should be checked,
+    otherwise `all`.
+    """
+    scope = dataset.config.get(dirty_check_config_key, 'all')
+    return 'inputs' if scope == 'inputs' else 'all'
+
+
 @contextlib.contextmanager
 def provide_context(
     dataset: Dataset,
@@ -383,7 +870,12 @@ def provide_context(
     try:
         yield worktree
     finally:
-        lgr.debug('un_provide: %s %s', dataset, str(worktree))
+        un_provide(dataset, worktree)
+
+
+def un_provide(dataset: Dataset, worktree: Path) -> None:
+    lgr.debug('un_provide: %s %s', dataset, str(worktree))
+    with span('remove worktree'):
         dataset.provision(delete=worktree, result_renderer='disabled')
 
 
@@ -416,10 +908,12 @@ def execute(
     # Run the computation in the worktree-directory
     template_path = Path(template_dir) / template_name
     if trusted_key_ids is not None:
-        verify_file(worktree_ds.pathobj, template_path, trusted_key_ids)
+        with span('verify', file=str(template_path)):
+            verify_file(worktree_ds.pathobj, template_path, trusted_key_ids)
 
     worktree_ds.get(template_path, result_renderer='disabled')
-    compute(worktree, worktree / template_path, parameter)
+    with span('execute', template=template_name):
+        compute(worktree, worktree / template_path, parameter)
 
 
 def collect(
@@ -427,37 +921,115 @@ def collect(
     dataset: Dataset,
     output_pattern: Iterable[str],
 ) -> set[str]:
+    output = collect_outputs(worktree, dataset, output_pattern)
+
+    # Save the dataset
+    dataset.save(recursive=True, result_renderer='disabled')
+    return output
+
+
+def collect_outputs(
+    worktree: Path,
+    dataset: Dataset,
+    output_pattern: Iterable[str],
+    *,
+    disposable: bool = False,
+) -> set[str]:
+    """Transfer outputs from the worktree into the dataset, without saving it
+
+    If `disposable` is `True`, the outputs in the worktree are not needed
+    after the collection and might be moved instead of copied.
+    """
     output = resolve_patterns(root_dir=worktree, patterns=output_pattern)
 
-    # Unlock output files in the dataset-directory and copy the result
+    # Unlock output files in the dataset-directory and transfer the result
     unlock_files(dataset, output)
     for o in output:
-        lgr.debug('collect: collecting %s', o)
         destination = dataset.pathobj / o
         destination.parent.mkdir(parents=True, exist_ok=True)
-        shutil.copyfile(worktree / o, destination)
-
-    # Save the dataset
-    dataset.save(recursive=True, result_renderer='disabled')
+        strategy = transfer_file(worktree / o, destination, disposable=disposable)
+        lgr.debug('collect: collected %s (%s)', o, strategy)
     return output
 
 
+def memoize_outputs(
+    dataset: Dataset,
+    fingerprint: str,
+    outputs: Iterable[str],
+) -> None:
+    """Record the keys of collected outputs in the memo index of `dataset`
+
+    Nothing is recorded if any output is not annexed, because only annexed
+    content can be re-linked later.
+    """
+    output_keys = {
+        output: get_annex_key(dataset.pathobj / output) for output in outputs
+    }
+    if None in output_keys.values():
+        lgr.debug('memoize_outputs: not memoizing non-annexed outputs')
+        return
+    write_memo(dataset.pathobj, fingerprint, cast(dict[str, str], output_keys))
+
+
+def find_memoized_outputs(dataset: Dataset, fingerprint: str) -> dict[str, str] | None:
+    """Get the memoized output keys of the computation `fingerprint`
+
+    Returns `None` if the computation is not memoized or if the content of any
+    of its outputs is not locally available.
+    """
+    output_keys = read_memo(dataset.pathobj, fingerprint)
+    if output_keys is None:
+        return None
+
+    topology = get_topology(dataset.pathobj)
+    for output, key in output_keys.items():
+        dataset_path, _ = topology.get_file_dataset(Path(output))
+        if get_key_location(dataset_path, key) is None:
+            lgr.debug('memo: content of %s (%s) is not available', output, key)
+            return None
+    return output_keys
+
+
+def link_outputs(dataset: Dataset, output_keys: dict[str, str]) -> set[str]:
+    """Link outputs to the given keys in `dataset`, without saving it"""
+    topology = get_topology(dataset.pathobj)
+    for output, key in output_keys.items():
+        file = dataset.pathobj / output
+        if file.is_symlink() and Path(os.readlink(file)).name == key:
+            continue
+        lgr.debug('link_outputs: linking %s to memoized key %s', output, key)
+        file.parent.mkdir(parents=True, exist_ok=True)
+        if file.exists() or file.is_symlink():
+            file.unlink()
+        dataset_path, path = topology.get_file_dataset(Path(output))
+        success = call_git_success(
+            ['annex', 'fromkey', key, str(path)],
+            cwd=dataset_path,
+            capture_output=True,
+        )
+        if not success:
+            msg = (
+                f'\nfromkey failed:\ndataset_path: {dataset_path}\n'
+                f'key: {key!r}\nfile_path: {path!r}'
+            )
+            raise RuntimeError(msg)
+    return set(output_keys)
+
+
 def unlock_files(dataset: Dataset, files: Iterable[str]) -> None:
     """Use datalad to resolve subdatasets and unlock files in the dataset."""
-    # TODO: for some reason `dataset unlock` does not operate in the
-    #  context of `dataset.pathobj`, so we need to change the working
-    #  directory manually here.
-    with contextlib.chdir(dataset.pathobj):
-        for f in files:
-            file = dataset.pathobj / f
-            if not file.exists() and file.is_symlink():
-                # `datalad unlock` does not "unlock" dangling symlinks, so we
-                # mimic the behavior of `git annex unlock` here:
-                link = os.readlink(file)
-                file.unlink()
-                file.write_text('/annex/objects/' + link.split('/')[-1] + '\n')
-            elif file.is_symlink():
-                dataset.unlock(file, result_renderer='disabled')
+    # We do not change the working directory here, because that would affect
+    # concurrently executing jobs. `dataset unlock` operates on absolute paths.
+    for f in files:
+        file = dataset.pathobj / f
+        if not file.exists() and file.is_symlink():
+            # `datalad unlock` does not "unlock" dangling symlinks, so we
+            # mimic the behavior of `git annex unlock` here:
+            link = os.readlink(file)
+            file.unlink()
+            file.write_text('/annex/objects/' + link.split('/')[-1] + '\n')
+        elif file.is_symlink():
+            dataset.unlock(file, result_renderer='disabled')
 
 
 def create_output_space(dataset: Dataset, files: Iterable[str]) -> None:
@@ -0,0 +1,160 @@
+"""A long-running `datalad make` process that accepts jobs over a socket
+
+Every `datalad make` call starts an interpreter, loads datalad and its
+extensions, reads the configuration, and finds the dataset, before the first
+job is provisioned. `datalad make --serve` does this once. The dataset, the
+trusted keys, the subdataset topology, parsed method templates, and verified
+commits are kept in memory, and jobs are submitted over a Unix domain socket,
+see `datalad_remake.utils.jobsocket` for the protocol and a client.
+
+Requests are accepted concurrently, but executed one after the other,
+because every request saves its specifications and outputs in the dataset.
+The jobs of a single request are executed like the jobs of a `--batch` file.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import socket
+import socketserver
+import threading
+from typing import (
+    TYPE_CHECKING,
+    Any,
+)
+
+from datalad_next.commands import get_status_dict
+
+from datalad_remake.commands.make_cmd import (
+    parse_job,
+    run_jobs,
+)
+
+if TYPE_CHECKING:
+    from collections.abc import Generator
+    from pathlib import Path
+
+    from datalad_next.datasets import Dataset
+
+lgr = logging.getLogger('datalad.remake.commands.make_server')
+
+
+class MakeServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        socket_path: Path,
+        dataset: Dataset,
+        defaults: dict[str, Any],
+        *,
+        url_only: bool,
+        trusted_key_ids: list[str] | None,
+        max_workers: int,
+    ):
+        self.dataset = dataset
+        self.defaults = defaults
+        self.url_only = url_only
+        self.trusted_key_ids = trusted_key_ids
+        self.max_workers = max_workers
+        # Requests modify the dataset, they are executed one after the other
+        self.jobs_lock = threading.Lock()
+        super().__init__(str(socket_path), RequestHandler)
+
+    def execute(self, descriptions: list[Any]) -> Generator[dict]:
+        job_list = [
+            parse_job(description, self.defaults) for description in descriptions
+        ]
+        with self.jobs_lock:
+            yield from run_jobs(
+                self.dataset,
+                job_list,
+                url_only=self.url_only,
+                trusted_key_ids=self.trusted_key_ids,
+                max_workers=self.max_workers,
+                raise_errors=False,
+            )
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    server: MakeServer
+
+    def handle(self) -> None:
+        try:
+            message = json.loads(self.rfile.readline())
+            if message.get('stop'):
+                lgr.debug('stop requested')
+                # `shutdown` waits until `serve_forever` returns, which is
+                # executed in another thread.
+                self.server.shutdown()
+                return
+            for result in self.server.execute(message['jobs']):
+                self._reply(result)
+        except Exception as e:  # noqa: BLE001
+            lgr.debug('request failed: %s', e)
+            self._reply(
+                get_status_dict(
+                    action='make',
+                    path=str(self.server.dataset.pathobj),
+                    status='error',
+                    message=f'request failed: {e}',
+                )
+            )
+
+    def _reply(self, result: dict) -> None:
+        self.wfile.write(json.dumps(result, default=str).encode() + b'\n')
+        self.wfile.flush()
+
+
+def serve(
+    dataset: Dataset,
+    socket_path: Path,
+    defaults: dict[str, Any],
+    *,
+    url_only: bool,
+    trusted_key_ids: list[str] | None,
+    max_workers: int,
+) -> Generator[dict]:
+    """Execute jobs that are submitted to `socket_path` until stopped
+
+    `defaults` are used for keys that are missing in submitted job
+    descriptions, like the command line arguments of `datalad make --batch`.
+    """
+    remove_stale_socket(socket_path)
+    socket_path.parent.mkdir(parents=True, exist_ok=True)
+    server = MakeServer(
+        socket_path,
+        dataset,
+        defaults,
+        url_only=url_only,
+        trusted_key_ids=trusted_key_ids,
+        max_workers=max_workers,
+    )
+    lgr.info('serving make jobs on %s', socket_path)
+    try:
+        with server:
+            server.serve_forever()
+    finally:
+        socket_path.unlink(missing_ok=True)
+    yield get_status_dict(
+        action='make',
+        path=str(socket_path),
+        status='ok',
+        message=f'stopped serving make jobs on {socket_path}',
+    )
+
+
+def remove_stale_socket(socket_path: Path) -> None:
+    """Remove `socket_path`, if no server is accepting connections on it"""
+    if not socket_path.exists():
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(str(socket_path))
+        except OSError:
+            lgr.debug('removing stale socket %s', socket_path)
+            socket_path.unlink()
+            return
+    msg = f'a server is already running on {socket_path}'
+    raise RuntimeError(msg)
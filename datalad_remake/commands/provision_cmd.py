@@ -8,7 +8,8 @@ from __future__ import annotations
 
 import logging
 import os
-from contextlib import chdir
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from glob import glob
 from pathlib import Path
 from tempfile import TemporaryDirectory
@@ -29,21 +30,56 @@ from datalad_next.commands import (
 from datalad_next.constraints import (
     AnyOf,
     DatasetParameter,
+    EnsureChoice,
     EnsureDataset,
+    EnsureInt,
     EnsureListOf,
     EnsurePath,
+    EnsureRange,
     EnsureStr,
 )
 from datalad_next.datasets import Dataset
-from datalad_next.runners import call_git_lines, call_git_success
+from datalad_next.runners import (
+    call_git,
+    call_git_lines,
+    call_git_oneline,
+    call_git_success,
+)
 
+from datalad_remake import template_dir
 from datalad_remake.commands.make_cmd import read_list
+from datalad_remake.utils.dirty import get_dirty_elements
+from datalad_remake.utils.glob import (
+    gitlink_mode,
+    iter_tree,
+    match_path,
+    resolve_tree_patterns,
+    split_pattern,
+)
+from datalad_remake.utils.topology import (
+    SubdatasetTopology,
+    get_topology,
+)
+from datalad_remake.utils.trace import (
+    get_trace_file,
+    span,
+    tracing,
+)
 
 if TYPE_CHECKING:
     from collections.abc import Generator, Iterable
 
 lgr = logging.getLogger('datalad.remake.provision_cmd')
 
+# `git worktree add` and `git worktree prune` read the administrative files of
+# all worktrees. They fail if another worktree is created or removed
+# concurrently, so we serialize them within the process.
+worktree_lock = threading.Lock()
+
+# Files that are checked out in sparse worktrees, independent of the input
+# patterns, because git, git-annex, or DataLad read them.
+sparse_required_files = ('.gitattributes', '.gitmodules', '.datalad/config')
+
 
 # decoration auto-generates standard help
 @build_doc
@@ -68,6 +104,8 @@ class Provision(ValidatedInterface):
             'input_list': EnsurePath(),
             'delete': EnsureDataset(installed=True),
             'worktree_dir': AnyOf(EnsurePath(), EnsureStr(min_len=1)),
+            'jobs': EnsureInt() & EnsureRange(min=1),
+            'dirty_check': EnsureChoice('all', 'inputs'),
         }
     )
 
@@ -124,6 +162,33 @@ class Provision(ValidatedInterface):
             doc='Path of the directory that should become the temporary '
             'worktree, defaults to `tempfile.TemporaryDirectory().name`.',
         ),
+        'sparse': Parameter(
+            args=('--sparse',),
+            action='store_true',
+            default=False,
+            doc='Only check out the files that are matched by the input '
+            'patterns, the method templates, and the configuration files of '
+            'git, git-annex, and DataLad. The input patterns are resolved '
+            'against the tree of the provisioned branch before anything is '
+            'checked out, i.e. provisioning time depends on the number of '
+            'inputs instead of the size of the dataset. Other files of the '
+            'dataset are not available in the worktree. Subdatasets are '
+            'checked out completely.',
+        ),
+        'jobs': Parameter(
+            args=('-J', '--jobs'),
+            doc='Number of subdatasets that are installed concurrently, and '
+            'number of concurrent git-annex transfers that retrieve the '
+            'inputs. The required subdatasets are determined before the '
+            'installation, a subdataset is installed after its parent '
+            'dataset. All inputs are retrieved with a single `get`.',
+        ),
+        'dirty_check': Parameter(
+            args=('--dirty-check',),
+            doc='Files of the dataset hierarchy that have to be clean for the '
+            'provisioning to succeed. `all` checks all files, `inputs` only '
+            'checks files that might be matched by the input patterns.',
+        ),
     }
 
     @staticmethod
@@ -136,6 +201,9 @@ class Provision(ValidatedInterface):
         input: list[str] | None = None,  # noqa: A002
         input_list: Path | None = None,
         worktree_dir: str | Path | None = None,
+        sparse: bool = False,
+        jobs: int = 1,
+        dirty_check: str = 'all',
     ):
         ds: Dataset = dataset.ds if dataset else Dataset('.')
         if delete:
@@ -157,15 +225,25 @@ class Provision(ValidatedInterface):
 
         resolved_worktree_dir: Path = Path(worktree_dir or TemporaryDirectory().name)
         inputs = input or [*read_list(input_list)]
-        yield from provide(ds, resolved_worktree_dir, inputs, branch)
+        with tracing(get_trace_file(ds)):
+            yield from provide(
+                ds,
+                resolved_worktree_dir,
+                inputs,
+                branch,
+                sparse=sparse,
+                jobs=jobs,
+                dirty_check=dirty_check,
+            )
 
 
 def remove(dataset: Dataset, worktree: Dataset) -> None:
     worktree.drop(
         what='all', reckless='kill', recursive=True, result_renderer='disabled'
     )
-    prune_worktrees(dataset)
-    call_git_success(['branch', '-d', worktree.pathobj.name], cwd=dataset.pathobj)
+    with worktree_lock:
+        prune_worktrees(dataset)
+        call_git_success(['branch', '-d', worktree.pathobj.name], cwd=dataset.pathobj)
 
 
 def prune_worktrees(dataset: Dataset) -> None:
@@ -177,6 +255,10 @@ def provide(
     worktree_dir: Path,
     input_patterns: list[str],
     source_branch: str | None = None,
+    *,
+    sparse: bool = False,
+    jobs: int = 1,
+    dirty_check: str = 'all',
 ) -> Generator:
     """Provide paths defined by input_patterns in a temporary worktree
 
@@ -190,6 +272,16 @@ def provide(
         List of patterns that describe the input files
     source_branch: str | None
         Branch that should be provisioned, if None HEAD will be used [optional]
+    sparse: bool
+        If True, only the files that are required for `input_patterns` are
+        checked out, see `sparse_checkout` [optional]
+    jobs: int
+        Number of subdatasets that are installed concurrently, and number of
+        concurrent input transfers [optional]
+    dirty_check: str
+        `all` to refuse provisioning if any file of the dataset hierarchy is
+        dirty, `inputs` to only check the files that might be matched by
+        `input_patterns` [optional]
 
     Returns
     -------
@@ -203,14 +295,24 @@ def provide(
     # Create a worktree
     args = (
         ['worktree', 'add']
+        + (['--no-checkout'] if sparse else [])
         + [str(worktree_dir)]
         + ([source_branch] if source_branch else [])
     )
-    call_git_lines(args, cwd=dataset.pathobj)
+    with span('worktree add', worktree=str(worktree_dir)), worktree_lock:
+        call_git_lines(args, cwd=dataset.pathobj)
+
+    if sparse:
+        with span('sparse checkout'):
+            sparse_checkout(worktree_dir, input_patterns)
 
-    is_dirty = False
-    for element in get_dirty_elements(dataset):
-        is_dirty = True
+    with span('dirty check', scope=dirty_check):
+        dirty_elements = list(
+            get_dirty_elements(
+                dataset, input_patterns if dirty_check == 'inputs' else None
+            )
+        )
+    for element in dirty_elements:
         yield get_status_dict(
             action='provision',
             path=element['path'],
@@ -218,15 +320,10 @@ def provide(
             state=element['state'],
             message=f'cannot provision {element["state"]} input: {element["path"]!r} from dataset {dataset}',
         )
-    if is_dirty:
+    if dirty_elements:
         return
 
-    worktree_dataset = Dataset(worktree_dir)
-
-    # Get all input files in the worktree
-    with chdir(worktree_dataset.path):
-        for path in resolve_patterns(dataset, worktree_dataset, input_patterns):
-            worktree_dataset.get(path, result_renderer='disabled')
+    provide_inputs(dataset, Dataset(worktree_dir), input_patterns, jobs=jobs)
 
     yield get_status_dict(
         action='provision',
@@ -236,6 +333,126 @@ def provide(
     )
 
 
+def sparse_checkout(worktree_dir: Path, input_patterns: list[str] | None) -> None:
+    """Check out only the files that are required for `input_patterns`
+
+    The input patterns are matched against the tree of `HEAD` in the worktree,
+    no files have to be checked out for that. The matching files, the method
+    templates, the files in `sparse_required_files`, and all subdataset mount
+    points are checked out, all other files are marked as `skip-worktree` in
+    the index. Checked out files that are no longer required are removed.
+
+    If `input_patterns` is `None`, the complete tree is checked out.
+    """
+    if input_patterns is None:
+        sparse_patterns = ['/*']
+    else:
+        pattern_parts = [split_pattern(pattern) for pattern in input_patterns]
+        sparse_patterns = [
+            '/' + escape_sparse_pattern(path)
+            for mode, _, path in iter_tree(worktree_dir, 'HEAD')
+            if mode == gitlink_mode
+            or is_sparse_required(path)
+            or any(match_path(parts, path.split('/')) for parts in pattern_parts)
+        ]
+
+    sparse_checkout_file = Path(
+        call_git_oneline(
+            [
+                'rev-parse',
+                '--path-format=absolute',
+                '--git-path',
+                'info/sparse-checkout',
+            ],
+            cwd=worktree_dir,
+        )
+    )
+    sparse_checkout_file.parent.mkdir(parents=True, exist_ok=True)
+    sparse_checkout_file.write_text(''.join(f'{p}\n' for p in sparse_patterns))
+
+    # Sparse checkout is only enabled for `read-tree`, which leaves the
+    # repository configuration untouched. The `skip-worktree` bits in the
+    # index of the worktree keep later git commands from checking out the
+    # other files.
+    call_git(
+        ['-c', 'core.sparseCheckout=true', 'read-tree', '-mu', 'HEAD'],
+        cwd=worktree_dir,
+    )
+
+
+def is_sparse_required(path: str) -> bool:
+    return (
+        path in sparse_required_files
+        or path.rsplit('/', 1)[-1] == '.gitattributes'
+        or path.startswith(template_dir + '/')
+    )
+
+
+def escape_sparse_pattern(path: str) -> str:
+    """Escape `path` so that it matches only itself in a sparse-checkout file"""
+    escaped = ''.join('\\' + c if c in '\\*?[' else c for c in path)
+    if escaped.endswith(' '):
+        escaped = escaped[:-1] + '\\ '
+    return escaped
+
+
+def provide_inputs(
+    dataset: Dataset,
+    worktree_dataset: Dataset,
+    input_patterns: list[str],
+    jobs: int = 1,
+) -> None:
+    """Install subdatasets and get all input files in an existing worktree
+
+    The input patterns are resolved against the git trees of the provisioned
+    commit and of the recorded subdataset commits. The required subdatasets
+    are then installed by `install_subdatasets`. If a required
+    subdataset commit is not available in `dataset`, or if a pattern matches
+    no file in the trees, the patterns are globbed in the worktree instead,
+    installing subdatasets while descending.
+    """
+    commit = call_git_oneline(['rev-parse', 'HEAD'], cwd=worktree_dataset.pathobj)
+    with span('resolve inputs'):
+        resolution = resolve_tree_patterns(dataset.pathobj, commit, input_patterns)
+    if resolution is None or has_unmatched_pattern(input_patterns, resolution[0]):
+        lgr.debug('Globbing input patterns in worktree %s', worktree_dataset.path)
+        with span('glob inputs'):
+            paths = resolve_patterns(dataset, worktree_dataset, input_patterns)
+    else:
+        paths, subdatasets = resolution
+        with span('install subdatasets', subdatasets=len(subdatasets)):
+            install_subdatasets(
+                worktree_dataset,
+                subdatasets,
+                get_installed_subdatasets(dataset),
+                jobs,
+            )
+
+    # `get` without paths would retrieve the complete dataset
+    if not paths:
+        return
+
+    # All inputs are retrieved in a single call, which runs one git-annex
+    # process per (sub)dataset. We use absolute paths instead of changing the
+    # working directory of the process, because provisioning might be
+    # performed concurrently.
+    with span('get inputs', files=len(paths)):
+        worktree_dataset.get(
+            [str(worktree_dataset.pathobj / path) for path in sorted(paths)],
+            jobs=jobs,
+            result_renderer='disabled',
+        )
+
+
+def has_unmatched_pattern(patterns: list[str], paths: set[Path]) -> bool:
+    """Check whether any of `patterns` matches none of `paths`"""
+    path_parts = [path.parts for path in paths]
+    return any(
+        not any(match_path(split_pattern(pattern), parts) for parts in path_parts)
+        for pattern in patterns
+    )
+
+
 def resolve_patterns(
     dataset: Dataset, worktree: Dataset, pattern_list: list[str]
 ) -> set[Path]:
@@ -260,6 +477,8 @@ def resolve_patterns(
     set[Path]
         Set of paths that match the patterns.
     """
+    topology = SubdatasetTopology(worktree.pathobj)
+    locally_available_subdatasets = get_installed_subdatasets(dataset)
     matches = set()
     for pattern in pattern_list:
         pattern_parts = pattern.split(os.sep)
@@ -273,27 +492,18 @@ def resolve_patterns(
                 worktree,
                 Path(),
                 pattern_parts,
-                get_uninstalled_subdatasets(worktree),
-                get_installed_subdatasets(dataset),
+                topology,
+                locally_available_subdatasets,
             )
         )
     return matches
 
 
-def get_uninstalled_subdatasets(dataset: Dataset) -> set[Path]:
-    """Get a list of the paths of all visible, non-installed subdatasets"""
-    return {
-        Path(result['path']).relative_to(dataset.pathobj)
-        for result in dataset.subdatasets(recursive=True, result_renderer='disabled')
-        if result['state'] == 'absent'
-    }
-
-
 def glob_pattern(
     root: Dataset,
     position: Path,
     pattern: list[str],
-    uninstalled_subdatasets: set[Path],
+    topology: SubdatasetTopology,
     locally_available_subdatasets: Iterable[tuple[Path, Path, Path]],
 ) -> set[Path]:
     """Glob a pattern in a dataset installing subdatasets if necessary
@@ -308,9 +518,9 @@ def glob_pattern(
     pattern: list[str]
         The path-elements of the pattern. For example `['*', 'a', '*.txt']`
         represents the pattern `'*/a/*.txt'`.
-    uninstalled_subdatasets: set[Path]
-        A set that contains all currently known uninstalled subdatasets. This
-        set will be updated in the method.
+    topology: SubdatasetTopology
+        The subdataset topology of the worktree. Subdatasets that are
+        installed in this method are picked up by the topology.
     locally_available_subdatasets: set[Path]
         A set that contains all datasets that are available in the dataset for
         which the worktree is created.
@@ -330,7 +540,7 @@ def glob_pattern(
             root,
             position,
             pattern[1:],
-            uninstalled_subdatasets,
+            topology,
             locally_available_subdatasets,
         )
     else:
@@ -343,14 +553,15 @@ def glob_pattern(
     ):
         match = position / rec_match
 
-        # If the match is a directory that is in uninstalled subdatasets,
-        # install the dataset and updated uninstalled datasets before proceeding
-        # with matching the pattern.
-        if match.is_dir() and match in uninstalled_subdatasets:
+        # If the match is a directory that is an uninstalled subdataset,
+        # install the dataset before proceeding with matching the pattern.
+        if (
+            (root.pathobj / match).is_dir()
+            and topology.is_subdataset(match)
+            and not topology.is_installed(match)
+        ):
             lgr.info('Installing subdataset %s to glob input', match)
-            install_subdataset(
-                root, match, uninstalled_subdatasets, locally_available_subdatasets
-            )
+            install_subdataset(root, match, locally_available_subdatasets)
 
         # We have a match, try to match the remainder of the pattern.
         submatch_pattern = pattern if pattern[0] == '**' else pattern[1:]
@@ -359,7 +570,7 @@ def glob_pattern(
                 root,
                 match,
                 submatch_pattern,
-                uninstalled_subdatasets,
+                topology,
                 locally_available_subdatasets,
             )
         )
@@ -367,20 +578,59 @@ def glob_pattern(
     return result
 
 
-def get_dirty_elements(dataset: Dataset) -> Generator:
-    """Get all dirty elements in the dataset"""
-    for result in dataset.status(recursive=True):
-        if result['type'] == 'file' and result['state'] != 'clean':
-            yield result
+def install_subdatasets(
+    worktree: Dataset,
+    subdatasets: list[Path],
+    locally_available_datasets: Iterable[tuple[Path, Path, Path]],
+    jobs: int,
+) -> None:
+    """Install subdatasets level by level, up to `jobs` subdatasets at a time
+
+    `subdatasets` lists parent datasets before their subdatasets. All
+    subdatasets of one level, i.e. with the same number of ancestors in
+    `subdatasets`, are installed concurrently, after all datasets of the
+    previous level were installed. Installed subdatasets are skipped.
+    """
+    levels: dict[Path, int] = {}
+    for subdataset in subdatasets:
+        levels[subdataset] = len([p for p in subdataset.parents if p in levels])
+
+    for level in sorted(set(levels.values())):
+        pending = [
+            subdataset
+            for subdataset, subdataset_level in levels.items()
+            if subdataset_level == level
+            and not (worktree.pathobj / subdataset / '.git').exists()
+        ]
+        # Siblings share the `.gitmodules` file of their parent, which must
+        # not be modified concurrently.
+        for subdataset in pending:
+            prefer_local_source(worktree, subdataset, locally_available_datasets)
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = [
+                executor.submit(clone_subdataset, worktree, subdataset)
+                for subdataset in pending
+            ]
+            for future in futures:
+                future.result()
 
 
 def install_subdataset(
     worktree: Dataset,
     subdataset_path: Path,
-    uninstalled_subdatasets: set[Path],
     locally_available_datasets: Iterable[tuple[Path, Path, Path]],
 ) -> None:
     """Install a subdataset, prefer locally available subdatasets"""
+    prefer_local_source(worktree, subdataset_path, locally_available_datasets)
+    clone_subdataset(worktree, subdataset_path)
+
+
+def prefer_local_source(
+    worktree: Dataset,
+    subdataset_path: Path,
+    locally_available_datasets: Iterable[tuple[Path, Path, Path]],
+) -> None:
+    """Install a subdataset from the source dataset, if it is available there"""
     local_subdataset = [
         dataset_info
         for dataset_info in locally_available_datasets
@@ -400,19 +650,20 @@ def install_subdataset(
             absolute_path.as_uri(),
         ]
         call_git_lines(args)
-    worktree.get(str(subdataset_path), get_data=False, result_renderer='disabled')
-    uninstalled_subdatasets.remove(subdataset_path)
-    uninstalled_subdatasets.update(get_uninstalled_subdatasets(worktree))
+
+
+def clone_subdataset(worktree: Dataset, subdataset_path: Path) -> None:
+    worktree.get(
+        str(worktree.pathobj / subdataset_path),
+        get_data=False,
+        result_renderer='disabled',
+    )
 
 
 def get_installed_subdatasets(dataset: Dataset) -> Iterable[tuple[Path, Path, Path]]:
-    results = dataset.subdatasets(recursive=True, result_renderer='disabled')
+    topology = get_topology(dataset.pathobj)
     return [
-        (
-            Path(result['path']),
-            Path(result['parentds']).relative_to(dataset.pathobj),
-            Path(result['path']).relative_to(dataset.pathobj),
-        )
-        for result in results
-        if result['state'] == 'present'
+        (dataset.pathobj / path, parent, path)
+        for path, parent, _ in topology.iter_subdatasets()
+        if topology.is_installed(path)
     ]
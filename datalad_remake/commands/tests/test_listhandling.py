@@ -4,7 +4,10 @@ from pathlib import Path
 from hypothesis import given
 from hypothesis.strategies import lists, text
 
-from datalad_remake.commands.make_cmd import read_list
+from datalad_remake.commands.make_cmd import (
+    expand_values,
+    read_list,
+)
 
 
 def test_empty_list_reading():
@@ -27,6 +30,14 @@ def test_list_reading_strip(tmp_path: Path):
     assert read_list(str(list_file)) == ['a', 'b', 'c']
 
 
+def test_value_expansion():
+    assert expand_values('a') == ['a']
+    assert expand_values('a,b') == ['a', 'b']
+    assert expand_values('1..3,7') == ['1', '2', '3', '7']
+    assert expand_values('08..10') == ['08', '09', '10']
+    assert expand_values('a..b') == ['a..b']
+
+
 def _test_wordlist(
     tmp_path: Path,
     word_list: list[str],
@@ -1,9 +1,25 @@
+import json
+import threading
+import time
+from pathlib import Path
+
+import pytest
 from datalad_next.datasets import Dataset
+from datalad_next.runners import call_git_oneline
 from datalad_next.tests import skip_if_on_windows
 
+from datalad_remake import (
+    template_dir,
+    trace_file_config_key,
+)
+from datalad_remake.commands import make_cmd
 from datalad_remake.commands.tests.create_datasets import (
     create_simple_computation_dataset,
 )
+from datalad_remake.utils.jobsocket import (
+    stop,
+    submit,
+)
 
 test_method = """
 parameters = ['name', 'file']
@@ -46,14 +62,294 @@ def test_speculative_computation(tmp_path, datalad_cfg):
     assert (root_dataset.pathobj / 'spec.txt').read_text() == 'Hello Robert\n'
 
 
-def _run_simple_computation(root_dataset: Dataset):
+def _run_simple_computation(
+    root_dataset: Dataset, name: str = 'Robert', greeting: str = 'Hello'
+):
     root_dataset.make(
         template='test_method',
-        parameter=['name=Robert', 'file=a.txt'],
+        parameter=[f'name={name}', 'file=a.txt'],
         output=['a.txt'],
         result_renderer='disabled',
         allow_untrusted_code=True,
     )
 
     # check that the output is correct
-    assert (root_dataset.pathobj / 'a.txt').read_text() == 'Hello Robert\n'
+    assert (root_dataset.pathobj / 'a.txt').read_text() == f'{greeting} {name}\n'
+
+
+@skip_if_on_windows
+def test_memoized_computation(tmp_path, monkeypatch):
+    root_dataset = create_simple_computation_dataset(tmp_path, 'ds1', 0, test_method)
+
+    _run_simple_computation(root_dataset)
+    _run_simple_computation(root_dataset, name='Alice')
+
+    # The computation for `Robert` is memoized, its result must be re-linked
+    # without executing the template again.
+    def fail(*_, **__):
+        msg = 'memoized computation was executed'
+        raise AssertionError(msg)
+
+    monkeypatch.setattr(make_cmd, 'execute', fail)
+    _run_simple_computation(root_dataset)
+
+
+@skip_if_on_windows
+def test_batch_computation(tmp_path):
+    root_dataset = create_simple_computation_dataset(tmp_path, 'ds1', 0, test_method)
+
+    names = ['Alice', 'Bob', 'Carol']
+    batch_file = tmp_path / 'jobs.jsonl'
+    batch_file.write_text(
+        '\n'.join(
+            [
+                json.dumps(
+                    {
+                        'parameter': [f'name={name}', f'file={name}.txt'],
+                        'output': [f'{name}.txt'],
+                    }
+                )
+                for name in names
+            ]
+            # a job that fails, because the template does not exist
+            + [json.dumps({'template': 'no_method', 'output': ['x.txt']})]
+        )
+    )
+
+    results = root_dataset.make(
+        template='test_method',
+        batch=batch_file,
+        jobs=3,
+        allow_untrusted_code=True,
+        on_failure='ignore',
+        result_renderer='disabled',
+    )
+    assert [r['status'] for r in results].count('error') == 1
+    for name in names:
+        assert (root_dataset.pathobj / f'{name}.txt').read_text() == f'Hello {name}\n'
+
+
+@skip_if_on_windows
+def test_sweep_computation(tmp_path):
+    root_dataset = create_simple_computation_dataset(tmp_path, 'ds1', 0, test_method)
+
+    results = root_dataset.make(
+        template='test_method',
+        parameter=['name=Alice,Bob', 'file={name}.txt'],
+        output=['{name}.txt'],
+        sweep=True,
+        jobs=2,
+        allow_untrusted_code=True,
+        result_renderer='disabled',
+    )
+    assert {Path(r['path']).name for r in results} == {'Alice.txt', 'Bob.txt'}
+    for name in ['Alice', 'Bob']:
+        assert (root_dataset.pathobj / f'{name}.txt').read_text() == f'Hello {name}\n'
+
+
+@skip_if_on_windows
+def test_output_registration(tmp_path):
+    root_dataset = create_simple_computation_dataset(tmp_path, 'ds1', 0, test_method)
+    (root_dataset.pathobj / 'annexed.txt').write_text('annexed\n')
+    root_dataset.save('annexed.txt', result_renderer='disabled')
+    (root_dataset.pathobj / 'in git.txt').write_text('in git\n')
+    root_dataset.save('in git.txt', to_git=True, result_renderer='disabled')
+
+    url_base = make_cmd.get_url_base('0000', '1111')
+    results = list(
+        make_cmd.register_outputs(
+            root_dataset,
+            [
+                ('annexed.txt', url_base),
+                ('in git.txt', url_base),
+                ('new dir/speculative.txt', url_base),
+            ],
+            url_only=True,
+        )
+    )
+    assert {Path(r['path']).name: r['status'] for r in results} == {
+        'annexed.txt': 'ok',
+        'in git.txt': 'ok',
+        'speculative.txt': 'ok',
+    }
+    assert 'not annexed' in results[0]['message']
+
+    whereis = json.loads(
+        call_git_oneline(
+            ['annex', 'whereis', '--json', 'annexed.txt'], cwd=root_dataset.pathobj
+        )
+    )
+    urls = [url for remote in whereis['whereis'] for url in remote['urls']]
+    assert f'{url_base}&this=annexed.txt' in urls
+
+
+@skip_if_on_windows
+def test_tracing(tmp_path):
+    root_dataset = create_simple_computation_dataset(tmp_path, 'ds1', 0, test_method)
+    trace_file = tmp_path / 'trace.json'
+    root_dataset.config.set(trace_file_config_key, str(trace_file), scope='local')
+
+    _run_simple_computation(root_dataset)
+    names = {event['name'] for event in _read_trace(trace_file)}
+    assert {
+        'provision',
+        'worktree add',
+        'dirty check',
+        'execute',
+        'collect',
+        'save',
+        'addurl',
+    } <= names
+
+    # Retrievals by the special remote are recorded in the same file
+    root_dataset.drop('a.txt', reckless='availability', result_renderer='disabled')
+    root_dataset.get('a.txt', result_renderer='disabled')
+    events = _read_trace(trace_file)
+    assert len({event['pid'] for event in events}) == 2
+    assert {'retrieve', 'provision', 'execute', 'collect'} <= {
+        event['name'] for event in events if event['pid'] != events[0]['pid']
+    }
+
+
+def _read_trace(trace_file: Path) -> list[dict]:
+    return json.loads(trace_file.read_text().rstrip().rstrip(',') + ']')
+
+
+@skip_if_on_windows
+def test_serve(tmp_path):
+    root_dataset = create_simple_computation_dataset(tmp_path, 'ds1', 0, test_method)
+    socket_path = tmp_path / 'make.sock'
+
+    server_results: list[dict] = []
+    server = threading.Thread(
+        target=lambda: server_results.extend(
+            root_dataset.make(
+                template='test_method',
+                serve=True,
+                socket=socket_path,
+                allow_untrusted_code=True,
+                result_renderer='disabled',
+            )
+        )
+    )
+    server.start()
+    try:
+        deadline = time.monotonic() + 60
+        while not socket_path.exists():
+            assert time.monotonic() < deadline
+            time.sleep(0.1)
+
+        for name in ['Alice', 'Bob']:
+            results = list(
+                submit(
+                    socket_path,
+                    [
+                        {
+                            'parameter': {'name': name, 'file': f'{name}.txt'},
+                            'output': [f'{name}.txt'],
+                        },
+                        # a job that fails, because the template does not exist
+                        {'template': 'no_method', 'output': ['x.txt']},
+                    ],
+                )
+            )
+            assert [r['status'] for r in results].count('error') == 1
+            assert (root_dataset.pathobj / f'{name}.txt').read_text() == (
+                f'Hello {name}\n'
+            )
+
+        # Invalid requests are reported to the client
+        results = list(submit(socket_path, [{'parameter': {'name': 'Carol'}}]))
+        assert [r['status'] for r in results] == ['error']
+    finally:
+        stop(socket_path)
+        server.join()
+    assert [r['status'] for r in server_results] == ['ok']
+    assert not socket_path.exists()
+
+
+@skip_if_on_windows
+def test_up_to_date_computation(tmp_path, monkeypatch):
+    root_dataset = create_simple_computation_dataset(tmp_path, 'ds1', 0, test_method)
+    _run_simple_computation(root_dataset)
+
+    # The outputs carry the provenance of the computation, it is not
+    # provisioned again.
+    def fail(*_, **__):
+        msg = 'up to date computation was provisioned'
+        raise AssertionError(msg)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(make_cmd, 'provide', fail)
+        results = root_dataset.make(
+            template='test_method',
+            parameter=['name=Robert', 'file=a.txt'],
+            output=['a.txt'],
+            result_renderer='disabled',
+            allow_untrusted_code=True,
+        )
+    assert [r['status'] for r in results] == ['notneeded']
+
+    # git-annex copies the metadata of an edited output to its new key, the
+    # edited output is not up to date.
+    root_dataset.unlock('a.txt', result_renderer='disabled')
+    (root_dataset.pathobj / 'a.txt').write_text('edited\n')
+    root_dataset.save(result_renderer='disabled')
+    _run_simple_computation(root_dataset)
+
+    # A changed template is a different computation
+    template = root_dataset.pathobj / template_dir / 'test_method'
+    template.unlink()
+    template.write_text(test_method.replace('Hello', 'Bye'))
+    root_dataset.save(result_renderer='disabled')
+    _run_simple_computation(root_dataset, greeting='Bye')
+
+
+def test_missing_template(tmp_path):
+    root_dataset = create_simple_computation_dataset(tmp_path, 'ds1', 0, test_method)
+    commit = call_git_oneline(['rev-parse', 'HEAD'], cwd=root_dataset.pathobj)
+
+    # Jobs are validated before their specification is saved
+    with pytest.raises(ValueError, match='job has no template or no output'):
+        root_dataset.make(
+            output=['out.txt'],
+            allow_untrusted_code=True,
+            result_renderer='disabled',
+        )
+    assert call_git_oneline(['rev-parse', 'HEAD'], cwd=root_dataset.pathobj) == commit
+
+
+@skip_if_on_windows
+def test_batch_worktree_lifetime(tmp_path, monkeypatch):
+    root_dataset = create_simple_computation_dataset(tmp_path, 'ds1', 0, test_method)
+
+    # Worktrees are removed as soon as the outputs of their job are collected
+    live_worktrees = set()
+    maximum = []
+    provide, un_provide = make_cmd.provide, make_cmd.un_provide
+
+    def counting_provide(*args, **kwargs):
+        worktree = provide(*args, **kwargs)
+        live_worktrees.add(worktree)
+        maximum.append(len(live_worktrees))
+        return worktree
+
+    def counting_un_provide(dataset, worktree):
+        live_worktrees.discard(worktree)
+        un_provide(dataset, worktree)
+
+    monkeypatch.setattr(make_cmd, 'provide', counting_provide)
+    monkeypatch.setattr(make_cmd, 'un_provide', counting_un_provide)
+    root_dataset.make(
+        template='test_method',
+        parameter=['name=1..4', 'file=out-{name}.txt'],
+        output=['out-{name}.txt'],
+        sweep=True,
+        allow_untrusted_code=True,
+        result_renderer='disabled',
+    )
+    # The next job might be provisioned while the previous job is collected
+    assert len(maximum) == 4
+    assert max(maximum) <= 2
+    assert not live_worktrees
+    assert (root_dataset.pathobj / 'out-4.txt').read_text() == 'Hello 4\n'
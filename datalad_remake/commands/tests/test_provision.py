@@ -9,8 +9,13 @@ from datalad_next.datasets import Dataset
 from datalad_next.runners import call_git_lines
 from datalad_next.tests import skip_if_on_windows
 
+from datalad_remake import template_dir
+
 from ..make_cmd import provide_context
-from .create_datasets import create_ds_hierarchy
+from .create_datasets import (
+    create_ds_hierarchy,
+    create_simple_computation_dataset,
+)
 
 if TYPE_CHECKING:
     from collections.abc import Iterable
@@ -109,6 +114,101 @@ def test_worktree_globbing(tmp_path):
     )
 
 
+@skip_if_on_windows
+def test_dot_prefixed_inputs(tmp_path):
+    dataset = create_ds_hierarchy(tmp_path, 'ds1', 1)[0][2]
+
+    # The subdataset is not installed in the worktree, it has to be installed
+    # to retrieve the input.
+    result = dataset.provision(
+        worktree_dir=tmp_path / 'ds1_worktree',
+        input=['./ds1_subds0/a0.txt', 'ds1_subds0//./b0.txt'],
+        result_renderer='disabled',
+    )[0]
+    worktree = Path(result['path'])
+    assert (worktree / 'ds1_subds0' / 'a0.txt').read_text() == 'a0\n'
+    assert (worktree / 'ds1_subds0' / 'b0.txt').exists()
+    dataset.provision(delete=worktree, result_renderer='disabled')
+
+
+@skip_if_on_windows
+def test_sparse_provision(tmp_path):
+    dataset = create_simple_computation_dataset(tmp_path, 'ds1', 1, 'true')
+    worktree = Path(
+        dataset.provision(
+            worktree_dir=tmp_path / 'ds1_worktree',
+            input=['a*.txt', 'ds1_subds0/a0.txt'],
+            sparse=True,
+            result_renderer='disabled',
+        )[0]['path']
+    )
+
+    # Only inputs, templates, and configuration files of the root dataset are
+    # checked out, subdatasets are checked out completely
+    files = set(get_file_list(worktree))
+    assert {file for file in files if '/' not in file} == {'a.txt'}
+    assert 'ds1_subds0/a0.txt' in files
+    assert (worktree / template_dir / 'test_method').exists()
+    assert (worktree / '.datalad' / 'config').exists()
+    assert not (worktree / 'b.txt').exists()
+
+    # Files that are not checked out are not reported as deleted
+    assert call_git_lines(['ls-files', '--deleted'], cwd=worktree) == []
+    dataset.provision(delete=worktree, result_renderer='disabled')
+
+
+@skip_if_on_windows
+def test_concurrent_subdataset_installation(tmp_path):
+    dataset = Dataset(tmp_path / 'ds1')
+    dataset.create(result_renderer='disabled')
+    for name in ['sub0', 'sub1', 'sub2', 'sub0/subsub']:
+        subdataset = dataset.create(name, result_renderer='disabled')
+        (subdataset.pathobj / 'a.txt').write_text(f'{name}\n')
+        dataset.save(recursive=True, result_renderer='disabled')
+
+    inputs = ['sub*/a.txt', 'sub0/subsub/a.txt']
+    worktree = Path(
+        dataset.provision(
+            worktree_dir=tmp_path / 'ds1_worktree',
+            input=inputs,
+            jobs=3,
+            result_renderer='disabled',
+        )[0]['path']
+    )
+    for name in ['sub0', 'sub1', 'sub2', 'sub0/subsub']:
+        assert (worktree / name / 'a.txt').read_text() == f'{name}\n'
+    dataset.provision(delete=worktree, result_renderer='disabled')
+
+
+@skip_if_on_windows
+def test_batched_input_retrieval(tmp_path, monkeypatch):
+    dataset = create_ds_hierarchy(tmp_path, 'ds1', 2)[0][2]
+
+    retrievals = []
+    original_get = Dataset.get
+
+    def get(self, path=None, **kwargs):
+        if kwargs.get('get_data', True):
+            retrievals.append(path)
+        return original_get(self, path, **kwargs)
+
+    monkeypatch.setattr(Dataset, 'get', get)
+    worktree = Path(
+        dataset.provision(
+            worktree_dir=tmp_path / 'ds1_worktree',
+            input=['*.txt', '**/a*.txt'],
+            jobs=2,
+            result_renderer='disabled',
+        )[0]['path']
+    )
+
+    # All inputs of all subdatasets are retrieved with a single call
+    assert len(retrievals) == 1
+    assert len(retrievals[0]) == 4
+    assert (worktree / 'ds1_subds0' / 'ds1_subds1' / 'a1.txt').exists()
+    dataset.provision(delete=worktree, result_renderer='disabled')
+
+
 def get_file_list(
     root: Path, path: Path | None = None, prefix: Path | None = None
 ) -> Iterable[str]:
@@ -161,6 +261,37 @@ def test_unclean_dataset(tmp_path):
     )
 
 
+@skip_if_on_windows
+def test_input_dirty_check(tmp_path):
+    dataset = create_ds_hierarchy(tmp_path, 'ds1', 1)[0][2]
+    (dataset.pathobj / 'b.txt').unlink()
+    (dataset.pathobj / 'b.txt').write_text('changed content')
+    (dataset.pathobj / 'ds1_subds0' / 'c.txt').write_text('untracked content')
+
+    # Files that cannot be inputs do not prevent provisioning
+    results = dataset.provision(
+        input=['a.txt', 'ds1_subds0/a0.txt'],
+        worktree_dir=tmp_path / 'ds1_worktree1',
+        dirty_check='inputs',
+        result_renderer='disabled',
+    )
+    assert (tmp_path / 'ds1_worktree1' / 'ds1_subds0' / 'a0.txt').exists()
+    dataset.provision(delete=results[0]['path'], result_renderer='disabled')
+
+    # Dirty files that might be inputs prevent provisioning
+    results = dataset.provision(
+        input=['*.txt', 'ds1_subds0/*.txt'],
+        worktree_dir=tmp_path / 'ds1_worktree2',
+        dirty_check='inputs',
+        on_failure='ignore',
+        result_renderer='disabled',
+    )
+    assert {
+        (result['status'], Path(result['path']).name, result['state'])
+        for result in results
+    } == {('error', 'b.txt', 'modified'), ('error', 'c.txt', 'untracked')}
+
+
 @skip_if_on_windows
 def test_branch_deletion_after_provision(tmp_path):
     dataset = create_ds_hierarchy(tmp_path, 'ds1', 3)[0][2]
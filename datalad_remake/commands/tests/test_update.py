@@ -0,0 +1,77 @@
+from pathlib import Path
+
+from datalad_next.runners import call_git_lines
+from datalad_next.tests import skip_if_on_windows
+
+from datalad_remake.commands.tests.create_datasets import (
+    create_simple_computation_dataset,
+)
+
+from ..update_cmd import (
+    is_stale,
+    update_outputs,
+)
+
+copy_method = """
+parameters = ['source', 'destination']
+use_shell = 'true'
+command = ["cat {source} > {destination}"]
+"""
+
+
+def test_is_stale():
+    spec = {'method': 'copy', 'input': ['in/*.txt', 'sub/data/**']}
+    assert is_stale(spec, {Path('in/a.txt')})
+    assert is_stale(spec, {Path('.datalad/make/methods/copy')})
+    # A changed subdataset might contain changed inputs
+    assert is_stale(spec, {Path('sub')})
+    assert not is_stale(spec, {Path('in/a.csv'), Path('out.txt')})
+
+
+@skip_if_on_windows
+def test_update_outputs(tmp_path):
+    dataset = create_simple_computation_dataset(tmp_path, 'ds1', 0, copy_method)
+    for name in ('a', 'b'):
+        (dataset.pathobj / f'{name}.in').write_text(name)
+    dataset.save(result_renderer='disabled')
+    for name in ('a', 'b'):
+        dataset.make(
+            template='test_method',
+            input=[f'{name}.in'],
+            output=[f'{name}.out'],
+            parameter=[f'source={name}.in', f'destination={name}.out'],
+            allow_untrusted_code=True,
+            result_renderer='disabled',
+        )
+
+    (dataset.pathobj / 'a.in').unlink()
+    (dataset.pathobj / 'a.in').write_text('changed')
+    dataset.save(result_renderer='disabled')
+    commits = call_git_lines(['rev-list', 'HEAD'], cwd=dataset.pathobj)
+
+    # Specifications are verified like method templates, the commits of this
+    # dataset are not signed.
+    results = list(update_outputs(dataset, trusted_key_ids=['0123456789ABCDEF']))
+    status = {Path(r['path']).name: r['status'] for r in results}
+    assert status == {'a.out': 'impossible', 'b.out': 'notneeded'}
+    assert (dataset.pathobj / 'a.out').read_text() == 'a'
+
+    results = dataset.update_outputs(
+        allow_untrusted_code=True,
+        jobs=2,
+        result_renderer='disabled',
+    )
+    status = {Path(r['path']).name: r['status'] for r in results}
+    assert status == {'a.out': 'ok', 'b.out': 'notneeded'}
+    assert (dataset.pathobj / 'a.out').read_text() == 'changed'
+    assert (dataset.pathobj / 'b.out').read_text() == 'b'
+    # The specification is unchanged, only the outputs are saved
+    assert len(call_git_lines(['rev-list', 'HEAD'], cwd=dataset.pathobj)) == (
+        len(commits) + 1
+    )
+
+    results = dataset.update_outputs(
+        allow_untrusted_code=True,
+        result_renderer='disabled',
+    )
+    assert {r['status'] for r in results} == {'notneeded'}
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+from datalad_next.runners import call_git_oneline
+from datalad_next.tests import skip_if_on_windows
+
+from datalad_remake import sparse_provision_config_key
+
+from ..worktree_pool import WorktreePool
+from .create_datasets import create_ds_hierarchy
+
+inputs = ['a.txt', 'ds1_subds0/a0.txt']
+
+
+@skip_if_on_windows
+def test_worktree_reuse(tmp_path):
+    dataset = create_ds_hierarchy(tmp_path, 'ds1', 1)[0][2]
+    pool = WorktreePool(dataset, 1)
+
+    first_version = call_git_oneline(['rev-parse', 'HEAD'], cwd=dataset.pathobj)
+    with pool.provide(first_version, inputs) as worktree:
+        assert all((worktree / path).exists() for path in inputs)
+        (worktree / 'output.txt').write_text('output\n')
+        (worktree / 'ds1_subds0' / 'output0.txt').write_text('output\n')
+        first_worktree = worktree
+
+    # Create a new version of the dataset
+    (dataset.pathobj / 'a.txt').unlink()
+    (dataset.pathobj / 'a.txt').write_text('new content\n')
+    dataset.save(result_renderer='disabled')
+    second_version = call_git_oneline(['rev-parse', 'HEAD'], cwd=dataset.pathobj)
+
+    # The slot is reused, reset to the new version, and cleaned
+    with pool.provide(second_version, inputs) as worktree:
+        assert worktree == first_worktree
+        assert (worktree / 'a.txt').read_text() == 'new content\n'
+        assert (worktree / 'ds1_subds0' / 'a0.txt').exists()
+        assert not (worktree / 'output.txt').exists()
+        assert not (worktree / 'ds1_subds0' / 'output0.txt').exists()
+
+        # If no slot is idle, a temporary worktree is provided
+        with pool.provide(first_version, inputs) as temporary_worktree:
+            assert temporary_worktree != worktree
+            assert (temporary_worktree / 'a.txt').read_text() == 'a\n'
+        assert not temporary_worktree.exists()
+
+    # Reducing the pool size removes superfluous slots
+    WorktreePool(dataset, 0)._acquire(first_version)
+    assert not first_worktree.exists()
+
+
+@skip_if_on_windows
+def test_sparse_worktree_reuse(tmp_path):
+    dataset = create_ds_hierarchy(tmp_path, 'ds1', 1)[0][2]
+    dataset.config.set(sparse_provision_config_key, 'true', scope='local')
+    pool = WorktreePool(dataset, 1)
+
+    with pool.provide('HEAD', ['a.txt']) as worktree:
+        assert (worktree / 'a.txt').exists()
+        assert not (worktree / 'b.txt').exists()
+
+    # A reused slot only contains the inputs of the current computation
+    with pool.provide('HEAD', ['b.txt']) as worktree:
+        assert not (worktree / 'a.txt').exists()
+        assert (worktree / 'b.txt').exists()
+
+    # A sparse slot is completed if sparse provisioning is disabled
+    dataset.config.set(sparse_provision_config_key, 'false', scope='local')
+    with WorktreePool(dataset, 1).provide('HEAD', ['b.txt']) as worktree:
+        assert (worktree / 'a.txt').exists()
+        assert (worktree / 'b.txt').exists()
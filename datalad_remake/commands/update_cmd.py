@@ -0,0 +1,338 @@
+"""DataLad update-outputs command
+
+Every output of `datalad make` carries a URL that names the specification of
+its computation and the root version, i.e. the commit of the dataset that the
+computation used. If an input or the method template of a specification
+changed between its root version and `HEAD`, its outputs are stale.
+`datalad update-outputs` finds these specifications and executes them again,
+like the jobs of a `datalad make --batch` file.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+from pathlib import Path
+from typing import (
+    TYPE_CHECKING,
+    Any,
+)
+from urllib.parse import (
+    parse_qs,
+    urlparse,
+)
+
+from datalad_next.commands import (
+    EnsureCommandParameterization,
+    Parameter,
+    ValidatedInterface,
+    build_doc,
+    datasetmethod,
+    eval_results,
+    get_status_dict,
+)
+from datalad_next.constraints import (
+    DatasetParameter,
+    EnsureDataset,
+    EnsureInt,
+    EnsureRange,
+)
+from datalad_next.datasets import Dataset
+from datalad_next.runners import (
+    CommandError,
+    call_git_lines,
+    iter_git_subproc,
+)
+from datasalad.itertools import (
+    decode_bytes,
+    itemize,
+)
+
+from datalad_remake import (
+    specification_dir,
+    template_dir,
+    url_scheme,
+)
+from datalad_remake.commands.make_cmd import run_jobs
+from datalad_remake.utils.getkeys import get_trusted_keys
+from datalad_remake.utils.glob import (
+    match_path,
+    pattern_remainders,
+    split_pattern,
+)
+from datalad_remake.utils.topology import get_topology
+from datalad_remake.utils.trace import (
+    get_trace_file,
+    span,
+    tracing,
+)
+from datalad_remake.utils.verify import verify_file
+
+if TYPE_CHECKING:
+    from collections.abc import Generator
+    from typing import ClassVar
+
+lgr = logging.getLogger('datalad.remake.update_cmd')
+
+
+@build_doc
+class UpdateOutputs(ValidatedInterface):
+    """Recompute outputs whose inputs changed since they were computed
+
+    The computations are found by the URLs that `datalad make` adds to
+    annexed outputs. A computation is executed again if any file that matches
+    one of its input patterns, or its method template, changed between the
+    version of the dataset that it used and the current version. All stale
+    computations are executed like the jobs of `datalad make --batch`, i.e.
+    concurrently, and their outputs are saved in a single commit.
+    """
+
+    _validator_ = EnsureCommandParameterization(
+        {
+            'dataset': EnsureDataset(installed=True),
+            'jobs': EnsureInt() & EnsureRange(min=1),
+        }
+    )
+
+    _params_: ClassVar[dict[str, Parameter]] = {
+        'dataset': Parameter(
+            args=('-d', '--dataset'),
+            doc='Dataset whose outputs should be updated.',
+        ),
+        'allow_untrusted_code': Parameter(
+            args=('--allow-untrusted-code',),
+            action='store_true',
+            default=False,
+            doc='Skip commit signature verification before executing code, '
+            'see `datalad make --allow-untrusted-code`.',
+        ),
+        'jobs': Parameter(
+            args=('-J', '--jobs'),
+            doc='Number of computations that are provisioned and executed '
+            'concurrently, see `datalad make --jobs`.',
+        ),
+    }
+
+    @staticmethod
+    @datasetmethod(name='update_outputs')
+    @eval_results
+    def __call__(
+        dataset: DatasetParameter | None = None,
+        *,
+        allow_untrusted_code: bool = False,
+        jobs: int = 1,
+    ) -> Generator:
+        ds: Dataset = dataset.ds if dataset else Dataset('.')
+        trusted_key_ids = None if allow_untrusted_code else get_trusted_keys()
+        with tracing(get_trace_file(ds)):
+            yield from update_outputs(
+                ds, trusted_key_ids=trusted_key_ids, max_workers=jobs
+            )
+
+
+def update_outputs(
+    dataset: Dataset,
+    *,
+    trusted_key_ids: list[str] | None,
+    max_workers: int = 1,
+) -> Generator:
+    """Execute the computations of stale outputs in `dataset` again"""
+    with span('find computations'):
+        computations = find_computations(dataset)
+
+    changes: dict[str, set[Path] | None] = {}
+    job_list: list[dict[str, Any]] = []
+    scheduled: set[str] = set()
+    for (root_version, spec_name), outputs in computations.items():
+        try:
+            spec = json.loads(
+                (dataset.pathobj / specification_dir / spec_name).read_text()
+            )
+        except (OSError, ValueError) as e:
+            for output in sorted(outputs):
+                yield get_status_dict(
+                    action='update-outputs',
+                    path=str(dataset.pathobj / output),
+                    status='impossible',
+                    message=f'cannot read specification {spec_name!r}: {e}',
+                )
+            continue
+
+        if root_version not in changes:
+            changes[root_version] = get_changed_paths(dataset.pathobj, root_version)
+        changed_paths = changes[root_version]
+        if changed_paths is None:
+            for output in sorted(outputs):
+                yield get_status_dict(
+                    action='update-outputs',
+                    path=str(dataset.pathobj / output),
+                    status='impossible',
+                    message=f'root version {root_version!r} of {output!r} is unknown',
+                )
+            continue
+
+        if is_stale(spec, changed_paths):
+            lgr.debug('update_outputs: %s is stale', spec_name)
+            # Outputs of the same specification can carry URLs of different
+            # root versions, the specification is executed once.
+            if spec_name in scheduled:
+                continue
+            # The parameters of the specification are executed with the
+            # method template, the specification has to be trusted like the
+            # template.
+            if trusted_key_ids is not None:
+                try:
+                    with span('verify', file=spec_name):
+                        verify_file(
+                            dataset.pathobj,
+                            Path(specification_dir) / spec_name,
+                            trusted_key_ids,
+                        )
+                except ValueError as e:
+                    for output in sorted(outputs):
+                        yield get_status_dict(
+                            action='update-outputs',
+                            path=str(dataset.pathobj / output),
+                            status='impossible',
+                            message=f'cannot verify specification {spec_name!r}: {e}',
+                        )
+                    continue
+            scheduled.add(spec_name)
+            job_list.append(
+                {
+                    'template': spec['method'],
+                    'branch': None,
+                    'input': spec['input'],
+                    'output': spec['output'],
+                    'parameter': spec['parameter'],
+                }
+            )
+        else:
+            for output in sorted(outputs):
+                yield get_status_dict(
+                    action='update-outputs',
+                    path=str(dataset.pathobj / output),
+                    status='notneeded',
+                    message=f'inputs of {output!r} did not change',
+                )
+
+    if job_list:
+        yield from run_jobs(
+            dataset,
+            job_list,
+            url_only=False,
+            trusted_key_ids=trusted_key_ids,
+            max_workers=max_workers,
+            raise_errors=False,
+        )
+
+
+def find_computations(dataset: Dataset) -> dict[tuple[str, str], set[str]]:
+    """Find the computations of the annexed outputs in `dataset`
+
+    Returns a mapping from root version and specification name to the paths
+    of the outputs, relative to `dataset`. Subdatasets are searched if they
+    are installed. If an output carries the URLs of multiple computations,
+    e.g. because they created identical content, the computation with the
+    most recent root version is returned.
+    """
+    topology = get_topology(dataset.pathobj)
+    dataset_paths = [
+        Path(),
+        *(
+            path
+            for path, _, _ in topology.iter_subdatasets()
+            if topology.is_installed(path)
+        ),
+    ]
+    candidates: dict[str, list[tuple[str, str]]] = {}
+    for dataset_path in dataset_paths:
+        for file, url in iter_remake_urls(dataset.pathobj / dataset_path):
+            output = (dataset_path / file).as_posix()
+            arguments = parse_qs(urlparse(url).query)
+            # All outputs of a computation with identical content have the
+            # same key, and therefore the URLs of all of them.
+            if arguments.get('this') != [output]:
+                continue
+            candidates.setdefault(output, []).append(
+                (arguments['root_version'][0], arguments['specification'][0])
+            )
+    if not candidates:
+        return {}
+
+    # `rev-list` orders the commits by date, the most recent first. Unknown
+    # commits are omitted and placed at the end.
+    root_versions = {
+        root_version for versions in candidates.values() for root_version, _ in versions
+    }
+    order = {
+        commit: index
+        for index, commit in enumerate(
+            call_git_lines(
+                ['rev-list', '--no-walk', '--ignore-missing', *sorted(root_versions)],
+                cwd=dataset.pathobj,
+            )
+        )
+    }
+    computations: dict[tuple[str, str], set[str]] = {}
+    for output, versions in candidates.items():
+        computation = min(
+            versions, key=lambda version: order.get(version[0], len(order))
+        )
+        computations.setdefault(computation, set()).add(output)
+    return computations
+
+
+def iter_remake_urls(repo_path: Path) -> Generator[tuple[str, str]]:
+    """Yield path and URL of all datalad-remake URLs in the worktree of `repo_path`"""
+    try:
+        with iter_git_subproc(['annex', 'whereis', '--json'], cwd=repo_path) as stdout:
+            for line in decode_bytes(itemize(stdout, sep=b'\n', keep_ends=False)):
+                if not line:
+                    continue
+                record = json.loads(line)
+                for location in record.get('whereis', []):
+                    for url in location.get('urls', []):
+                        if url.startswith(f'{url_scheme}:'):
+                            yield record['file'], url
+    except CommandError as e:
+        # `whereis` fails if any file has no known copy, or if `repo_path` is
+        # not an annex. The URLs of all other files are reported.
+        lgr.debug('iter_remake_urls: %s: %s', repo_path, e)
+
+
+def get_changed_paths(dataset_path: Path, root_version: str) -> set[Path] | None:
+    """Get the paths that changed between `root_version` and `HEAD`
+
+    Changed subdatasets are reported with their path. Returns `None` if
+    `root_version` is not a commit of the dataset.
+    """
+    try:
+        with iter_git_subproc(
+            ['diff', '--name-only', '-z', root_version, 'HEAD', '--'],
+            cwd=dataset_path,
+        ) as stdout:
+            return {
+                Path(path)
+                for path in decode_bytes(itemize(stdout, sep=b'\0', keep_ends=False))
+                if path
+            }
+    except CommandError:
+        return None
+
+
+def is_stale(spec: dict[str, Any], changed_paths: set[Path]) -> bool:
+    """Check whether a change in `changed_paths` affects the computation `spec`
+
+    A changed path affects the computation if it is matched by an input
+    pattern, or if it is a subdataset that an input pattern extends into.
+    """
+    template_path = Path(template_dir) / spec['method']
+    if template_path in changed_paths:
+        return True
+    pattern_parts = [split_pattern(pattern) for pattern in spec['input']]
+    return any(
+        match_path(parts, path.parts) or pattern_remainders(parts, path.parts)
+        for parts in pattern_parts
+        for path in changed_paths
+    )
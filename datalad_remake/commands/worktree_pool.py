@@ -0,0 +1,231 @@
+"""A pool of persistent, reusable worktrees
+
+Provisioning a worktree from scratch requires a `git worktree add`, the
+installation of all required subdatasets, and the retrieval of all input
+files. A pool keeps a bounded number of provisioned worktrees in the state
+directory of the dataset. A pooled worktree is reset to the requested
+version, which only touches files that differ between versions, and content
+that was retrieved earlier is reused.
+
+Every slot of the pool is guarded by an inter-process lock, i.e. a slot is
+used by at most one computation at a time, even if multiple special remote
+processes run concurrently. If no slot is available, a temporary worktree is
+provisioned and removed after use.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from datalad.support.exceptions import IncompleteResultsError
+from datalad_next.datasets import Dataset
+from datalad_next.runners import (
+    CommandError,
+    call_git,
+    call_git_lines,
+    call_git_success,
+)
+from fasteners import InterProcessLock
+
+from datalad_remake.commands.make_cmd import (
+    get_dirty_check,
+    is_sparse_provision,
+    provide,
+    provide_context,
+    un_provide,
+)
+from datalad_remake.commands.provision_cmd import (
+    provide_inputs,
+    sparse_checkout,
+)
+from datalad_remake.utils.dirty import get_dirty_elements
+from datalad_remake.utils.state import get_state_dir
+from datalad_remake.utils.trace import span
+
+if TYPE_CHECKING:
+    from collections.abc import Generator
+
+lgr = logging.getLogger('datalad.remake.commands.worktree_pool')
+
+pool_dir_name = 'worktrees'
+
+# Inter-process locks are held per process, i.e. they do not exclude other
+# threads of the same process. Slots that are in use by this process are
+# therefore also recorded here.
+held_slots: set[Path] = set()
+held_slots_lock = threading.Lock()
+
+
+class WorktreePool:
+    def __init__(self, dataset: Dataset, size: int):
+        self.dataset = dataset
+        self.size = size
+        self.sparse = is_sparse_provision(dataset)
+        self.dirty_check = get_dirty_check(dataset)
+        self.pool_dir = get_state_dir(dataset.pathobj) / pool_dir_name
+
+    @contextlib.contextmanager
+    def provide(
+        self,
+        branch: str,
+        input_patterns: list[str],
+    ) -> Generator[Path]:
+        """Provide a worktree of `branch` that contains all inputs
+
+        The worktree is taken from the pool if a slot is available. Otherwise,
+        a temporary worktree is provisioned.
+        """
+        slot = self._acquire(branch)
+        if slot is None:
+            lgr.debug('no idle slot in worktree pool %s', self.pool_dir)
+            with provide_context(self.dataset, branch, input_patterns) as worktree:
+                yield worktree
+            return
+
+        index, lock = slot
+        try:
+            worktree = self._prepare(index, branch, input_patterns)
+            self._write_meta(index, branch)
+            yield worktree
+        finally:
+            self._unlock(index, lock)
+
+    def _acquire(self, branch: str) -> tuple[int, InterProcessLock] | None:
+        self.pool_dir.mkdir(parents=True, exist_ok=True)
+        with InterProcessLock(str(self.pool_dir / 'pool.lock')):
+            self._shrink()
+            idle = {}
+            for index in range(self.size):
+                lock = self._try_lock(index)
+                if lock is not None:
+                    idle[index] = lock
+            if not idle:
+                return None
+
+            # Prefer a slot that is already at the requested version, then the
+            # least recently used existing slot, then a new slot. Resetting an
+            # existing slot is cheaper than provisioning a new one.
+            def rank(index: int) -> tuple[int, float]:
+                meta = self._read_meta(index)
+                if meta is None:
+                    return 2, 0.0
+                return int(meta['version'] != branch), meta['last_used']
+
+            chosen = min(idle, key=rank)
+            for index, lock in idle.items():
+                if index != chosen:
+                    self._unlock(index, lock)
+            return chosen, idle[chosen]
+
+    def _try_lock(self, index: int) -> InterProcessLock | None:
+        slot_lock_path = self.pool_dir / f'{index}.lock'
+        with held_slots_lock:
+            if slot_lock_path in held_slots:
+                return None
+            lock = InterProcessLock(str(slot_lock_path))
+            if not lock.acquire(blocking=False):
+                return None
+            held_slots.add(slot_lock_path)
+            return lock
+
+    def _unlock(self, index: int, lock: InterProcessLock) -> None:
+        with held_slots_lock:
+            lock.release()
+            held_slots.discard(self.pool_dir / f'{index}.lock')
+
+    def _shrink(self) -> None:
+        # Remove slots that exceed the current pool size, e.g. after the
+        # configured size was reduced.
+        for meta_file in self.pool_dir.glob('*.json'):
+            index = int(meta_file.stem)
+            if index < self.size:
+                continue
+            lock = self._try_lock(index)
+            if lock is not None:
+                try:
+                    self._evict(index)
+                finally:
+                    self._unlock(index, lock)
+
+    def _prepare(self, index: int, branch: str, input_patterns: list[str]) -> Path:
+        worktree = self.pool_dir / str(index)
+        meta = self._read_meta(index)
+        if meta is not None:
+            check_patterns = input_patterns if self.dirty_check == 'inputs' else None
+            if any(get_dirty_elements(self.dataset, check_patterns)):
+                msg = f'cannot provision dirty dataset {self.dataset.path}'
+                raise RuntimeError(msg)
+            try:
+                with span('provision', slot=index, inputs=input_patterns):
+                    reset_worktree(worktree, branch)
+                    # The files that a sparse slot contains depend on the inputs
+                    # of the previous computation.
+                    if self.sparse or meta.get('sparse', False):
+                        sparse_checkout(
+                            worktree, input_patterns if self.sparse else None
+                        )
+                    provide_inputs(self.dataset, Dataset(worktree), input_patterns)
+            except (CommandError, IncompleteResultsError):
+                lgr.warning('Discarding broken worktree pool slot %s', worktree)
+                self._evict(index)
+            else:
+                return worktree
+
+        if worktree.exists():
+            # Leftover of an interrupted provisioning
+            self._evict(index)
+        lgr.debug('provisioning worktree pool slot %s', worktree)
+        return provide(
+            self.dataset,
+            branch,
+            input_patterns,
+            worktree_dir=worktree,
+            sparse=self.sparse,
+        )
+
+    def _evict(self, index: int) -> None:
+        worktree = self.pool_dir / str(index)
+        (self.pool_dir / f'{index}.json').unlink(missing_ok=True)
+        if worktree.exists():
+            un_provide(self.dataset, worktree)
+
+    def _read_meta(self, index: int) -> dict | None:
+        try:
+            return json.loads((self.pool_dir / f'{index}.json').read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write_meta(self, index: int, branch: str) -> None:
+        (self.pool_dir / f'{index}.json').write_text(
+            json.dumps(
+                {'version': branch, 'last_used': time.time(), 'sparse': self.sparse}
+            )
+        )
+
+
+def reset_worktree(worktree: Path, commit: str) -> None:
+    """Reset `worktree` and all installed subdatasets to `commit`
+
+    Untracked and ignored files, e.g. outputs of earlier computations, are
+    removed. Subdatasets that are not installed are left alone, they are
+    installed on demand when inputs are provided.
+    """
+    call_git(['checkout', '--quiet', '--force', '--detach', commit], cwd=worktree)
+    call_git(['clean', '--quiet', '-ffdx'], cwd=worktree)
+    for line in call_git_lines(['ls-files', '--stage'], cwd=worktree):
+        mode_sha_stage, path = line.split('\t', 1)
+        mode, sha, _ = mode_sha_stage.split()
+        subdataset = worktree / path
+        if mode != '160000' or not (subdataset / '.git').exists():
+            continue
+        if not call_git_success(
+            ['cat-file', '-e', f'{sha}^{{commit}}'], cwd=subdataset
+        ):
+            call_git(['fetch', '--quiet', '--all'], cwd=subdataset)
+        reset_worktree(subdataset, sha)
@@ -0,0 +1,86 @@
+"""Batched git-annex operations
+
+Every function in this module starts a single git-annex process in batch
+mode and streams all requests through it. This avoids the process start-up
+cost that dominates when per-file git-annex commands are executed for a
+large number of files.
+"""
+
+from __future__ import annotations
+
+import json
+from typing import TYPE_CHECKING
+
+from datalad_next.runners import iter_git_subproc
+from datasalad.itertools import (
+    decode_bytes,
+    itemize,
+)
+from datasalad.runners import CommandError
+
+if TYPE_CHECKING:
+    from collections.abc import (
+        Generator,
+        Iterable,
+    )
+    from pathlib import Path
+
+
+def iter_annex_batch(
+    repo_path: Path,
+    args: list[str],
+    lines: Iterable[str],
+) -> Generator[str]:
+    """Send `lines` to `git annex <args> --batch` and yield the response lines
+
+    git-annex responds with exactly one line per input line, in input order.
+    """
+    with iter_git_subproc(
+        ['annex', *args, '--batch'],
+        input=(f'{line}\n'.encode() for line in lines),
+        cwd=repo_path,
+    ) as stdout:
+        # Keep line ends, otherwise empty responses would be lost
+        for line in decode_bytes(itemize(stdout, sep=b'\n', keep_ends=True)):
+            yield line.rstrip('\n')
+
+
+def lookup_keys(repo_path: Path, paths: list[Path]) -> dict[Path, str | None]:
+    """Get the annex keys of `paths`, `None` for files that are not annexed"""
+    responses = iter_annex_batch(
+        repo_path, ['lookupkey'], (str(path) for path in paths)
+    )
+    return {
+        path: response or None for path, response in zip(paths, responses, strict=True)
+    }
+
+
+def add_urls(
+    repo_path: Path,
+    urls_and_paths: list[tuple[str, Path]],
+    *,
+    relaxed: bool,
+) -> Generator[dict]:
+    """Register URLs for files in a single `git annex addurl` process
+
+    Yields one git-annex JSON result record per file as soon as git-annex
+    reports it.
+    """
+    arguments = ['addurl', '--with-files', '--json', '--json-error-messages']
+    if relaxed:
+        arguments.append('--relaxed')
+
+    result_count = 0
+    try:
+        for response in iter_annex_batch(
+            repo_path,
+            arguments,
+            (f'{url} {path}' for url, path in urls_and_paths),
+        ):
+            result_count += 1
+            yield json.loads(response)
+    except CommandError:
+        # git-annex exits with a non-zero code if any URL could not be added.
+        # Those failures are already reported in the result records.
+        if result_count < len(urls_and_paths):
+            raise
@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import contextlib
+import subprocess
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+
+class ObjectTypeChecker:
+    """Determine git object types with a persistent `git cat-file` process
+
+    A single `git cat-file --batch-check` process is started for the
+    repository at `repo_path` and used for all lookups, until `close()` is
+    called.
+    """
+
+    def __init__(self, repo_path: Path):
+        self.repo_path = repo_path
+        self.process: subprocess.Popen | None = subprocess.Popen(
+            ['git', 'cat-file', '--batch-check=%(objecttype)'],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            cwd=repo_path,
+        )
+
+    def get_type(self, object_name: str) -> str | None:
+        """Get the type of `object_name`, or `None` if it does not exist"""
+        if self.process is None or '\n' in object_name:
+            return None
+
+        stdin, stdout = self.process.stdin, self.process.stdout
+        if stdin is None or stdout is None:
+            return None
+        try:
+            stdin.write(f'{object_name}\n'.encode())
+            stdin.flush()
+        except BrokenPipeError:
+            self.close()
+            return None
+
+        response = stdout.readline().decode().strip()
+        if not response:
+            # The process terminated, e.g. because `repo_path` is not a
+            # git repository.
+            self.close()
+            return None
+        if ' ' in response:
+            # `<object> missing` or `<object> ambiguous`
+            return None
+        return response
+
+    def close(self) -> None:
+        if self.process is None:
+            return
+        for stream in (self.process.stdin, self.process.stdout):
+            if stream is not None:
+                with contextlib.suppress(BrokenPipeError):
+                    stream.close()
+        self.process.wait()
+        self.process = None
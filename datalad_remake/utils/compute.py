@@ -1,8 +1,9 @@
 from __future__ import annotations
 
-import contextlib
+import hashlib
 import logging
 import subprocess
+import threading
 import tomllib
 from typing import (
     TYPE_CHECKING,
@@ -14,6 +15,10 @@ if TYPE_CHECKING:
 
 lgr = logging.getLogger('datalad.remake')
 
+# Parsed method templates, indexed by the digest of their content
+templates: dict[str, dict[str, Any]] = {}
+templates_lock = threading.Lock()
+
 
 def substitute_string(
     format_str: str,
@@ -60,24 +65,37 @@ def get_substitutions(
     return {param_name: arguments[param_name] for param_name in parameters}
 
 
+def load_template(template_path: Path) -> dict[str, Any]:
+    """Parse the method template at `template_path`
+
+    Templates are read from the worktree of every computation, templates
+    with identical content are only parsed once per process.
+    """
+    content = template_path.read_bytes()
+    digest = hashlib.sha256(content).hexdigest()
+    with templates_lock:
+        if digest not in templates:
+            templates[digest] = tomllib.loads(content.decode())
+        return templates[digest]
+
+
 def compute(
     root_directory: Path,
     template_path: Path,
     compute_arguments: dict[str, str],
 ) -> None:
-    with template_path.open('rb') as f:
-        template = tomllib.load(f)
-
+    template = load_template(template_path)
     substitutions = get_substitutions(template, compute_arguments)
     substitutions['root_directory'] = str(root_directory)
 
     substituted_command = substitute_arguments(template, substitutions, 'command')
 
-    with contextlib.chdir(root_directory):
-        if template.get('use_shell', 'false') == 'true':
-            cmd = ' '.join(substituted_command)
-            lgr.debug(f'compute: RUNNING: with shell=True: {cmd}')
-            subprocess.run(cmd, shell=True, check=True)  # noqa: S602
-        else:
-            lgr.debug(f'compute: RUNNING: {substituted_command}')
-            subprocess.run(substituted_command, check=True)
+    # Use `cwd` instead of changing the working directory of the process,
+    # because computations might be executed concurrently.
+    if template.get('use_shell', 'false') == 'true':
+        cmd = ' '.join(substituted_command)
+        lgr.debug(f'compute: RUNNING: with shell=True: {cmd}')
+        subprocess.run(cmd, shell=True, check=True, cwd=root_directory)  # noqa: S602
+    else:
+        lgr.debug(f'compute: RUNNING: {substituted_command}')
+        subprocess.run(substituted_command, check=True, cwd=root_directory)
@@ -0,0 +1,180 @@
+"""Fast detection of dirty files in a dataset hierarchy
+
+Provisioning refuses to work on a dataset hierarchy that contains modified or
+untracked files. `datalad status --recursive` determines the state of every
+file and subdataset, annotates the results with additional properties, and
+returns only after the complete hierarchy was inspected. Here, a single
+`git status --porcelain=v2` process is streamed per installed dataset, the
+check can stop at the first dirty file, and it can be restricted to the files
+that might be matched by input patterns.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from datalad_next.runners import (
+    call_git_oneline,
+    iter_git_subproc,
+)
+from datasalad.itertools import (
+    decode_bytes,
+    itemize,
+)
+
+from datalad_remake.utils.glob import (
+    pattern_remainders,
+    split_pattern,
+)
+from datalad_remake.utils.topology import get_topology
+
+if TYPE_CHECKING:
+    from collections.abc import Generator
+
+    from datalad_next.datasets import Dataset
+
+# Results of dirty checks, they are reused while a dirty check session is
+# active, e.g. while all jobs of a `make` command are provisioned.
+dirty_check_cache: dict[tuple[Path, str, tuple[str, ...] | None], list[dict]] = {}
+dirty_check_sessions = 0
+dirty_check_lock = threading.Lock()
+
+symlink_mode = '120000'
+
+
+def get_dirty_elements(
+    dataset: Dataset,
+    input_patterns: list[str] | None = None,
+) -> Generator:
+    """Get all dirty files in the dataset hierarchy
+
+    Every installed dataset of the hierarchy is checked with a single
+    `git status`. Files are reported while git reports them, i.e. a caller
+    that only needs to know whether anything is dirty can stop after the
+    first element. If `input_patterns` is given, only files that might be
+    matched by the patterns are checked, and datasets into which no pattern
+    extends are skipped.
+
+    Within a `dirty_check_session`, the results for a dataset commit are
+    computed once and reused.
+    """
+    commit = call_git_oneline(['rev-parse', 'HEAD'], cwd=dataset.pathobj)
+    key = (
+        dataset.pathobj,
+        commit,
+        None if input_patterns is None else tuple(sorted(input_patterns)),
+    )
+    with dirty_check_lock:
+        cached = dirty_check_cache.get(key)
+    if cached is not None:
+        yield from cached
+        return
+
+    elements = []
+    topology = get_topology(dataset.pathobj)
+    subdatasets = [
+        path
+        for path, _, _ in topology.iter_subdatasets()
+        if topology.is_installed(path)
+    ]
+    for dataset_path in [Path(), *subdatasets]:
+        if input_patterns is None:
+            pathspecs = []
+        else:
+            remainders = [
+                remainder
+                for pattern in input_patterns
+                for remainder in pattern_remainders(
+                    split_pattern(pattern), dataset_path.parts
+                )
+            ]
+            if not remainders:
+                continue
+            pathspecs = [
+                ':(glob)' + '/'.join(remainder) if remainder else '.'
+                for remainder in remainders
+            ]
+
+        for state, path in iter_dirty_files(dataset.pathobj / dataset_path, pathspecs):
+            element = {
+                'path': str(dataset.pathobj / dataset_path / path),
+                'state': state,
+                'type': 'file',
+            }
+            elements.append(element)
+            yield element
+
+    with dirty_check_lock:
+        if dirty_check_sessions:
+            dirty_check_cache[key] = elements
+
+
+def iter_dirty_files(
+    repo_path: Path, pathspecs: list[str]
+) -> Generator[tuple[str, str]]:
+    """Yield the state and the path of every dirty file in `repo_path`
+
+    Subdatasets are not checked, untracked directories are ignored. Like in
+    `datalad status`, symlinks, e.g. locked annexed files, are not considered
+    to be files. Paths are relative to `repo_path`.
+    """
+    args = [
+        '--no-optional-locks',
+        '-c',
+        'core.quotepath=off',
+        'status',
+        '--porcelain=v2',
+        '-z',
+        '--no-renames',
+        '--untracked-files=normal',
+        '--ignore-submodules=all',
+        '--',
+        *pathspecs,
+    ]
+    with iter_git_subproc(args, cwd=repo_path) as stdout:
+        for entry in decode_bytes(itemize(stdout, sep=b'\0', keep_ends=False)):
+            if entry.startswith('? '):
+                path = entry[2:]
+                if not path.endswith('/') and not (repo_path / path).is_symlink():
+                    yield 'untracked', path
+                continue
+            if entry.startswith('1 '):
+                # 1 <XY> <sub> <mH> <mI> <mW> <hH> <hI> <path>
+                fields = entry.split(' ', 8)
+                index_mode, worktree_mode = fields[4], fields[5]
+            elif entry.startswith('u '):
+                # u <XY> <sub> <m1> <m2> <m3> <mW> <h1> <h2> <h3> <path>
+                fields = entry.split(' ', 10)
+                index_mode, worktree_mode = fields[5], fields[6]
+            else:
+                continue
+            change, submodule_state, path = fields[1], fields[2], fields[-1]
+            if submodule_state.startswith('S'):
+                continue
+            mode = worktree_mode if worktree_mode != '000000' else index_mode
+            if mode == symlink_mode:
+                continue
+            if 'D' in change:
+                yield 'deleted', path
+            elif 'A' in change:
+                yield 'added', path
+            else:
+                yield 'modified', path
+
+
+@contextlib.contextmanager
+def dirty_check_session() -> Generator[None]:
+    """Reuse the results of dirty checks until the context is left"""
+    global dirty_check_sessions
+    with dirty_check_lock:
+        dirty_check_sessions += 1
+    try:
+        yield
+    finally:
+        with dirty_check_lock:
+            dirty_check_sessions -= 1
+            if not dirty_check_sessions:
+                dirty_check_cache.clear()
@@ -1,12 +1,29 @@
 from __future__ import annotations
 
+import functools
+from fnmatch import fnmatchcase
 from glob import glob
 from itertools import chain
 from pathlib import Path
 from typing import TYPE_CHECKING
 
+from datalad_next.runners import (
+    call_git_success,
+    iter_git_subproc,
+)
+from datasalad.itertools import (
+    decode_bytes,
+    itemize,
+)
+
 if TYPE_CHECKING:
-    from collections.abc import Iterable
+    from collections.abc import (
+        Generator,
+        Iterable,
+        Sequence,
+    )
+
+gitlink_mode = '160000'
 
 
 # Resolve input file patterns in the original dataset
@@ -20,3 +37,204 @@ def resolve_patterns(root_dir: str | Path, patterns: Iterable[str]) -> set[str]:
             ),
         )
     )
+
+
+def iter_tree(repo_path: Path, treeish: str) -> Generator[tuple[str, str, str]]:
+    """Yield mode, object name, and path of all entries in the tree of `treeish`
+
+    The tree is listed recursively, subdatasets are reported as gitlinks, i.e.
+    with mode `160000` and the name of the recorded commit, their content is
+    not listed.
+    """
+    with iter_git_subproc(
+        ['ls-tree', '-r', '-z', '--full-tree', treeish],
+        cwd=repo_path,
+    ) as stdout:
+        for entry in decode_bytes(itemize(stdout, sep=b'\0', keep_ends=False)):
+            mode_type_object, path = entry.split('\t', 1)
+            mode, _, object_name = mode_type_object.split(' ')
+            yield mode, object_name, path
+
+
+@functools.lru_cache(maxsize=8)
+def list_tree(repo_path: Path, commit: str) -> tuple[tuple[str, str, str], ...]:
+    """Get the entries of the tree of `commit`, see `iter_tree`
+
+    `commit` has to be the full name of a commit, the trees of the most
+    recently listed commits are kept in memory.
+    """
+    return tuple(iter_tree(repo_path, commit))
+
+
+def resolve_tree_patterns(
+    dataset_path: Path,
+    commit: str,
+    patterns: Iterable[str],
+) -> tuple[set[Path], list[Path]] | None:
+    """Resolve input patterns against the tree of `commit`
+
+    `commit` has to be the full name of a commit. Patterns are matched like
+    in `match_path`. Patterns that extend into a subdataset are matched
+    against the tree of the commit that is recorded in the gitlink of the
+    subdataset. The trees of subdatasets are read from the subdatasets that
+    are installed in `dataset_path`. Nothing is checked out or installed.
+
+    Returns the matching files and the subdatasets that contain them, parent
+    datasets before their subdatasets. All paths are relative to the root
+    dataset. If a subdataset is required, but its recorded commit is not
+    available in `dataset_path`, `None` is returned.
+    """
+    files: dict[Path, str] = {}
+    subdatasets: list[Path] = []
+    if not _resolve_tree(
+        dataset_path,
+        Path(),
+        commit,
+        [split_pattern(pattern) for pattern in patterns],
+        complete=False,
+        files=files,
+        subdatasets=subdatasets,
+    ):
+        return None
+    return set(files), subdatasets
+
+
+def resolve_tree_objects(
+    dataset_path: Path,
+    commit: str,
+    patterns: Iterable[str],
+) -> dict[Path, str] | None:
+    """Get the git objects of the files that match `patterns` in `commit`
+
+    Patterns are resolved like in `resolve_tree_patterns`, `commit` has to be
+    the full name of a commit. Returns a mapping
+    from the matching files, relative to the root dataset, to the names of
+    their git objects, or `None` if a required subdataset commit is not
+    available.
+    """
+    files: dict[Path, str] = {}
+    if not _resolve_tree(
+        dataset_path,
+        Path(),
+        commit,
+        [split_pattern(pattern) for pattern in patterns],
+        complete=False,
+        files=files,
+        subdatasets=[],
+    ):
+        return None
+    return files
+
+
+def _resolve_tree(
+    dataset_path: Path,
+    position: Path,
+    commit: str,
+    patterns: list[list[str]],
+    *,
+    complete: bool,
+    files: dict[Path, str],
+    subdatasets: list[Path],
+) -> bool:
+    gitlinks = []
+    for mode, object_name, path in list_tree(dataset_path / position, commit):
+        path_parts = path.split('/')
+        if mode == gitlink_mode:
+            remainders = [
+                remainder
+                for pattern in patterns
+                for remainder in pattern_remainders(pattern, path_parts)
+            ]
+            if remainders:
+                gitlinks.append((position / path, object_name, remainders))
+        elif complete or any(match_path(pattern, path_parts) for pattern in patterns):
+            files[position / path] = object_name
+
+    for subdataset, subdataset_commit, remainders in gitlinks:
+        if not _has_commit(dataset_path / subdataset, subdataset_commit):
+            return False
+        subdatasets.append(subdataset)
+        # A pattern that ends at the subdataset matches all of its files, but
+        # not the files of its subdatasets.
+        if not _resolve_tree(
+            dataset_path,
+            subdataset,
+            subdataset_commit,
+            [remainder for remainder in remainders if remainder],
+            complete=[] in remainders,
+            files=files,
+            subdatasets=subdatasets,
+        ):
+            return False
+    return True
+
+
+def _has_commit(repo_path: Path, commit: str) -> bool:
+    return (repo_path / '.git').exists() and call_git_success(
+        ['cat-file', '-e', f'{commit}^{{commit}}'],
+        cwd=repo_path,
+        capture_output=True,
+    )
+
+
+def split_pattern(pattern: str) -> list[str]:
+    """Split a glob pattern into its parts
+
+    Like in `Path`-based globbing, empty parts and `.` parts are ignored,
+    i.e. `./a//b` is split into `['a', 'b']`.
+    """
+    return [part for part in pattern.split('/') if part not in ('', '.')]
+
+
+def match_path(pattern_parts: Sequence[str], path_parts: Sequence[str]) -> bool:
+    """Check whether a path is matched by a glob pattern
+
+    The path is matched if the pattern matches the path itself or one of its
+    leading directories, i.e. if the path would be contained in the result of
+    globbing the pattern in a checked out tree. Like `glob.glob`, wildcards do
+    not match names that start with a `.`, and `**` matches zero or more
+    directories.
+    """
+    if not pattern_parts:
+        return True
+    if not path_parts:
+        return False
+    if pattern_parts[0] == '**':
+        return match_path(pattern_parts[1:], path_parts) or (
+            _match_name('*', path_parts[0])
+            and match_path(pattern_parts, path_parts[1:])
+        )
+    return _match_name(pattern_parts[0], path_parts[0]) and match_path(
+        pattern_parts[1:], path_parts[1:]
+    )
+
+
+def pattern_remainders(
+    pattern_parts: Sequence[str],
+    path_parts: Sequence[str],
+) -> list[list[str]]:
+    """Get the parts of a glob pattern that remain after matching a directory
+
+    Returns every remainder of the pattern that has to be matched in the
+    directory at `path_parts`, i.e. an empty list if the pattern cannot match
+    anything in the directory. An empty remainder means that the pattern
+    matches the directory itself.
+    """
+    if not path_parts:
+        return [list(pattern_parts)]
+    if not pattern_parts:
+        return []
+    if pattern_parts[0] == '**':
+        remainders = pattern_remainders(pattern_parts[1:], path_parts)
+        if _match_name('*', path_parts[0]):
+            remainders.extend(pattern_remainders(pattern_parts, path_parts[1:]))
+        return remainders
+    if not _match_name(pattern_parts[0], path_parts[0]):
+        return []
+    return pattern_remainders(pattern_parts[1:], path_parts[1:])
+
+
+def _match_name(pattern: str, name: str) -> bool:
+    if name.startswith('.') and not pattern.startswith('.'):
+        return False
+    return fnmatchcase(name, pattern)
@@ -0,0 +1,86 @@
+"""Submission of make jobs to a `datalad make --serve` process
+
+`datalad make --serve` keeps the dataset, the trusted keys, and other caches
+in memory, and executes the jobs that are submitted over a Unix domain
+socket. Every connection carries a single request, i.e. one JSON object in
+one line:
+
+- `{"jobs": [<job description>, ...]}` executes the jobs, like the lines of
+  a `--batch` file of `datalad make`. The results are sent back as one JSON
+  object per line, the connection is closed when all jobs are done.
+- `{"stop": true}` stops the server after running requests are done.
+
+This module only depends on the standard library, i.e. submitting a job does
+not import datalad.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import socket
+import sys
+from typing import (
+    TYPE_CHECKING,
+    Any,
+)
+
+if TYPE_CHECKING:
+    from collections.abc import Generator
+    from pathlib import Path
+
+socket_name = 'make.sock'
+
+
+def request(socket_path: str | Path, message: dict[str, Any]) -> Generator[dict]:
+    """Send `message` to the server at `socket_path` and yield the replies"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(str(socket_path))
+        connection.sendall(json.dumps(message).encode() + b'\n')
+        with connection.makefile('rb') as replies:
+            for reply in replies:
+                yield json.loads(reply)
+
+
+def submit(socket_path: str | Path, jobs: list[dict[str, Any]]) -> Generator[dict]:
+    """Execute `jobs` on the server at `socket_path` and yield their results"""
+    yield from request(socket_path, {'jobs': jobs})
+
+
+def stop(socket_path: str | Path) -> None:
+    """Stop the server at `socket_path`"""
+    for _ in request(socket_path, {'stop': True}):
+        pass
+
+
+def main(args: list[str] | None = None) -> int:
+    """cmdline entry point
+
+    Reads job descriptions from stdin, one JSON object per line, and writes
+    the results to stdout, one JSON object per line.
+    """
+    parser = argparse.ArgumentParser(
+        description='Submit make jobs to a `datalad make --serve` process',
+    )
+    parser.add_argument('socket', help='Socket of the `datalad make --serve` process')
+    parser.add_argument(
+        '--stop',
+        action='store_true',
+        help='Stop the server instead of submitting jobs',
+    )
+    arguments = parser.parse_args(args)
+
+    if arguments.stop:
+        stop(arguments.socket)
+        return 0
+
+    jobs = [
+        json.loads(line)
+        for line in sys.stdin
+        if line.strip() and not line.startswith('#')
+    ]
+    failed = False
+    for result in submit(arguments.socket, jobs):
+        failed = failed or result.get('status') in ('error', 'impossible')
+        sys.stdout.write(json.dumps(result) + '\n')
+    return 1 if failed else 0
@@ -0,0 +1,160 @@
+"""Memoization of computations
+
+A computation is identified by a fingerprint over the annex key of the method
+template, the canonicalized specification, and the annex keys of all resolved
+input files. The memo index maps fingerprints to the annex keys of the
+outputs that the computation produced. It is stored in the state directory of
+the dataset, i.e. it is local to the repository and never committed.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from datalad_next.runners import (
+    CommandError,
+    call_git_oneline,
+)
+
+from datalad_remake import template_dir
+from datalad_remake.utils.glob import resolve_patterns
+from datalad_remake.utils.state import get_state_dir
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+lgr = logging.getLogger('datalad.remake.utils.memo')
+
+memo_dir_name = 'memo'
+annex_object_marker = '/annex/objects/'
+
+
+def get_annex_key(path: Path) -> str | None:
+    """Get the annex key of `path`, or `None` if it is not an annexed file
+
+    The key is determined without calling git or git-annex: locked annexed
+    files are symlinks that end in the key, unlocked annexed files without
+    content are pointer files that contain the key.
+    """
+    if path.is_symlink():
+        target = os.readlink(path)
+        if annex_object_marker in target:
+            return Path(target).name
+        return None
+
+    if not path.is_file():
+        return None
+
+    with path.open('rb') as f:
+        head = f.read(len(annex_object_marker))
+        if head == annex_object_marker.encode():
+            return f.readline().decode().strip().split('/')[-1]
+    return None
+
+
+def get_file_key(path: Path) -> str:
+    """Get the annex key of `path`, or the git blob id if it is not annexed"""
+    key = get_annex_key(path)
+    if key is not None:
+        return key
+
+    hasher = hashlib.sha1()
+    hasher.update(f'blob {path.stat().st_size}\0'.encode())
+    with path.open('rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def get_key_location(repo_path: Path, key: str) -> Path | None:
+    """Get the path of the content of `key`, or `None` if it is not present"""
+    try:
+        location = call_git_oneline(
+            ['annex', 'contentlocation', key],
+            cwd=repo_path,
+        )
+    except CommandError:
+        return None
+    return repo_path / location
+
+
+def get_fingerprint(
+    template_key: str,
+    spec: str,
+    input_keys: dict[str, str],
+) -> str:
+    """Get the fingerprint of a computation
+
+    Parameters
+    ----------
+    template_key: str
+        Key of the method template
+    spec: str
+        The JSON-encoded specification, as created by `build_json`
+    input_keys: dict[str, str]
+        Mapping from the path of every resolved input file to its key
+
+    Returns
+    -------
+    str
+        A hex-digest that identifies the computation
+    """
+    canonical = json.dumps(
+        {
+            'template': template_key,
+            'specification': json.loads(spec),
+            'input': input_keys,
+        },
+        sort_keys=True,
+        separators=(',', ':'),
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def get_worktree_fingerprint(
+    worktree: Path,
+    template_name: str,
+    spec: str,
+    input_patterns: Iterable[str],
+) -> str:
+    """Get the fingerprint of a computation in a provisioned worktree"""
+    template_key = get_file_key(worktree / template_dir / template_name)
+    input_keys = {
+        path: get_file_key(worktree / path)
+        for path in resolve_patterns(root_dir=worktree, patterns=input_patterns)
+    }
+    return get_fingerprint(template_key, spec, input_keys)
+
+
+def read_memo(dataset_path: Path, fingerprint: str) -> dict[str, str] | None:
+    """Read the output keys that were memoized for `fingerprint`"""
+    memo_file = get_state_dir(dataset_path) / memo_dir_name / fingerprint
+    try:
+        return json.loads(memo_file.read_text())
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        lgr.warning('Ignoring corrupted memo file %s', memo_file)
+        return None
+
+
+def write_memo(
+    dataset_path: Path,
+    fingerprint: str,
+    output_keys: dict[str, str],
+) -> None:
+    """Memoize the output keys of the computation identified by `fingerprint`"""
+    memo_dir = get_state_dir(dataset_path) / memo_dir_name
+    memo_dir.mkdir(parents=True, exist_ok=True)
+
+    # Write atomically, concurrent readers must never see partial content
+    handle, temp_name = tempfile.mkstemp(dir=memo_dir, prefix=f'.{fingerprint}')
+    with os.fdopen(handle, 'w') as f:
+        f.write(json.dumps(output_keys))
+    Path(temp_name).replace(memo_dir / fingerprint)
@@ -0,0 +1,138 @@
+"""Provenance of computed outputs
+
+When `datalad make` collects the outputs of a computation, it records the
+provenance of the computation in the git-annex metadata of every annexed
+output. The provenance is a digest over the specification, the git object of
+the method template, and the git objects of all resolved input files in the
+version of the dataset that the computation used.
+
+The provenance of a requested computation is determined from the committed
+tree of the dataset, i.e. without provisioning a worktree, see
+`resolve_tree_objects`. If every output of the computation carries this
+provenance, the computation would not change anything.
+
+git-annex metadata is attached to keys, not to files, and git-annex copies
+the metadata of the previous key when a modified file is added, e.g. after
+an output was edited by hand. A provenance is therefore recorded together
+with the key that it was recorded for, i.e. as `<provenance>:<key>`, and
+recorded values of other keys are ignored. Recording a provenance replaces
+all values that a key carried before.
+"""
+
+from __future__ import annotations
+
+import json
+from typing import TYPE_CHECKING
+
+from datalad_next.runners import (
+    CommandError,
+    call_git_oneline,
+)
+
+from datalad_remake import template_dir
+from datalad_remake.utils.annexbatch import iter_annex_batch
+from datalad_remake.utils.glob import resolve_tree_objects
+from datalad_remake.utils.memo import get_fingerprint
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+    from pathlib import Path
+
+provenance_field = 'remake-provenance'
+
+
+def get_provenance(
+    dataset_path: Path,
+    commit: str,
+    template_name: str,
+    spec: str,
+    input_patterns: Iterable[str],
+) -> str | None:
+    """Get the provenance of a computation on `commit` of `dataset_path`
+
+    Returns `None` if the provenance cannot be determined without installing
+    subdatasets, or if the template does not exist.
+    """
+    try:
+        commit = call_git_oneline(
+            ['rev-parse', '--verify', '--quiet', f'{commit}^{{commit}}'],
+            cwd=dataset_path,
+        )
+        template_object = call_git_oneline(
+            [
+                'rev-parse',
+                '--verify',
+                '--quiet',
+                f'{commit}:{template_dir}/{template_name}',
+            ],
+            cwd=dataset_path,
+        )
+    except CommandError:
+        return None
+    input_objects = resolve_tree_objects(dataset_path, commit, input_patterns)
+    if input_objects is None:
+        return None
+    return get_fingerprint(
+        template_object,
+        spec,
+        {str(path): object_name for path, object_name in input_objects.items()},
+    )
+
+
+def read_provenance(repo_path: Path, paths: list[Path]) -> dict[Path, set[str]]:
+    """Get the recorded provenances of `paths` in the repository at `repo_path`
+
+    Files that are not annexed have no provenance. Only provenances that
+    were recorded for the current key of a file are returned.
+    """
+    return {
+        path: provenances
+        for path, (_, provenances) in _read_metadata(repo_path, paths).items()
+    }
+
+
+def record_provenance(repo_path: Path, provenances: dict[Path, str]) -> None:
+    """Set the provenances of the annexed files in the repository at `repo_path`
+
+    Files that are not annexed are ignored.
+    """
+    recorded = _read_metadata(repo_path, list(provenances))
+    requests = [
+        json.dumps(
+            {
+                'file': str(path),
+                'fields': {provenance_field: [f'{provenance}:{recorded[path][0]}']},
+            }
+        )
+        for path, provenance in provenances.items()
+        if recorded[path][0] is not None and recorded[path][1] != {provenance}
+    ]
+    if requests:
+        for _ in iter_annex_batch(repo_path, ['metadata', '--json'], requests):
+            pass
+
+
+def _read_metadata(
+    repo_path: Path,
+    paths: list[Path],
+) -> dict[Path, tuple[str | None, set[str]]]:
+    """Get the keys of `paths` and the provenances recorded for these keys"""
+    metadata: dict[Path, tuple[str | None, set[str]]] = {}
+    responses = iter_annex_batch(
+        repo_path,
+        ['metadata', '--json'],
+        (json.dumps({'file': str(path)}) for path in paths),
+    )
+    for path, response in zip(paths, responses, strict=True):
+        if not response:
+            metadata[path] = (None, set())
+            continue
+        record = json.loads(response)
+        key = record['key']
+        provenances = set()
+        for value in record['fields'].get(provenance_field, []):
+            provenance, _, recorded_key = value.partition(':')
+            if recorded_key == key:
+                provenances.add(provenance)
+        metadata[path] = (key, provenances)
+    return metadata
@@ -0,0 +1,21 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from datalad_next.runners import call_git_oneline
+
+state_dir_name = 'datalad-remake'
+
+
+def get_state_dir(repo_path: Path) -> Path:
+    """Get the directory in which datalad-remake keeps repository local state
+
+    The directory is located in the common git directory of the repository at
+    `repo_path`, i.e. all worktrees of a repository share the same state
+    directory. The directory is not created by this function.
+    """
+    git_dir = call_git_oneline(
+        ['rev-parse', '--path-format=absolute', '--git-common-dir'],
+        cwd=repo_path,
+    )
+    return Path(git_dir) / state_dir_name
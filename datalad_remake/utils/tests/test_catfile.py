@@ -0,0 +1,26 @@
+from datalad_next.runners import call_git_oneline
+
+from datalad_remake.commands.tests.create_datasets import create_ds_hierarchy
+from datalad_remake.utils.catfile import ObjectTypeChecker
+
+
+def test_object_type_checker(tmp_path):
+    dataset = create_ds_hierarchy(tmp_path, 'ds1', 0)[0][2]
+    commit = call_git_oneline(['rev-parse', 'HEAD'], cwd=dataset.pathobj)
+    tree = call_git_oneline(['rev-parse', 'HEAD^{tree}'], cwd=dataset.pathobj)
+
+    checker = ObjectTypeChecker(dataset.pathobj)
+    assert checker.get_type(commit) == 'commit'
+    assert checker.get_type(tree) == 'tree'
+    assert checker.get_type('0' * 40) is None
+    assert checker.get_type(commit) == 'commit'
+    checker.close()
+    assert checker.get_type(commit) is None
+    checker.close()
+
+    # Lookups in directories that are not git repositories fail gracefully
+    no_repo = tmp_path / 'no_repo'
+    no_repo.mkdir()
+    checker = ObjectTypeChecker(no_repo)
+    assert checker.get_type(commit) is None
+    checker.close()
@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+from datalad_next.datasets import Dataset
+
+from ..dirty import (
+    dirty_check_cache,
+    dirty_check_session,
+    get_dirty_elements,
+)
+
+
+def _get_states(dataset: Dataset, input_patterns: list[str] | None = None) -> set:
+    return {
+        (result['path'], result['state'])
+        for result in get_dirty_elements(dataset, input_patterns)
+    }
+
+
+def test_dirty_elements(tmp_path):
+    dataset = Dataset(tmp_path / 'ds1').create(
+        cfg_proc='text2git', result_renderer='disabled'
+    )
+    subdataset = dataset.create('sub', result_renderer='disabled')
+    for name in ('a.txt', 'b.txt', 'sub/c.txt'):
+        (dataset.pathobj / name).write_text(name)
+    dataset.save(recursive=True, result_renderer='disabled')
+    assert _get_states(dataset) == set()
+
+    (dataset.pathobj / 'a.txt').unlink()
+    (dataset.pathobj / 'b.txt').unlink()
+    (dataset.pathobj / 'b.txt').write_text('changed')
+    # Untracked directories are not reported as a whole, like in `datalad status`
+    (dataset.pathobj / 'untracked').mkdir()
+    (dataset.pathobj / 'untracked' / 'd.txt').write_text('d')
+    (subdataset.pathobj / 'e.txt').write_text('e')
+    assert _get_states(dataset) == {
+        (str(dataset.pathobj / 'a.txt'), 'deleted'),
+        (str(dataset.pathobj / 'b.txt'), 'modified'),
+        (str(subdataset.pathobj / 'e.txt'), 'untracked'),
+    }
+
+    # Only files that might be matched by the patterns are checked
+    assert _get_states(dataset, ['b.txt', 'sub/c.txt']) == {
+        (str(dataset.pathobj / 'b.txt'), 'modified'),
+    }
+    assert _get_states(dataset, ['sub']) == {
+        (str(subdataset.pathobj / 'e.txt'), 'untracked'),
+    }
+    assert _get_states(dataset, ['*/*.txt']) == {
+        (str(dataset.pathobj / 'untracked' / 'd.txt'), 'untracked'),
+        (str(subdataset.pathobj / 'e.txt'), 'untracked'),
+    }
+
+
+def test_dirty_check_session(tmp_path):
+    dataset = Dataset(tmp_path / 'ds1').create(result_renderer='disabled')
+    (dataset.pathobj / 'a.txt').write_text('a')
+
+    with dirty_check_session():
+        assert len(_get_states(dataset)) == 1
+        # Results are reused within the session
+        (dataset.pathobj / 'b.txt').write_text('b')
+        assert len(_get_states(dataset)) == 1
+    assert not dirty_check_cache
+    assert len(_get_states(dataset)) == 2
@@ -0,0 +1,105 @@
+from pathlib import Path
+
+from datalad_next.runners import call_git_oneline
+
+from datalad_remake.commands.tests.create_datasets import create_ds_hierarchy
+from datalad_remake.utils.glob import (
+    gitlink_mode,
+    iter_tree,
+    match_path,
+    pattern_remainders,
+    resolve_tree_patterns,
+)
+
+
+def _match(pattern: str, path: str) -> bool:
+    return match_path(pattern.split('/'), path.split('/'))
+
+
+def test_match_path():
+    assert _match('a.txt', 'a.txt')
+    assert not _match('a.txt', 'b.txt')
+    assert _match('*.txt', 'a.txt')
+    assert not _match('*.txt', 'd/a.txt')
+    assert _match('d/*.txt', 'd/a.txt')
+
+    # Directories match with their complete content
+    assert _match('d', 'd/e/a.txt')
+    assert _match('*', 'd/e/a.txt')
+
+    # `**` matches zero or more directories
+    assert _match('**/a.txt', 'a.txt')
+    assert _match('**/a.txt', 'd/e/a.txt')
+    assert _match('d/**/*.txt', 'd/e/f/a.txt')
+    assert not _match('d/**/*.txt', 'e/a.txt')
+
+    # Wildcards do not match hidden names
+    assert not _match('*', '.gitattributes')
+    assert not _match('**/a.txt', '.d/a.txt')
+    assert _match('.*', '.gitattributes')
+    assert _match('.d/a.txt', '.d/a.txt')
+
+
+def test_pattern_remainders():
+    assert pattern_remainders(['d', '*.txt'], ['d']) == [['*.txt']]
+    assert pattern_remainders(['d'], ['d']) == [[]]
+    assert pattern_remainders(['e', '*.txt'], ['d']) == []
+    assert pattern_remainders(['d'], ['d', 'e']) == []
+    assert pattern_remainders(['**', 'e', '*.txt'], ['d', 'e']) == [
+        ['*.txt'],
+        ['**', 'e', '*.txt'],
+    ]
+
+
+def test_iter_tree(tmp_path):
+    dataset = create_ds_hierarchy(tmp_path, 'ds1', 1)[0][2]
+    entries = {path: mode for mode, _, path in iter_tree(dataset.pathobj, 'HEAD')}
+    assert entries['ds1_subds0'] == gitlink_mode
+    assert entries['a.txt'] != gitlink_mode
+    assert '.datalad/config' in entries
+    assert not any(path.startswith('ds1_subds0/') for path in entries)
+
+
+def test_resolve_tree_patterns(tmp_path):
+    dataset = create_ds_hierarchy(tmp_path, 'ds1', 2)[0][2]
+    commit = call_git_oneline(['rev-parse', 'HEAD'], cwd=dataset.pathobj)
+
+    resolution = resolve_tree_patterns(
+        dataset.pathobj, commit, ['a.txt', '*_subds0/*_subds1/b*']
+    )
+    assert resolution is not None
+    files, subdatasets = resolution
+    assert files == {Path('a.txt'), Path('ds1_subds0/ds1_subds1/b1.txt')}
+    assert subdatasets == [Path('ds1_subds0'), Path('ds1_subds0/ds1_subds1')]
+
+    # Patterns are normalized like paths
+    files, _ = resolve_tree_patterns(
+        dataset.pathobj, commit, ['./a.txt', 'ds1_subds0//./a0.txt']
+    )
+    assert files == {Path('a.txt'), Path('ds1_subds0/a0.txt')}
+
+    # A pattern that matches a subdataset matches all of its files
+    files, subdatasets = resolve_tree_patterns(dataset.pathobj, commit, ['*_subds0'])
+    assert {Path('ds1_subds0/a0.txt'), Path('ds1_subds0/.gitmodules')} <= files
+    assert not any(file.parts[1] == 'ds1_subds1' for file in files)
+    assert subdatasets == [Path('ds1_subds0')]
+
+    # `**` descends into all subdatasets
+    files, subdatasets = resolve_tree_patterns(dataset.pathobj, commit, ['**/b*'])
+    assert files == {
+        Path('b.txt'),
+        Path('ds1_subds0/b0.txt'),
+        Path('ds1_subds0/ds1_subds1/b1.txt'),
+    }
+    assert len(subdatasets) == 2
+
+    # Patterns cannot be resolved if a subdataset is not installed
+    dataset.drop(
+        'ds1_subds0/ds1_subds1',
+        what='all',
+        reckless='kill',
+        recursive=True,
+        result_renderer='disabled',
+    )
+    assert resolve_tree_patterns(dataset.pathobj, commit, ['**/b*']) is None
+    assert resolve_tree_patterns(dataset.pathobj, commit, ['*_subds0/a*']) is not None
@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from datalad_next.datasets import Dataset
+
+from datalad_remake import template_dir
+
+from ..provenance import (
+    get_provenance,
+    read_provenance,
+    record_provenance,
+)
+
+
+def test_provenance(tmp_path):
+    dataset = Dataset(tmp_path / 'ds1').create(result_renderer='disabled')
+    (dataset.pathobj / template_dir).mkdir(parents=True)
+    (dataset.pathobj / template_dir / 'method').write_text('template')
+    (dataset.pathobj / 'input.txt').write_text('input')
+    (dataset.pathobj / 'output.txt').write_text('output')
+    dataset.save(result_renderer='disabled')
+
+    provenance = get_provenance(dataset.pathobj, 'HEAD', 'method', '{}', ['in*'])
+    assert provenance is not None
+    assert get_provenance(dataset.pathobj, 'HEAD', 'no_method', '{}', []) is None
+
+    paths = [Path('output.txt'), Path('.datalad/config')]
+    assert read_provenance(dataset.pathobj, paths) == {path: set() for path in paths}
+
+    # Only annexed files carry provenance
+    record_provenance(dataset.pathobj, dict.fromkeys(paths, provenance))
+    record_provenance(dataset.pathobj, {Path('output.txt'): 'other'})
+    assert read_provenance(dataset.pathobj, paths) == {
+        Path('output.txt'): {'other'},
+        Path('.datalad/config'): set(),
+    }
+
+    # Provenances that git-annex copied from the previous key are ignored
+    dataset.unlock('output.txt', result_renderer='disabled')
+    (dataset.pathobj / 'output.txt').write_text('edited')
+    dataset.save(result_renderer='disabled')
+    assert read_provenance(dataset.pathobj, [Path('output.txt')]) == {
+        Path('output.txt'): set()
+    }
+
+    # Changed inputs change the provenance
+    (dataset.pathobj / 'input.txt').unlink()
+    (dataset.pathobj / 'input.txt').write_text('changed')
+    dataset.save(result_renderer='disabled')
+    assert provenance != get_provenance(
+        dataset.pathobj, 'HEAD', 'method', '{}', ['in*']
+    )
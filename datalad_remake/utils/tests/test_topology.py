@@ -0,0 +1,62 @@
+from collections import OrderedDict
+from pathlib import Path
+
+from datalad_next.runners import call_git_oneline
+
+from datalad_remake.commands.tests.create_datasets import create_ds_hierarchy
+from datalad_remake.utils import topology as topology_module
+from datalad_remake.utils.topology import (
+    SubdatasetTopology,
+    get_topology,
+)
+
+
+def test_topology(tmp_path, monkeypatch):
+    dataset = create_ds_hierarchy(tmp_path, 'ds1', 2)[0][2]
+    root = dataset.pathobj
+    subds0 = Path('ds1_subds0')
+    subds1 = subds0 / 'ds1_subds1'
+
+    topology = SubdatasetTopology(root)
+    subdatasets = list(topology.iter_subdatasets())
+    assert [(path, parent) for path, parent, _ in subdatasets] == [
+        (subds0, Path()),
+        (subds1, subds0),
+    ]
+    assert subdatasets[0][2] == call_git_oneline(
+        ['rev-parse', 'HEAD'], cwd=root / subds0
+    )
+
+    assert topology.is_subdataset(subds1)
+    assert not topology.is_subdataset(Path('a.txt'))
+    assert topology.get_file_dataset(Path('a.txt')) == (root, Path('a.txt'))
+    assert topology.get_file_dataset(subds1 / 'new' / 'b1.txt') == (
+        root / subds1,
+        Path('new/b1.txt'),
+    )
+
+    # Files in uninstalled subdatasets belong to the parent dataset
+    dataset.drop(
+        str(subds1),
+        what='all',
+        reckless='kill',
+        recursive=True,
+        result_renderer='disabled',
+    )
+    assert topology.get_file_dataset(subds1 / 'b1.txt') == (
+        root / subds0,
+        Path('ds1_subds1/b1.txt'),
+    )
+    assert not topology.is_installed(subds1)
+    assert topology.is_subdataset(subds1)
+
+    # Topologies are shared per commit
+    assert get_topology(root) is get_topology(root)
+
+    # Only the most recently used topologies are kept
+    monkeypatch.setattr(topology_module, 'topologies', OrderedDict())
+    monkeypatch.setattr(topology_module, 'max_topologies', 1)
+    subds0_topology = get_topology(root / subds0)
+    get_topology(root)
+    assert get_topology(root / subds0) is not subds0_topology
+    assert len(topology_module.topologies) == 1
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+
+from .. import trace
+from ..trace import (
+    span,
+    tracing,
+)
+
+
+def _read_events(trace_file):
+    # The closing bracket of the JSON array is optional in trace files
+    return json.loads(trace_file.read_text().rstrip().rstrip(',') + ']')
+
+
+def test_span_recording(tmp_path):
+    trace_file = tmp_path / 'traces' / 'trace.json'
+
+    with span('untraced'):
+        pass
+    assert not trace_file.exists()
+
+    with tracing(trace_file):
+        with span('outer', value=1), span('inner'):
+            pass
+        # Nested tracing contexts keep the active trace file
+        with tracing(tmp_path / 'other.json'), span('nested'):
+            pass
+    assert trace.trace_file is None
+    assert not (tmp_path / 'other.json').exists()
+
+    with span('untraced'):
+        pass
+
+    events = _read_events(trace_file)
+    assert [event['name'] for event in events] == ['inner', 'outer', 'nested']
+    inner, outer, _ = events
+    assert outer['args'] == {'value': 1}
+    assert outer['ph'] == 'X'
+    assert outer['ts'] <= inner['ts']
+    assert inner['ts'] + inner['dur'] <= outer['ts'] + outer['dur']
+
+
+def test_concurrent_spans(tmp_path):
+    trace_file = tmp_path / 'trace.json'
+
+    def record(index: int) -> None:
+        for _ in range(20):
+            with span('work', index=index):
+                pass
+
+    with tracing(trace_file):
+        threads = [threading.Thread(target=record, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    # Appending to an existing trace file keeps the recorded events
+    with tracing(trace_file), span('later'):
+        pass
+
+    events = _read_events(trace_file)
+    assert len(events) == 81
+
+
+def test_trace_file_without_hard_links(tmp_path, monkeypatch):
+    def fail(*args):
+        raise PermissionError
+
+    monkeypatch.setattr(os, 'link', fail)
+    trace_file = tmp_path / 'trace.json'
+    with tracing(trace_file), span('unlinked'):
+        pass
+
+    assert [event['name'] for event in _read_events(trace_file)] == ['unlinked']
+    assert list(tmp_path.iterdir()) == [trace_file]
@@ -0,0 +1,37 @@
+import os
+
+from datalad_remake.utils.transfer import transfer_file
+
+
+def test_transfer_keeps_source(tmp_path):
+    source = tmp_path / 'source'
+    source.write_text('content')
+
+    strategy = transfer_file(source, tmp_path / 'destination', disposable=False)
+    assert strategy in ('reflink', 'copy')
+    assert source.read_text() == 'content'
+    assert (tmp_path / 'destination').read_text() == 'content'
+
+
+def test_transfer_disposable_source(tmp_path):
+    source = tmp_path / 'source'
+    source.write_text('content')
+
+    strategy = transfer_file(source, tmp_path / 'destination', disposable=True)
+    assert strategy in ('reflink', 'rename')
+    assert (tmp_path / 'destination').read_text() == 'content'
+
+
+def test_transfer_does_not_modify_destination_in_place(tmp_path):
+    # A destination that shares its content with another file, e.g. an
+    # unlocked annexed file that is hard linked to the annex object.
+    annex_object = tmp_path / 'object'
+    annex_object.write_text('old content')
+    destination = tmp_path / 'destination'
+    os.link(annex_object, destination)
+
+    source = tmp_path / 'source'
+    source.write_text('new content')
+    transfer_file(source, destination, disposable=False)
+    assert destination.read_text() == 'new content'
+    assert annex_object.read_text() == 'old content'
@@ -1,9 +1,16 @@
+from collections import OrderedDict
 from pathlib import Path
 
 import pytest
+from datalad_next.runners import (
+    call_git_oneline,
+    call_git_success,
+)
 
 from datalad_remake.annexremotes.tests.test_remake_remote import create_keypair
 from datalad_remake.commands.tests.create_datasets import create_ds_hierarchy
+from datalad_remake.utils import verify
+from datalad_remake.utils.state import get_state_dir
 from datalad_remake.utils.verify import verify_file
 
 
@@ -36,3 +43,87 @@ def test_whitelist(tmp_path, monkeypatch):
     # Expect verification to fail if no key is white-listed.
     with pytest.raises(ValueError, match='No trusted keys provided'):
         verify_file(dataset.pathobj, Path('a.txt'), [])
+
+
+def test_verification_cache(tmp_path, monkeypatch):
+    gpg_dir = tmp_path / 'gpg'
+    monkeypatch.setenv('HOME', str(tmp_path / 'tmp_home'))
+    signing_key = create_keypair(gpg_dir=gpg_dir, name=b'Signing User')
+    monkeypatch.setenv('GNUPGHOME', str(gpg_dir))
+    dataset = create_ds_hierarchy(tmp_path, 'ds1', 0, signing_key)[0][2]
+
+    verify_file(dataset.pathobj, Path('a.txt'), [signing_key])
+    verified_dir = get_state_dir(dataset.pathobj) / 'verified'
+    assert len(list(verified_dir.glob('*/*'))) == 1
+
+    # A cached verification must not require a keyring
+    def fail(*args, **kwargs):
+        msg = 'cached verification was repeated'
+        raise AssertionError(msg)
+
+    monkeypatch.setattr(verify, 'provide_keyring', fail)
+    monkeypatch.setattr(verify, 'history_verifiers', OrderedDict())
+    verify_file(dataset.pathobj, Path('a.txt'), [signing_key])
+
+
+def test_history_verification(tmp_path, monkeypatch):
+    gpg_dir = tmp_path / 'gpg'
+    monkeypatch.setenv('HOME', str(tmp_path / 'tmp_home'))
+    signing_key = create_keypair(gpg_dir=gpg_dir, name=b'Signing User')
+    monkeypatch.setenv('GNUPGHOME', str(gpg_dir))
+    dataset = create_ds_hierarchy(tmp_path, 'ds1', 0, signing_key)[0][2]
+
+    walks = []
+    iter_history = verify.iter_history
+
+    def counting_iter_history(*args):
+        walks.append(args)
+        return iter_history(*args)
+
+    monkeypatch.setattr(verify, 'iter_history', counting_iter_history)
+
+    # Verifying multiple files at the same revision walks the history once
+    verify_file(dataset.pathobj, dataset.pathobj / 'a.txt', [signing_key])
+    verify_file(dataset.pathobj, Path('b.txt'), [signing_key])
+    assert len(walks) == 1
+
+    verifier = verify.get_history_verifier(dataset.pathobj, [signing_key])
+    assert set().union(*verifier.vouched.values()) == {'a.txt', 'b.txt'}
+
+    with pytest.raises(ValueError, match='Signature validation of c.txt failed'):
+        verify_file(dataset.pathobj, Path('c.txt'), [signing_key])
+
+    # Only the most recently used verifiers are kept
+    monkeypatch.setattr(verify, 'history_verifiers', OrderedDict())
+    monkeypatch.setattr(verify, 'max_history_verifiers', 1)
+    verify.get_history_verifier(dataset.pathobj, [signing_key])
+    other_verifier = verify.get_history_verifier(dataset.pathobj, ['0123456789ABCDEF'])
+    assert list(verify.history_verifiers.values()) == [other_verifier]
+
+
+def test_merged_history_verification(tmp_path, monkeypatch):
+    gpg_dir = tmp_path / 'gpg'
+    monkeypatch.setenv('HOME', str(tmp_path / 'tmp_home'))
+    signing_key = create_keypair(gpg_dir=gpg_dir, name=b'Signing User')
+    monkeypatch.setenv('GNUPGHOME', str(gpg_dir))
+    dataset = create_ds_hierarchy(tmp_path, 'ds1', 0, signing_key)[0][2]
+
+    # An unsigned change of `a.txt` on another branch is merged, but its
+    # version of `a.txt` is not. The unsigned change is the most recent change
+    # of `a.txt` in the history, but it does not vouch for `a.txt` in `HEAD`.
+    branch = call_git_oneline(['branch', '--show-current'], cwd=dataset.pathobj)
+    call_git_success(['checkout', '-q', '-b', 'other'], cwd=dataset.pathobj)
+    (dataset.pathobj / 'a.txt').unlink()
+    (dataset.pathobj / 'a.txt').symlink_to('other')
+    call_git_success(
+        ['-c', 'commit.gpgsign=false', 'commit', '-q', '-m', 'other', 'a.txt'],
+        cwd=dataset.pathobj,
+    )
+    call_git_success(['checkout', '-q', branch], cwd=dataset.pathobj)
+    call_git_success(
+        ['merge', '-q', '-s', 'ours', '--no-edit', 'other'], cwd=dataset.pathobj
+    )
+
+    verify_file(dataset.pathobj, Path('a.txt'), [signing_key])
+    with pytest.raises(ValueError, match='Signature validation of a.txt failed'):
+        verify_file(dataset.pathobj, Path('a.txt'), [signing_key], 'other')
@@ -0,0 +1,139 @@
+"""An index of the subdatasets of a dataset hierarchy
+
+Provisioning and output collection have to know which subdatasets exist,
+which of them are installed, and which dataset contains a given file.
+Querying this with `datalad subdatasets` or `git rev-parse --show-toplevel`
+for every pattern, installation, or file starts a subprocess per query, i.e.
+the number of subprocesses grows quadratically with the depth and the size of
+the hierarchy.
+
+A `SubdatasetTopology` reads the gitlinks of every dataset in the hierarchy
+once. The installation state is taken from the file system whenever it is
+queried, and the gitlinks of a subdataset are read as soon as it is found to
+be installed, i.e. the index is updated incrementally while subdatasets are
+installed.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from datalad_next.runners import (
+    call_git_oneline,
+    iter_git_subproc,
+)
+from datasalad.itertools import (
+    decode_bytes,
+    itemize,
+)
+
+from datalad_remake.utils.glob import gitlink_mode
+
+if TYPE_CHECKING:
+    from collections.abc import Generator
+
+
+class SubdatasetTopology:
+    """Index of the subdatasets of the dataset hierarchy at `root`
+
+    All paths are relative to `root`.
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+        self._gitlinks: dict[Path, dict[Path, str]] = {}
+        self._lock = threading.Lock()
+
+    def get_gitlinks(self, dataset: Path) -> dict[Path, str]:
+        """Get the subdatasets of `dataset` and their recorded commits
+
+        The gitlinks of `dataset` are read once, when they are first
+        requested. If `dataset` is not installed, it has no known
+        subdatasets.
+        """
+        with self._lock:
+            if dataset not in self._gitlinks:
+                if not self.is_installed(dataset):
+                    return {}
+                self._gitlinks[dataset] = {
+                    dataset / path: commit
+                    for mode, commit, path in _iter_index(self.root / dataset)
+                    if mode == gitlink_mode
+                }
+            return self._gitlinks[dataset]
+
+    def is_installed(self, dataset: Path) -> bool:
+        return (self.root / dataset / '.git').exists()
+
+    def iter_subdatasets(self) -> Generator[tuple[Path, Path, str]]:
+        """Yield path, parent dataset, and recorded commit of all subdatasets
+
+        Only subdatasets of installed datasets are known. Parent datasets are
+        yielded before their subdatasets.
+        """
+        parents = [Path()]
+        while parents:
+            parent = parents.pop(0)
+            for subdataset, commit in self.get_gitlinks(parent).items():
+                yield subdataset, parent, commit
+                parents.append(subdataset)
+
+    def is_subdataset(self, path: Path) -> bool:
+        """Check whether `path` is a subdataset of an installed dataset"""
+        dataset, _ = self.get_file_dataset(path)
+        return path in self.get_gitlinks(dataset.relative_to(self.root))
+
+    def get_file_dataset(self, file: Path) -> tuple[Path, Path]:
+        """Get the dataset that contains `file` and the path of `file` in it
+
+        `file` is relative to `root`, it does not have to exist. Returns the
+        absolute path of the innermost installed dataset that contains
+        `file` and the path of `file` relative to that dataset.
+        """
+        dataset = Path()
+        found = True
+        while found:
+            found = False
+            gitlinks = self.get_gitlinks(dataset)
+            for parent in file.parents:
+                if parent in gitlinks and self.is_installed(parent):
+                    dataset = parent
+                    found = True
+                    break
+        return self.root / dataset, file.relative_to(dataset)
+
+
+def _iter_index(repo_path: Path) -> Generator[tuple[str, str, str]]:
+    with iter_git_subproc(['ls-files', '--stage', '-z'], cwd=repo_path) as stdout:
+        for entry in decode_bytes(itemize(stdout, sep=b'\0', keep_ends=False)):
+            mode_object_stage, path = entry.split('\t', 1)
+            mode, object_name, _ = mode_object_stage.split(' ')
+            yield mode, object_name, path
+
+
+# Topologies of source datasets, the key is the dataset path and its commit.
+# Long-running processes see many commits, only the most recently used
+# topologies are kept.
+max_topologies = 16
+topologies: OrderedDict[tuple[Path, str], SubdatasetTopology] = OrderedDict()
+topologies_lock = threading.Lock()
+
+
+def get_topology(root: Path) -> SubdatasetTopology:
+    """Get the shared topology of the dataset hierarchy at `root`
+
+    The topology is built once per commit of the dataset at `root`, the
+    `max_topologies` most recently used topologies are kept.
+    """
+    commit = call_git_oneline(['rev-parse', 'HEAD'], cwd=root)
+    with topologies_lock:
+        key = (root, commit)
+        if key not in topologies:
+            topologies[key] = SubdatasetTopology(root)
+            while len(topologies) > max_topologies:
+                topologies.popitem(last=False)
+        topologies.move_to_end(key)
+        return topologies[key]
@@ -0,0 +1,138 @@
+"""Timing spans of the phases of computations
+
+If tracing is enabled, the duration of phases like provisioning, verification,
+execution, and collection is recorded in a trace file. The file uses the JSON
+array format of the Chrome trace event format, i.e. it can be loaded into
+`chrome://tracing` or https://ui.perfetto.dev.
+
+The closing bracket of the JSON array is optional in this format. Every span
+is therefore appended to the trace file as soon as it ends, and multiple
+processes, e.g. `datalad make` and special remote processes that are started
+by git-annex, can record into the same trace file.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import (
+    TYPE_CHECKING,
+    Any,
+)
+
+from datalad_remake import trace_file_config_key
+
+if TYPE_CHECKING:
+    from collections.abc import Generator
+
+    from datalad_next.datasets import Dataset
+
+# The trace file of this process and the number of active tracing contexts
+trace_file: Path | None = None
+tracing_contexts = 0
+trace_lock = threading.Lock()
+
+
+def get_trace_file(dataset: Dataset) -> Path | None:
+    """Get the configured trace file of `dataset`, if tracing is enabled
+
+    Relative paths are interpreted relative to the root of `dataset`.
+    """
+    configured = dataset.config.get(trace_file_config_key, None)
+    if not configured:
+        return None
+    return dataset.pathobj / Path(configured).expanduser()
+
+
+@contextlib.contextmanager
+def tracing(file: Path | None) -> Generator[None]:
+    """Record spans in `file` until the context is left
+
+    If `file` is `None`, or if tracing is already active, e.g. because
+    `datalad make` calls `datalad provision`, the active trace file is kept.
+    """
+    global trace_file, tracing_contexts
+    with trace_lock:
+        if tracing_contexts == 0 and file is not None:
+            _create_trace_file(file)
+            trace_file = file
+        tracing_contexts += 1
+    try:
+        yield
+    finally:
+        with trace_lock:
+            tracing_contexts -= 1
+            if tracing_contexts == 0:
+                trace_file = None
+
+
+@contextlib.contextmanager
+def span(name: str, **args: Any) -> Generator[None]:
+    """Record the duration of the enclosed code as span `name`
+
+    `args` are shown as details of the span, their values have to be JSON
+    serializable. Spans are only recorded if tracing is active.
+    """
+    if trace_file is None:
+        yield
+        return
+
+    start = time.time_ns()
+    try:
+        yield
+    finally:
+        end = time.time_ns()
+        _write_event(
+            {
+                'name': name,
+                'cat': 'remake',
+                'ph': 'X',
+                'ts': start // 1000,
+                'dur': (end - start) // 1000,
+                'pid': os.getpid(),
+                'tid': threading.get_native_id(),
+                'args': args,
+            }
+        )
+
+
+def _create_trace_file(file: Path) -> None:
+    # The file is created with the opening bracket by linking a prepared
+    # file. This is atomic, i.e. no other process can append an event before
+    # the bracket is written.
+    if file.exists():
+        return
+    file.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile('w', dir=file.parent, delete=False) as header:
+        header.write('[\n')
+    try:
+        os.link(header.name, file)
+    except FileExistsError:
+        pass
+    except OSError:
+        # The file system does not support hard links. An exclusive create is
+        # not atomic with the write of the bracket, but still ensures that
+        # only one process writes it.
+        with contextlib.suppress(FileExistsError), file.open('x') as f:
+            f.write('[\n')
+    finally:
+        os.unlink(header.name)
+
+
+def _write_event(event: dict[str, Any]) -> None:
+    file = trace_file
+    if file is None:
+        return
+    # A single `write` to a file that is opened for appending is not
+    # interleaved with writes of other processes.
+    data = (json.dumps(event, default=str) + ',\n').encode()
+    fd = os.open(file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, data)
+    finally:
+        os.close(fd)
@@ -0,0 +1,76 @@
+"""Transfer of computation results out of worktrees
+
+Outputs are transferred with the cheapest available strategy:
+
+1. `reflink`: a copy-on-write clone via the `FICLONE` ioctl, supported by
+   file systems like btrfs and XFS,
+2. `rename`: a rename on the same file system, only if the source is
+   disposable, i.e. if it is not needed after the transfer,
+3. `copy`: a regular copy.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import shutil
+import sys
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+lgr = logging.getLogger('datalad.remake.utils.transfer')
+
+# `FICLONE` is only defined in `fcntl` for Python >= 3.12
+linux_ficlone = 0x40049409
+
+
+def transfer_file(source: Path, destination: Path, *, disposable: bool) -> str:
+    """Transfer the content of `source` to `destination`
+
+    An existing `destination` is replaced, its content is never modified in
+    place, because it might be shared with other files, e.g. by hard links
+    into an annex. If `disposable` is `True`, `source` might be removed by
+    the transfer.
+
+    Returns the name of the strategy that was used.
+    """
+    destination.unlink(missing_ok=True)
+
+    if _reflink(source, destination):
+        strategy = 'reflink'
+    elif disposable and _rename(source, destination):
+        strategy = 'rename'
+    else:
+        shutil.copyfile(source, destination)
+        strategy = 'copy'
+
+    lgr.debug('transfer_file: %s -> %s (%s)', source, destination, strategy)
+    return strategy
+
+
+def _reflink(source: Path, destination: Path) -> bool:
+    if sys.platform != 'linux' or source.is_symlink():
+        return False
+
+    import fcntl
+
+    ficlone = getattr(fcntl, 'FICLONE', linux_ficlone)
+    try:
+        with source.open('rb') as source_file, destination.open('wb') as dest_file:
+            fcntl.ioctl(dest_file.fileno(), ficlone, source_file.fileno())
+    except OSError:
+        destination.unlink(missing_ok=True)
+        return False
+    return True
+
+
+def _rename(source: Path, destination: Path) -> bool:
+    if source.is_symlink():
+        return False
+    try:
+        os.rename(source, destination)
+    except OSError:
+        return False
+    return True
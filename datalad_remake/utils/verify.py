@@ -1,44 +1,305 @@
+from __future__ import annotations
+
 import contextlib
+import hashlib
 import logging
 import os
+import shutil
 import subprocess
 import tempfile
+import threading
+from collections import OrderedDict
 from pathlib import Path
+from typing import TYPE_CHECKING
 
 from datalad_next.runners import (
-    call_git_oneline,
-    call_git_success,
+    CommandError,
+    call_git_lines,
+    iter_git_subproc,
+)
+from datasalad.itertools import (
+    decode_bytes,
+    itemize,
 )
 
+from datalad_remake.utils.state import state_dir_name
+
+if TYPE_CHECKING:
+    from collections.abc import (
+        Generator,
+        Iterator,
+    )
+
 lgr = logging.getLogger('datalad.remake.utils.verify')
 
+keyrings_dir_name = 'keyrings'
+verified_dir_name = 'verified'
+keyring_files = ('pubring.kbx', 'pubring.gpg', 'trustdb.gpg')
+
+# History verifiers of this process, see `get_history_verifier`. Long-running
+# processes verify many commits, only the most recently used verifiers are
+# kept.
+max_history_verifiers = 16
+history_verifiers: OrderedDict[tuple[str, str, tuple[str, ...]], HistoryVerifier] = (
+    OrderedDict()
+)
+history_verifiers_lock = threading.Lock()
+
+
+def verify_file(
+    root_directory: Path,
+    file: Path,
+    trusted_key_ids: list[str],
+    revision: str = 'HEAD',
+):
+    """Verify the signature of the commit that last changed `file`
 
-def verify_file(root_directory: Path, file: Path, trusted_key_ids: list[str]):
+    `file` is either absolute or relative to `root_directory`. The last change
+    is determined in the history of `revision`.
+    """
     if not trusted_key_ids:
         msg = 'No trusted keys provided'
         raise ValueError(msg)
 
-    # Get the latest commit of `file`
-    commit = call_git_oneline(
-        ['-C', str(root_directory), 'log', '-1', '--follow', '--pretty=%H', str(file)]
+    if file.is_absolute():
+        file = file.relative_to(root_directory.absolute())
+    verifier = get_history_verifier(root_directory, trusted_key_ids, revision)
+    verifier.verify_file(file)
+
+
+class HistoryVerifier:
+    """Verify files by the signature of the commits that last changed them
+
+    The history of `revision` is walked at most once, and only as far as
+    needed to find the last change of all requested files. The walk is not
+    simplified, i.e. with merges, the first change that it finds might be a
+    change on another branch. A change is therefore only used if it has the
+    same version of the file as `revision`, otherwise the last change is
+    determined with a path-limited `git log`. Every commit is verified at
+    most once. `vouched` records the files that each verified commit vouches
+    for.
+    """
+
+    def __init__(
+        self,
+        git_dir: Path,
+        state_dir: Path,
+        revision: str,
+        trusted_key_ids: list[str],
+    ):
+        self.git_dir = git_dir
+        self.state_dir = state_dir
+        self.revision = revision
+        self.trusted_key_ids = trusted_key_ids
+        self.vouched: dict[str, set[str]] = {}
+        self._last_commits: dict[str, str] = {}
+        self._checked: dict[str, str | None] = {}
+        self._verdicts: dict[str, bool] = {}
+        self._history: Iterator[tuple[str, list[str]]] | None = None
+        self._lock = threading.Lock()
+
+    def verify_file(self, file: Path) -> None:
+        """Verify `file`, which is relative to the root of the repository"""
+        path = file.as_posix()
+        with self._lock:
+            commit = self._find_last_commit(path)
+            if commit is not None and commit not in self._verdicts:
+                self._verdicts[commit] = verify_commit(
+                    self.git_dir, self.state_dir, commit, self.trusted_key_ids
+                )
+            if commit is None or not self._verdicts[commit]:
+                msg = f'Signature validation of {file} failed'
+                raise ValueError(msg)
+            self.vouched.setdefault(commit, set()).add(path)
+
+    def _find_last_commit(self, path: str) -> str | None:
+        if path not in self._checked:
+            commit = self._walk_history(path)
+            if commit is None or not has_same_blob(
+                self.git_dir, commit, self.revision, path
+            ):
+                commit = get_last_commit(self.git_dir, self.revision, path)
+            self._checked[path] = commit
+        return self._checked[path]
+
+    def _walk_history(self, path: str) -> str | None:
+        if self._history is None:
+            self._history = iter_history(self.git_dir, self.revision)
+        while path not in self._last_commits:
+            try:
+                commit, paths = next(self._history)
+            except StopIteration:
+                return None
+            for changed_path in paths:
+                self._last_commits.setdefault(changed_path, commit)
+        return self._last_commits[path]
+
+
+def iter_history(git_dir: Path, revision: str) -> Generator[tuple[str, list[str]]]:
+    """Yield all commits of `revision` with the paths that they changed"""
+    with iter_git_subproc(
+        [
+            '-c',
+            'core.quotepath=off',
+            'log',
+            '--format=%x00%H',
+            '--name-only',
+            '--no-renames',
+            revision,
+        ],
+        cwd=git_dir,
+    ) as stdout:
+        commit: str | None = None
+        paths: list[str] = []
+        for line in decode_bytes(itemize(stdout, sep=b'\n')):
+            if line.startswith('\0'):
+                if commit is not None:
+                    yield commit, paths
+                commit, paths = line[1:], []
+            elif line:
+                paths.append(line)
+        if commit is not None:
+            yield commit, paths
+
+
+def has_same_blob(git_dir: Path, commit: str, revision: str, path: str) -> bool:
+    """Check whether `path` has the same content in `commit` and `revision`"""
+    try:
+        blob, revision_blob = call_git_lines(
+            ['rev-parse', f'{commit}:{path}', f'{revision}:{path}'],
+            cwd=git_dir,
+        )
+    except CommandError:
+        # `path` does not exist in `commit` or in `revision`
+        return False
+    return blob == revision_blob
+
+
+def get_last_commit(git_dir: Path, revision: str, path: str) -> str | None:
+    """Get the last commit that changed `path` in the history of `revision`"""
+    commits = call_git_lines(
+        ['log', '-1', '--format=%H', revision, '--', path],
+        cwd=git_dir,
     )
+    return commits[0] if commits else None
 
-    with tempfile.TemporaryDirectory() as temp_gpg_dir:
-        # Create a temporary PGP keyring that contains the trusted keys
-        _copy_keys_to(trusted_key_ids, temp_gpg_dir)
 
-        # Let git do the verification of the commit with the trusted keys
-        with _gpg_dir(temp_gpg_dir):
-            result = call_git_success(
-                ['-C', str(root_directory), 'verify-commit', commit]
+def get_history_verifier(
+    root_directory: Path,
+    trusted_key_ids: list[str],
+    revision: str = 'HEAD',
+) -> HistoryVerifier:
+    """Get the history verifier for `revision` of `root_directory`
+
+    Verifiers are shared by all worktrees of a repository and by all
+    verifications of the same commit with the same trusted keys. The
+    `max_history_verifiers` most recently used verifiers are kept.
+    """
+    common_dir, commit = call_git_lines(
+        [
+            'rev-parse',
+            '--path-format=absolute',
+            '--git-common-dir',
+            f'{revision}^{{commit}}',
+        ],
+        cwd=root_directory,
+    )
+    registry_key = (common_dir, commit, tuple(sorted(set(trusted_key_ids))))
+    with history_verifiers_lock:
+        if registry_key not in history_verifiers:
+            # Git commands are executed in the common git directory, because
+            # worktrees, e.g. provisioned worktrees, might be removed while
+            # the verifier is still in use.
+            history_verifiers[registry_key] = HistoryVerifier(
+                Path(common_dir),
+                Path(common_dir) / state_dir_name,
+                commit,
+                trusted_key_ids,
             )
+            while len(history_verifiers) > max_history_verifiers:
+                history_verifiers.popitem(last=False)
+        history_verifiers.move_to_end(registry_key)
+        return history_verifiers[registry_key]
+
+
+def verify_commit(
+    git_dir: Path,
+    state_dir: Path,
+    commit: str,
+    trusted_key_ids: list[str],
+) -> bool:
+    """Verify the signature of `commit` with the trusted keys"""
+    # Successful verifications are recorded per commit and set of trusted
+    # keys. A change of the trusted keys leads to a new keyring id, i.e. to
+    # a new verification.
+    verdict_file = state_dir / verified_dir_name / get_keyring_id(trusted_key_ids)
+    verdict_file = verdict_file / commit
+    if verdict_file.exists():
+        lgr.debug('Using cached verification of %s', commit)
+        return True
+
+    # Let git do the verification of the commit with the trusted keys
+    with provide_keyring(state_dir, trusted_key_ids) as keyring_dir:
+        result = subprocess.run(
+            ['git', '-C', str(git_dir), 'verify-commit', commit],
+            env=dict(os.environ, GNUPGHOME=str(keyring_dir)),
+            check=False,
+        )
+    if result.returncode != 0:
+        return False
+
+    verdict_file.parent.mkdir(parents=True, exist_ok=True)
+    verdict_file.touch()
+    return True
+
 
-        if not result:
-            msg = f'Signature validation of {file} failed'
-            raise ValueError(msg)
+def get_keyring_id(trusted_key_ids: list[str]) -> str:
+    """Get an identifier for the set of `trusted_key_ids`"""
+    hasher = hashlib.sha256()
+    hasher.update('\n'.join(sorted(set(trusted_key_ids))).encode())
+    # The id is part of the GnuPG home directory path, keep it short
+    return hasher.hexdigest()[:16]
 
 
-def _copy_keys_to(trusted_key_ids: list[str], keyring_dir: str) -> None:
+@contextlib.contextmanager
+def provide_keyring(state_dir: Path, trusted_key_ids: list[str]) -> Generator[Path]:
+    """Provide a PGP keyring that contains the trusted keys
+
+    The keyring is created once per set of trusted keys and reused by all
+    later verifications. If not all trusted keys are available, a temporary
+    keyring is provided, which is removed after use.
+    """
+    keyring_dir = state_dir / keyrings_dir_name / get_keyring_id(trusted_key_ids)
+    if keyring_dir.exists():
+        yield keyring_dir
+        return
+
+    with tempfile.TemporaryDirectory() as temp_gpg_dir:
+        # Create the keyring in a temporary directory. GnuPG limits the length
+        # of socket paths in its home directory, therefore the keyring is not
+        # created in the state directory.
+        if not _copy_keys_to(trusted_key_ids, temp_gpg_dir):
+            yield Path(temp_gpg_dir)
+            return
+
+        # Copy the keyring into place, such that concurrent processes never
+        # use a partially copied keyring.
+        keyring_dir.parent.mkdir(parents=True, exist_ok=True)
+        staging_dir = Path(tempfile.mkdtemp(dir=keyring_dir.parent, prefix='.'))
+        for name in keyring_files:
+            if (Path(temp_gpg_dir) / name).exists():
+                shutil.copy2(Path(temp_gpg_dir) / name, staging_dir / name)
+        try:
+            staging_dir.rename(keyring_dir)
+        except OSError:
+            # Another process created the keyring in the meantime
+            shutil.rmtree(staging_dir, ignore_errors=True)
+    yield keyring_dir
+
+
+def _copy_keys_to(trusted_key_ids: list[str], keyring_dir: str) -> bool:
+    """Copy trusted keys to `keyring_dir`, return `True` if all keys were found"""
+    all_found = True
     for key_id in trusted_key_ids:
         # Export the requested key into `result.stdout`
         result = subprocess.run(
@@ -47,8 +308,9 @@ def _copy_keys_to(trusted_key_ids: list[str], keyring_dir: str) -> None:
             check=False,
         )
 
-        if result.returncode != 0:
+        if result.returncode != 0 or not result.stdout:
             lgr.warning(f'Could not locate trusted key with id: {key_id}')
+            all_found = False
             continue
 
         # Import key from `result.stdout` into a keyring in `keyring_dir`
@@ -57,16 +319,4 @@ def _copy_keys_to(trusted_key_ids: list[str], keyring_dir: str) -> None:
             input=result.stdout,
             check=True,
         )
-
-
-@contextlib.contextmanager
-def _gpg_dir(directory: str):
-    _original_value = os.environ.get('GNUPGHOME')
-    try:
-        os.environ['GNUPGHOME'] = directory
-        yield
-    finally:
-        if _original_value is None:
-            del os.environ['GNUPGHOME']
-        else:
-            os.environ['GNUPGHOME'] = _original_value
+    return all_found
@@ -1,3 +1,8 @@
-from .annexremote import Master
+from .annexremote import (
+    Master,
+    Protocol,
+    SpecialRemote,
+    UnsupportedRequest,
+)
 
-__all__ = ['Master']
+__all__ = ['Master', 'Protocol', 'SpecialRemote', 'UnsupportedRequest']
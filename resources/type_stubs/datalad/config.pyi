@@ -0,0 +1,3 @@
+from typing import Any
+
+def anything2bool(val: Any) -> bool: ...
@@ -0,0 +1,3 @@
+from argparse import ArgumentParser
+
+def setup_parser(remote_name: str, description: str) -> ArgumentParser: ...
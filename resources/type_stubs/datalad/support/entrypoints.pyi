@@ -0,0 +1 @@
+def load_extensions() -> None: ...
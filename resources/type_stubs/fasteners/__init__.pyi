@@ -0,0 +1,3 @@
+from .process_lock import InterProcessLock
+
+__all__ = ['InterProcessLock']
@@ -0,0 +1,19 @@
+from types import TracebackType
+
+class InterProcessLock:
+    def __init__(self, path: str) -> None: ...
+    def acquire(
+        self,
+        blocking: bool = ...,
+        delay: float = ...,
+        max_delay: float = ...,
+        timeout: float | None = ...,
+    ) -> bool: ...
+    def release(self) -> None: ...
+    def __enter__(self) -> InterProcessLock: ...
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None: ...